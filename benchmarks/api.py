@@ -0,0 +1,270 @@
+"""
+API benchmark suite.
+
+Seeds synthetic tenants in a local MongoDB, drives the real FastAPI app in process
+through ASGI across the key endpoints and writes a JSON report to benchmarks/results/
+that can be compared with the report of another commit.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.api --workers 10000
+    python -m benchmarks.api --skip-seed --compare benchmarks/results/<previous>.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+# pylint: disable=wrong-import-position
+from main import app
+from db.client import db_client
+from models.websocket import WebsocketResponse
+from services.websocket import manager
+from middlewares.timing import request_db_commands
+from utils.auth import create_access_token
+from benchmarks.asgi import request
+from benchmarks.seed import seed_tenant, person_name
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results")
+PERIODS = [("1", "2024"), ("2", "2024")]
+TYPES = ["shift", "rest", "event"]
+
+def git_sha() -> str:
+    """Commit of the working tree, with a suffix when it has local changes."""
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain"], text=True).strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def rss_mb() -> float:
+    """Peak resident memory of the process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(samples: list, fraction: float) -> float:
+    """Percentile of sorted samples."""
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 2)
+
+def scenarios(tenant: dict, rng: random.Random, import_size: int) -> list:
+    """Requests of each scenario as (name, method, route, request builder)."""
+    months = [month for month, _ in PERIODS]
+    years = sorted({year for _, year in PERIODS})
+
+    def workers_import():
+        return {"workers": [{
+            "name": person_name(rng), "identification": str(20000000 + rng.randrange(10**6)),
+            "city": "Bogotá", "phone": "3000000000", "address": "Calle 1", "fields": [],
+            "tags": ["all"]} for _ in range(import_size)]}
+
+    def customers_import():
+        return {"customers": [{
+            "name": f"Import {rng.randrange(10**6)} S.A.S.",
+            "identification": str(800000000 + rng.randrange(10**6)), "city": "Cali",
+            "contact": person_name(rng), "phone": "6010000000", "address": "Carrera 7",
+            "fields": [], "tags": ["all"], "branches": ["Main"]} for _ in range(import_size)]}
+
+    return [
+        ("shifts_by_months", "POST", "/shifts/getByMonthsAndYears", lambda: (
+            "/shifts/getByMonthsAndYears",
+            {"months": [rng.choice(months)], "years": years, "types": TYPES})),
+        ("stalls_by_customer", "POST", "/stalls/getByCustomer", lambda: (
+            "/stalls/getByCustomer",
+            {"months": months, "years": years, "types": TYPES,
+             "customerId": rng.choice(tenant["customers"])})),
+        ("stalls_calendar", "POST", "/stalls/calendar", lambda: (
+            "/stalls/calendar",
+            {"months": months, "years": years, "types": TYPES,
+             "customerId": rng.choice(tenant["customers"])})),
+        ("workers_search_path", "GET", "/workers/{search}/{limit}/{skip}", lambda: (
+            f"/workers/{rng.choice(tenant['workers']).split()[0]}/20/0", None)),
+        ("workers_search", "GET", "/workers/search", lambda: (
+            f"/workers/search?q={rng.choice(tenant['workers']).split()[2]}&limit=20", None)),
+        ("customers_list", "GET", "/customers/", lambda: ("/customers/", None)),
+        ("profile", "GET", "/users/profile", lambda: ("/users/profile", None)),
+        ("workers_import", "POST", "/workers/createAndUpdate", lambda: (
+            "/workers/createAndUpdate", workers_import())),
+        ("customers_import", "POST", "/customers/createAndUpdate", lambda: (
+            "/customers/createAndUpdate", customers_import())),
+    ]
+
+async def run_scenario(
+    method: str,
+    build,
+    headers: list,
+    count: int,
+    concurrency: int) -> dict:
+    """Send requests with some concurrency and collect latencies."""
+    samples = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(count):
+        queue.put_nowait(build())
+
+    async def client():
+        nonlocal errors
+        while not queue.empty():
+            path, body = queue.get_nowait()
+            payload = json.dumps(body).encode() if body is not None else b""
+            start = time.perf_counter()
+            status, _, _ = await request(app, method, path, payload, headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 1),
+        "p50": round(statistics.median(samples), 2),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "max": round(samples[-1], 2),
+    }
+
+class FakeWebSocket():
+    """Websocket connection that drops the messages."""
+    async def accept(self) -> None:
+        """Accept the connection."""
+
+    async def send_json(self, data: dict) -> None:
+        """Serialize the message as the real connection would."""
+        json.dumps(data)
+
+async def run_broadcast(company: str, connections: int, count: int) -> dict:
+    """Broadcast latency with many connections of a company open."""
+    sockets = [FakeWebSocket() for _ in range(connections)]
+    for websocket in sockets:
+        await manager.connect(websocket, company)
+    message = WebsocketResponse(
+        event="shifts_updated", data={"shifts": list(range(50))},
+        userName="bench", company=company)
+    samples = []
+    start = time.perf_counter()
+    for _ in range(count):
+        begin = time.perf_counter()
+        await manager.broadcast(message)
+        samples.append((time.perf_counter() - begin) * 1000)
+    elapsed = time.perf_counter() - start
+    for websocket in sockets:
+        await manager.disconnect(websocket)
+    samples.sort()
+    return {
+        "requests": count, "errors": 0, "connections": connections,
+        "rps": round(count / elapsed, 1), "p50": round(statistics.median(samples), 2),
+        "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99),
+        "max": round(samples[-1], 2),
+    }
+
+def db_commands(method: str, route: str) -> tuple:
+    """Total MongoDB commands and requests recorded for a route."""
+    series = request_db_commands.values.get((method, route))
+    return (series["sum"], series["count"]) if series else (0, 0)
+
+def compare(report: dict, path: str) -> None:
+    """Print the change of each scenario against a previous report."""
+    with open(path, encoding="utf-8") as file:
+        previous = json.load(file)
+    print(f"\nagainst {previous['commit']} ({path})")
+    for name, stats in report["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if not old:
+            continue
+        print(f"{name:22} rps {old['rps']:>9} -> {stats['rps']:>9} "
+              f"({(stats['rps'] / old['rps'] - 1) * 100:+.1f}%)  "
+              f"p95 {old['p95']:>8} -> {stats['p95']:>8}ms")
+
+def main() -> None:
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=10000)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--stalls", type=int, default=4, help="stalls per customer and month")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--import-size", type=int, default=500)
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--only", nargs="*", help="scenarios to run")
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--compare", help="previous report to compare with")
+    args = parser.parse_args()
+
+    tenants = []
+    started = time.perf_counter()
+    for index in range(args.tenants):
+        if args.skip_seed:
+            tenant = db_client["harmony"].companies.find_one({"db": f"bench_tenant_{index}"})
+            tenant_db = db_client[tenant["db"]]
+            tenants.append({
+                "company": str(tenant["_id"]), "email": f"admin@tenant{index}.bench",
+                "customers": [str(customer["_id"]) for customer in tenant_db.customers.find(
+                    {}, {"_id": 1}).limit(1000)],
+                "workers": [worker["name"] for worker in tenant_db.workers.find(
+                    {}, {"name": 1}).limit(200)],
+                "counts": {}})
+        else:
+            tenants.append(seed_tenant(
+                db_client, index, args.workers, args.customers, args.stalls, PERIODS))
+    seed_seconds = round(time.perf_counter() - started, 1)
+    print(f"tenants ready in {seed_seconds}s: {[tenant['counts'] for tenant in tenants]}")
+
+    rng = random.Random(42)
+    tenant = tenants[0]
+    token = create_access_token(data={"sub": tenant["email"], "roles": ["admin"]})
+    headers = [("authorization", f"Bearer {token}"), ("content-type", "application/json")]
+    results = {}
+    for name, method, route, build in scenarios(tenant, rng, args.import_size):
+        if args.only and name not in args.only:
+            continue
+        count = max(1, args.requests // 20) if name.endswith("_import") else args.requests
+        commands_before, requests_before = db_commands(method, route)
+        stats = asyncio.run(run_scenario(method, build, headers, count, args.concurrency))
+        commands_after, requests_after = db_commands(method, route)
+        handled = requests_after - requests_before
+        stats["dbCommands"] = round((commands_after - commands_before) / handled, 1) \
+            if handled else None
+        stats["rssMb"] = rss_mb()
+        results[name] = stats
+        print(f"{name:22} {stats}")
+    if not args.only or "websocket_broadcast" in args.only:
+        stats = asyncio.run(run_broadcast(tenant["company"], args.connections, args.requests))
+        stats["rssMb"] = rss_mb()
+        results["websocket_broadcast"] = stats
+        print(f"{'websocket_broadcast':22} {stats}")
+
+    report = {
+        "commit": git_sha(),
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "compare"},
+        "data": [tenant["counts"] for tenant in tenants],
+        "seedSeconds": None if args.skip_seed else seed_seconds,
+        "scenarios": results,
+    }
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(
+        RESULTS, f"{report['timestamp'].replace(':', '')}-{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"report written to {path}")
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
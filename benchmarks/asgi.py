@@ -0,0 +1,51 @@
+"""Minimal in-process ASGI client used by the benchmarks."""
+
+from typing import List, Tuple
+
+async def request(
+    app,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: List[Tuple[str, str]] = None) -> Tuple[int, dict, bytes]:
+    """
+    Call an ASGI app directly, without sockets or an HTTP client.
+    Returns:
+        Tuple[int, dict, bytes]: Status, headers and body of the response.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers or []],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    response = {"status": None, "headers": {}, "body": []}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                key.decode(): value.decode() for key, value in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"])
@@ -0,0 +1,92 @@
+"""
+Response compression benchmark.
+
+Builds month shift lists like the ones served by /shifts/getByMonthsAndYears and
+reports bytes on the wire and CPU per request for each encoding and level, first for
+the codecs alone and then through the compression middleware.
+
+    python -m benchmarks.compression --shifts 20000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from middlewares.compression import CompressionMiddleware, ENCODINGS, compress
+from benchmarks.asgi import request
+from benchmarks.seed import STEPS, person_name
+
+LEVELS = {"gzip": [1, 4, 6, 9], "br": [1, 3, 4, 6, 9], "zstd": [1, 3, 6, 12]}
+
+def shifts_payload(count: int) -> list:
+    """Synthetic shifts as serialized by shift_entity."""
+    rng = random.Random(3)
+    workers = [(f"{index:024x}", person_name(rng)) for index in range(count // 30 + 1)]
+    payload = []
+    for index in range(count):
+        worker_id, worker_name = workers[index // 30]
+        step = STEPS[index % len(STEPS)]
+        payload.append({
+            "id": f"{index:024x}", "day": str(index % 30 + 1), **step,
+            "abbreviation": "", "description": "", "sequence": "4x4", "position": "Guard",
+            "type": "shift", "active": True, "keep": False, "worker": worker_id,
+            "workerName": worker_name, "stall": f"{index // 90:024x}",
+            "stallName": f"Stall {index // 90}", "customer": f"{index // 360:024x}",
+            "customerName": f"Customer {index // 360} S.A.S.", "month": "1", "year": "2024",
+            "createdBy": "bench", "updatedBy": "bench", "version": index})
+    return payload
+
+def cpu_ms(run, repeat: int) -> float:
+    """CPU milliseconds per call."""
+    start = time.process_time()
+    for _ in range(repeat):
+        run()
+    return (time.process_time() - start) / repeat * 1000
+
+async def through_middleware(body: list, repeat: int) -> None:
+    """Bytes and CPU per request through the middleware for every accepted encoding."""
+    app = FastAPI()
+
+    @app.get("/shifts")
+    async def get_shifts():
+        return JSONResponse(content=body)
+
+    @app.get("/customers")
+    async def get_customers():
+        return JSONResponse(content=body, headers={"ETag": '"bench-1"'})
+
+    app.add_middleware(CompressionMiddleware)
+    for path in ["/shifts", "/customers"]:
+        for encoding in ["identity"] + ENCODINGS:
+            headers = [("accept-encoding", encoding)]
+            start = time.process_time()
+            for _ in range(repeat):
+                _, response_headers, content = await request(app, "GET", path, headers=headers)
+            per_request = (time.process_time() - start) / repeat * 1000
+            print(f"{path:11} {encoding:9} {len(content):>10} bytes {per_request:8.2f} ms cpu "
+                  f"({response_headers.get('content-encoding', 'identity')})")
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shifts", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    payload = shifts_payload(args.shifts)
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    print(f"identity            {len(raw):>10} bytes")
+    for encoding in ENCODINGS:
+        for level in LEVELS[encoding]:
+            size = len(compress(encoding, raw, level))
+            cost = cpu_ms(lambda encoding=encoding, level=level: compress(encoding, raw, level),
+                          args.repeat)
+            print(f"{encoding:5} level {level:<3}     {size:>10} bytes "
+                  f"{size / len(raw) * 100:5.1f}% {cost:8.2f} ms cpu")
+    print()
+    asyncio.run(through_middleware(payload, args.repeat))
+
+if __name__ == "__main__":
+    main()
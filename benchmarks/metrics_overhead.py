@@ -0,0 +1,74 @@
+"""
+Metrics overhead benchmark.
+
+Measures requests/sec of a route with and without the timing middleware, the cost of
+one MongoDB command listener callback and the time to render the registry.
+
+    python -m benchmarks.metrics_overhead --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from fastapi import FastAPI
+from db.monitoring import CommandMetrics, request_commands
+from middlewares.timing import TimingMiddleware
+from utils.metrics import registry
+from benchmarks.asgi import request
+
+def build(instrumented: bool) -> FastAPI:
+    """App with a JSON route issuing a few simulated MongoDB commands."""
+    app = FastAPI()
+    listener = CommandMetrics()
+    event = SimpleNamespace(command_name="find", duration_micros=250)
+
+    @app.get("/workers/{worker_id}")
+    async def get_worker(worker_id: str):
+        if instrumented:
+            for _ in range(3):
+                listener.succeeded(event)
+        return {"id": worker_id, "name": "Worker"}
+
+    if instrumented:
+        app.add_middleware(TimingMiddleware)
+    return app
+
+async def throughput(app: FastAPI, count: int) -> float:
+    """Requests per second of a route."""
+    for _ in range(100):
+        await request(app, "GET", "/workers/1")
+    start = time.perf_counter()
+    for index in range(count):
+        await request(app, "GET", f"/workers/{index}")
+    return count / (time.perf_counter() - start)
+
+def listener_cost(count: int) -> float:
+    """Microseconds per listener callback inside a request."""
+    listener = CommandMetrics()
+    event = SimpleNamespace(command_name="find", duration_micros=250)
+    token = request_commands.set({"count": 0, "seconds": 0.0})
+    start = time.perf_counter()
+    for _ in range(count):
+        listener.succeeded(event)
+    elapsed = time.perf_counter() - start
+    request_commands.reset(token)
+    return elapsed / count * 1000000
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    plain = asyncio.run(throughput(build(False), args.requests))
+    instrumented = asyncio.run(throughput(build(True), args.requests))
+    print(f"plain        {plain:10.0f} req/s")
+    slower = (1 - instrumented / plain) * 100
+    print(f"instrumented {instrumented:10.0f} req/s ({slower:.1f}% slower)")
+    print(f"listener     {listener_cost(100000):10.2f} us/command")
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"render       {(time.perf_counter() - start) * 1000:10.2f} ms ({len(text)} bytes)")
+
+if __name__ == "__main__":
+    main()
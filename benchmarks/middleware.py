@@ -0,0 +1,76 @@
+"""
+Middleware stack benchmark.
+
+Drives a small FastAPI app directly through ASGI and compares requests/sec with the
+previous `BaseHTTPMiddleware` error handler against the pure ASGI error and timing
+middlewares, for a JSON route and a streaming route.
+
+    python -m benchmarks.middleware --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from middlewares.error_handler import ErrorHandler
+from middlewares.timing import TimingMiddleware
+from benchmarks.asgi import request
+
+class BaseErrorHandler(BaseHTTPMiddleware):
+    """The error handler as it was before the pure ASGI rewrite."""
+    async def dispatch(self, request: Request, call_next) -> Response:
+        try:
+            return await call_next(request)
+        except Exception as exception:
+            print(exception)
+            return Response("Internal server error", status_code=500)
+
+def build(middlewares: list) -> FastAPI:
+    """App with a JSON route and a streaming route."""
+    app = FastAPI()
+    payload = [{"id": index, "name": f"Worker {index}"} for index in range(50)]
+
+    @app.get("/json")
+    async def json_route():
+        return payload
+
+    @app.get("/stream")
+    async def stream_route():
+        async def chunks():
+            for index in range(20):
+                yield f"chunk {index}\n".encode()
+        return StreamingResponse(chunks())
+
+    for middleware in middlewares:
+        app.add_middleware(middleware)
+    return app
+
+async def throughput(app: FastAPI, path: str, count: int) -> float:
+    """Requests per second of a route."""
+    for _ in range(100):
+        await request(app, "GET", path)
+    start = time.perf_counter()
+    for _ in range(count):
+        status, _, _ = await request(app, "GET", path)
+        assert status == 200
+    return count / (time.perf_counter() - start)
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    stacks = {
+        "none": [],
+        "base_http": [BaseErrorHandler],
+        "asgi": [ErrorHandler, TimingMiddleware],
+    }
+    for path in ["/json", "/stream"]:
+        for label, middlewares in stacks.items():
+            rate = asyncio.run(throughput(build(middlewares), path, args.requests))
+            print(f"{path:8} {label:10} {rate:10.0f} req/s")
+
+if __name__ == "__main__":
+    main()
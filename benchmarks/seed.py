@@ -0,0 +1,154 @@
+"""Synthetic tenants for the benchmarks."""
+
+import random
+from bson import ObjectId
+from pymongo import MongoClient
+from db.indexes import INDEXES
+from utils.search import search_fields
+from services.stalls import days_in_month
+from utils.periods import period, shift_date
+
+FIRST_NAMES = ["José", "María", "Juan", "Ana", "Luis", "Sofía", "Andrés", "Camila", "Jesús",
+               "Valentina", "Sebastián", "Lucía", "Nicolás", "Martín", "Ángela", "Iván"]
+LAST_NAMES = ["Gómez", "Rodríguez", "Martínez", "López", "García", "Pérez", "Sánchez",
+              "Ramírez", "Torres", "Díaz", "Muñoz", "Hernández", "Jiménez", "Peña"]
+CITIES = ["Bogotá", "Medellín", "Cali", "Barranquilla", "Cartagena"]
+STEPS = [
+    {"startTime": "06:00", "endTime": "14:00", "color": "#2e7d32"},
+    {"startTime": "14:00", "endTime": "22:00", "color": "#1565c0"},
+    {"startTime": "22:00", "endTime": "06:00", "color": "#6a1b9a"},
+    {"startTime": "00:00", "endTime": "00:00", "color": "#9e9e9e"},
+]
+BATCH = 10000
+
+def person_name(rng: random.Random) -> str:
+    """Random full name."""
+    return " ".join([
+        rng.choice(FIRST_NAMES), rng.choice(FIRST_NAMES),
+        rng.choice(LAST_NAMES), rng.choice(LAST_NAMES)])
+
+def insert(collection, documents) -> None:
+    """Insert documents in batches."""
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == BATCH:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+def seed_tenant(
+    client: MongoClient,
+    index: int,
+    workers: int,
+    customers: int,
+    stalls: int,
+    periods: list,
+    stall_workers: int = 3) -> dict:
+    """
+    Create a company with its admin user and a tenant database full of synthetic data.
+    Returns:
+        dict: Company id, database name, user email and seeded counts.
+    """
+    rng = random.Random(index)
+    harmony = client["harmony"]
+    db_name = f"bench_tenant_{index}"
+    client.drop_database(db_name)
+    tenant = client[db_name]
+    email = f"admin@tenant{index}.bench"
+    harmony.companies.delete_many({"db": db_name})
+    harmony.users.delete_many({"email": email})
+    company_id = harmony.companies.insert_one({
+        "name": f"Tenant {index}",
+        "db": db_name,
+        "website": f"tenant{index}.bench",
+        "workerFields": [],
+        "customerFields": [],
+        "positions": [{"id": str(ObjectId()), "name": "Guard", "value": 1, "year": 2023}],
+        "conventions": [{"id": str(ObjectId()), "name": "Rest", "color": "#9e9e9e",
+                         "abbreviation": "D", "keep": False}],
+        "sequences": [{"id": str(ObjectId()), "name": "4x4", "steps": STEPS}],
+        "tags": [{"id": str(ObjectId()), "name": "all", "color": "#000000", "scope": "all"}],
+    }).inserted_id
+    company = str(company_id)
+    harmony.users.insert_one({
+        "userName": f"Admin {index}", "email": email, "password": "-",
+        "company": company, "customers": ["all"], "workers": ["all"],
+        "roles": ["admin"], "active": True})
+    for collection in ["workers", "customers", "stalls", "shifts", "tombstones"]:
+        for keys, options in INDEXES.get(collection, []):
+            tenant[collection].create_index(keys, **options)
+
+    def worker_documents():
+        for number in range(workers):
+            name = person_name(rng)
+            yield {
+                "_id": ObjectId(), "name": name, "identification": str(10000000 + number),
+                "city": rng.choice(CITIES), "phone": "3000000000", "address": "Calle 1",
+                "fields": [], "tags": ["all"], "company": company, "active": True,
+                **search_fields(name)}
+
+    worker_list = list(worker_documents())
+    insert(tenant.workers, worker_list)
+    customer_list = []
+    for number in range(customers):
+        name = f"{rng.choice(LAST_NAMES)} {rng.choice(['S.A.S.', 'Ltda.', 'S.A.'])} {number}"
+        customer_list.append({
+            "_id": ObjectId(), "name": name, "identification": str(900000000 + number),
+            "city": rng.choice(CITIES), "contact": person_name(rng), "phone": "6010000000",
+            "address": "Carrera 7", "fields": [], "tags": ["all"], "branches": ["Main"],
+            "company": company, "active": True, **search_fields(name)})
+    insert(tenant.customers, customer_list)
+
+    stall_list = []
+    shift_count = 0
+
+    def shift_documents():
+        nonlocal shift_count
+        for stall in stall_list:
+            days = days_in_month(stall["month"], stall["year"])
+            for worker in stall["workers"]:
+                for day in range(1, days + 1):
+                    step = STEPS[(worker["index"] + day - 1) % len(STEPS)]
+                    shift_count += 1
+                    yield {
+                        "day": str(day), "startTime": step["startTime"],
+                        "endTime": step["endTime"], "color": step["color"],
+                        "abbreviation": "", "description": "", "sequence": "4x4",
+                        "position": "Guard", "type": "shift", "active": True, "keep": False,
+                        "worker": worker["id"], "workerName": worker["name"],
+                        "stall": str(stall["_id"]), "stallName": stall["name"],
+                        "customer": stall["customer"], "customerName": stall["customerName"],
+                        "company": company, "month": stall["month"], "year": stall["year"],
+                        "period": stall["period"],
+                        "date": shift_date(day, stall["month"], stall["year"]),
+                        "createdBy": "bench", "updatedBy": "bench", "version": 0}
+
+    for month, year in periods:
+        for customer in customer_list:
+            for number in range(stalls):
+                stall_list.append({
+                    "_id": ObjectId(), "name": f"Stall {number}", "description": "",
+                    "ays": "", "branch": "Main", "month": month, "year": year,
+                    "period": period(month, year),
+                    "customer": str(customer["_id"]), "customerName": customer["name"],
+                    "workers": [{
+                        "id": str(worker["_id"]), "name": worker["name"],
+                        "identification": worker["identification"], "position": "Guard",
+                        "sequence": STEPS, "index": rng.randrange(len(STEPS)), "jump": 0,
+                    } for worker in rng.sample(worker_list, min(stall_workers, workers))],
+                    "stage": 0, "tag": "all", "version": 0})
+    insert(tenant.stalls, stall_list)
+    insert(tenant.shifts, shift_documents())
+    insert(tenant.logs, ({
+        "company": company, "user": email, "userName": f"Admin {index}",
+        "type": "Turnos, descansos o eventos", "message": f"Synthetic log {number}",
+    } for number in range(workers)))
+    return {
+        "company": company, "db": db_name, "email": email,
+        "customers": [str(customer["_id"]) for customer in customer_list],
+        "workers": [worker["name"] for worker in worker_list[:200]],
+        "counts": {"workers": workers, "customers": customers,
+                   "stalls": len(stall_list), "shifts": shift_count, "logs": workers},
+    }
@@ -0,0 +1,114 @@
+"""
+Shift storage layout benchmark.
+
+Loads the same synthetic shifts into the flat `shifts` layout and the bucketed
+`shift_buckets` layout and compares load time, storage and index size, month and
+customer read latency, and the cost of updating a single shift. Bytes written per update
+are the oplog entries of the updates, so they need a replica set (a single node one is fine).
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.shift_buckets --workers 3000
+"""
+
+import argparse
+import os
+import random
+import time
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from services.shifts import ShiftsServices
+from services.shift_buckets import BucketedShiftsServices
+from services.stalls import days_in_month
+from utils.periods import period, shift_date
+from benchmarks.seed import STEPS, person_name
+from benchmarks.workers_search import measure
+
+COMPANY = "bench"
+MONTHS = [("1", "2024"), ("2", "2024")]
+USER = {"userName": "bench"}
+
+def synthetic_shifts(workers: int, customers: int) -> list:
+    """A shift per worker and day of every month, each worker in one stall per month."""
+    rng = random.Random(11)
+    names = [person_name(rng) for _ in range(workers)]
+    shifts = []
+    for month, year in MONTHS:
+        for worker in range(workers):
+            customer = worker % customers
+            stall = f"{month}{year}-{worker // 3}"
+            for day in range(1, days_in_month(month, year) + 1):
+                step = STEPS[(worker + day) % len(STEPS)]
+                shifts.append({
+                    "day": str(day), **step, "abbreviation": "", "description": "",
+                    "sequence": "4x4", "position": "Guard", "type": "shift", "active": True,
+                    "keep": False, "worker": f"{worker:024x}", "workerName": names[worker],
+                    "stall": stall, "stallName": f"Stall {worker // 3}",
+                    "customer": f"{customer:024x}", "customerName": f"Customer {customer} S.A.S.",
+                    "company": COMPANY, "month": month, "year": year,
+                    "period": period(month, year), "date": shift_date(day, month, year),
+                    "version": 1, "createdBy": "bench", "updatedBy": "bench",
+                    "createdAt": "01/01/2024 00:00", "updatedAt": "01/01/2024 00:00"})
+    return shifts
+
+def load(services, shifts: list) -> float:
+    """Seconds to insert the shifts in chunks."""
+    start = time.perf_counter()
+    for index in range(0, len(shifts), 5000):
+        services.insert_shifts([dict(shift) for shift in shifts[index:index + 5000]])
+    return time.perf_counter() - start
+
+def last_oplog_entry(client: MongoClient):
+    """Timestamp of the latest oplog entry, or None without a replica set."""
+    try:
+        entry = client.local["oplog.rs"].find_one({}, {"ts": 1}, sort=[("$natural", -1)])
+    except PyMongoError:
+        return None
+    return entry["ts"] if entry else None
+
+def oplog_bytes(client: MongoClient, namespace: str, since) -> int:
+    """Bytes of the oplog entries written to a namespace after a timestamp."""
+    result = list(client.local["oplog.rs"].aggregate([
+        {"$match": {"ns": namespace, "ts": {"$gt": since}}},
+        {"$group": {"_id": None, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}}]))
+    return result[0]["bytes"] if result else 0
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=3000)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    shifts = synthetic_shifts(args.workers, args.customers)
+    print(f"{len(shifts)} shifts")
+    for layout, services_class in [("flat", ShiftsServices), ("buckets", BucketedShiftsServices)]:
+        client.drop_database(f"bench_{layout}")
+        database = client[f"bench_{layout}"]
+        services = services_class(database)
+        seconds = load(services, shifts)
+        stats = database.command("collStats", services.collection)
+        month = measure(lambda services=services: services.get_shifts_by_month_and_year(
+            COMPANY, ["1"], ["2024"], ["shift"]), args.repeat)
+        customer = measure(lambda services=services: services.get_by_customer_and_month_and_year(
+            COMPANY, f"{1:024x}", ["1", "2"], ["2024"], ["shift"]), args.repeat)
+        sample = services.get_by_customer_and_month_and_year(
+            COMPANY, f"{2:024x}", ["1"], ["2024"], ["shift"])
+        since = last_oplog_entry(client)
+        update = measure(lambda services=services: services.update_shifts(
+            COMPANY, [{"id": str(random.choice(sample)["_id"]), "color": "#ff0000"}], USER),
+            args.repeat)
+        written = "n/a"
+        if since is not None:
+            namespace = f"{database.name}.{services.collection}"
+            written = oplog_bytes(client, namespace, since) // args.repeat
+        print(
+            f"{layout:8} load={seconds:.1f}s docs={stats['count']} "
+            f"size={stats['size'] / 2**20:.1f}MB storage={stats['storageSize'] / 2**20:.1f}MB "
+            f"indexes={stats['totalIndexSize'] / 2**20:.1f}MB "
+            f"avg_doc_bytes={stats.get('avgObjSize', 0)} bytes/update={written}")
+        print(f"{'':8} month p50={month['p50']}ms p95={month['p95']}ms "
+              f"customer p50={customer['p50']}ms p95={customer['p95']}ms "
+              f"update p50={update['p50']}ms p95={update['p95']}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Shift schema benchmark.
+
+Writes the same synthetic shifts with the v1 schema and the compact v2 schema
+(SHIFTS_SCHEMA=2) and compares collection size, bytes read by a month query
+(its working set) and month read latency, including the v2 name resolution.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.shift_schema --workers 3000
+"""
+
+import argparse
+import os
+import bson
+from bson import ObjectId
+from pymongo import MongoClient
+from services.shifts import ShiftsServices
+from benchmarks.shift_buckets import synthetic_shifts
+from benchmarks.workers_search import measure
+
+REST = {"name": "Rest", "color": "#9e9e9e", "abbreviation": "D", "keep": False}
+
+def prepare(client: MongoClient, layout: str, shifts: list) -> tuple:
+    """Company, referenced documents and shifts of a scratch tenant database."""
+    db_name = f"bench_schema_{layout}"
+    client.drop_database(db_name)
+    database = client[db_name]
+    harmony = client["harmony"]
+    harmony.companies.delete_many({"db": db_name})
+    company = str(harmony.companies.insert_one({
+        "name": db_name, "db": db_name, "website": "", "workerFields": [],
+        "customerFields": [], "positions": [], "sequences": [], "tags": [],
+        "conventions": [{"id": str(ObjectId()), **REST}]}).inserted_id)
+    stalls = {}
+    for shift in shifts:
+        stalls.setdefault(shift["stall"], (str(ObjectId()), shift["stallName"]))
+    database.workers.insert_many([
+        {"_id": ObjectId(worker), "name": name}
+        for worker, name in {(s["worker"], s["workerName"]) for s in shifts}])
+    database.customers.insert_many([
+        {"_id": ObjectId(customer), "name": name}
+        for customer, name in {(s["customer"], s["customerName"]) for s in shifts}])
+    database.stalls.insert_many([
+        {"_id": ObjectId(stall), "name": name} for stall, name in stalls.values()])
+    documents = []
+    for shift in shifts:
+        shift = dict(shift, company=company, stall=stalls[shift["stall"]][0])
+        if shift["color"] == REST["color"]:
+            shift.update(abbreviation=REST["abbreviation"], description=REST["name"])
+        documents.append(shift)
+    return database, company, documents
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=3000)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    shifts = synthetic_shifts(args.workers, args.customers)
+    for layout in ["v1", "v2"]:
+        os.environ["SHIFTS_SCHEMA"] = layout[1]
+        database, company, documents = prepare(client, layout, shifts)
+        services = ShiftsServices(database)
+        for index in range(0, len(documents), 5000):
+            services.insert_shifts(documents[index:index + 5000])
+        stats = database.command("collStats", "shifts")
+        month = list(database.shifts.find({"period": 202401}))
+        working_set = sum(len(bson.encode(shift)) for shift in month)
+        latency = measure(lambda services=services, company=company:
+                          services.get_shifts_by_month_and_year(
+                              company, ["1"], ["2024"], ["shift"]), args.repeat)
+        print(
+            f"{layout} docs={stats['count']} avg={stats['avgObjSize']}B "
+            f"size={stats['size'] / 2**20:.1f}MB storage={stats['storageSize'] / 2**20:.1f}MB "
+            f"month working set={working_set / 2**20:.1f}MB "
+            f"read p50={latency['p50']}ms p95={latency['p95']}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Worker search benchmark.
+
+Seeds a scratch database with synthetic workers and compares the unanchored
+case-insensitive regex search with the indexed token search.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.workers_search --workers 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from pymongo import MongoClient
+from db.indexes import INDEXES
+from utils.search import search_fields, search_query, SEARCH_SORT
+from benchmarks.seed import person_name
+
+COMPANY = "bench"
+
+def seed(database, count: int) -> None:
+    """Insert synthetic workers."""
+    database.workers.drop()
+    rng = random.Random(7)
+    batch = []
+    for index in range(count):
+        name = person_name(rng)
+        batch.append({
+            "name": name, "identification": str(10000000 + index), "company": COMPANY,
+            "tags": ["all"], **search_fields(name)})
+        if len(batch) == 10000:
+            database.workers.insert_many(batch)
+            batch = []
+    if batch:
+        database.workers.insert_many(batch)
+    for keys, options in INDEXES["workers"]:
+        database.workers.create_index(keys, **options)
+
+def measure(run, repeat: int) -> dict:
+    """Latency percentiles of a query in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50": round(statistics.median(samples), 2),
+        "p95": round(samples[int(len(samples) * 0.95) - 1], 2),
+    }
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+    database = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))["bench_search"]
+    if not args.skip_seed:
+        seed(database, args.workers)
+    for search in ["mar", "jose gom", "Peña", "1005"]:
+        regex = {"company": COMPANY, "$or": [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"identification": {"$regex": search, "$options": "i"}}]}
+        indexed = {"company": COMPANY, **search_query(search)}
+        for label, query, sort in [("regex", regex, None), ("indexed", indexed, SEARCH_SORT)]:
+            def run(query=query, sort=sort):
+                cursor = database.workers.find(query).limit(20)
+                if sort:
+                    cursor = cursor.sort(sort)
+                return list(cursor)
+            stats = measure(run, args.repeat)
+            explain = database.workers.find(query).limit(20).explain()["executionStats"]
+            print(
+                f"{search!r:12} {label:8} p50={stats['p50']}ms p95={stats['p95']}ms "
+                f"keys={explain['totalKeysExamined']} docs={explain['totalDocsExamined']}")
+
+if __name__ == "__main__":
+    main()
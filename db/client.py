@@ -4,9 +4,14 @@ import os
 from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
+from db.monitoring import CommandMetrics
+from db import profiler
 
 load_dotenv()
-db_client = MongoClient(os.getenv("MONGO_URI"))
+listeners = [CommandMetrics()]
+if profiler.enabled():
+    listeners.append(profiler.QueryProfiler())
+db_client = MongoClient(os.getenv("MONGO_URI"), event_listeners=listeners)
 
 try:
     db_client.server_info()
@@ -0,0 +1,100 @@
+"""Indexes for the tenant collections."""
+
+from pymongo import ASCENDING
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+# Each entry is a (keys, options) pair passed to create_index.
+INDEXES = {
+    "shifts": [
+        ([("version", ASCENDING)], {}),
+        ([("worker", ASCENDING)], {}),
+        ([("stall", ASCENDING)], {}),
+        ([("customer", ASCENDING)], {}),
+        ([("period", ASCENDING), ("type", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+        ([("worker", ASCENDING), ("date", ASCENDING)], {}),
+        ([("convention", ASCENDING)], {"sparse": True}),
+    ],
+    "shift_buckets": [
+        ([("stall", ASCENDING), ("worker", ASCENDING), ("period", ASCENDING)], {"unique": True}),
+        ([("company", ASCENDING), ("period", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+        ([("worker", ASCENDING), ("period", ASCENDING)], {}),
+        ([("period", ASCENDING)], {}),
+        ([("days.id", ASCENDING)], {}),
+        ([("version", ASCENDING)], {}),
+    ],
+    "stalls": [
+        ([("version", ASCENDING)], {}),
+        ([("customer", ASCENDING)], {}),
+        ([("period", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+        ([("workers.id", ASCENDING)], {}),
+    ],
+    # Archive tiers only serve historical month reads.
+    "shifts_archive": [
+        ([("period", ASCENDING), ("type", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+        ([("stall", ASCENDING)], {}),
+    ],
+    "shift_buckets_archive": [
+        ([("company", ASCENDING), ("period", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+        ([("stall", ASCENDING)], {}),
+    ],
+    "stalls_archive": [
+        ([("period", ASCENDING)], {}),
+        ([("customer", ASCENDING), ("period", ASCENDING)], {}),
+    ],
+    "workers": [
+        ([("company", ASCENDING), ("searchTokens", ASCENDING)], {}),
+        ([("company", ASCENDING), ("identification", ASCENDING)], {}),
+        ([("company", ASCENDING), ("searchName", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+    "customers": [
+        ([("company", ASCENDING), ("searchTokens", ASCENDING)], {}),
+        ([("company", ASCENDING), ("identification", ASCENDING)], {}),
+        ([("company", ASCENDING), ("searchName", ASCENDING), ("_id", ASCENDING)], {}),
+        ([("company", ASCENDING), ("tags", ASCENDING)], {}),
+    ],
+    "sequences": [
+        ([("company", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ],
+    "positions": [
+        ([("company", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ],
+    "conventions": [
+        ([("company", ASCENDING), ("name", ASCENDING)], {"unique": True}),
+    ],
+    "tags": [
+        ([("company", ASCENDING), ("name", ASCENDING), ("scope", ASCENDING)], {"unique": True}),
+    ],
+    "tombstones": [
+        ([("version", ASCENDING)], {}),
+    ],
+    # Harmony database: claimed by state and due time, listed per company.
+    "jobs": [
+        ([("state", ASCENDING), ("runAfter", ASCENDING), ("_id", ASCENDING)], {}),
+        ([("company", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+}
+
+_ensured = set()
+
+def ensure_indexes(database: Database, collection: str) -> None:
+    """
+    Create the indexes of a collection once per process.
+    Args:
+        database (Database): Database.
+        collection (str): Collection name.
+    """
+    key = (database.name, collection)
+    if key in _ensured:
+        return
+    try:
+        for keys, options in INDEXES.get(collection, []):
+            database[collection].create_index(keys, **options)
+        _ensured.add(key)
+    except PyMongoError as exception:
+        print(f"Error creating indexes on {collection}: {exception}")
@@ -0,0 +1,39 @@
+"""MongoDB command monitoring."""
+
+from contextvars import ContextVar
+from pymongo import monitoring
+from utils.metrics import registry
+
+command_duration = registry.histogram(
+    "mongodb_command_duration_seconds",
+    "Duration of the MongoDB commands.",
+    ("command",))
+command_failures = registry.counter(
+    "mongodb_command_failures_total",
+    "MongoDB commands that failed.",
+    ("command",))
+
+# Commands issued while serving the current request, set by the timing middleware.
+# The dict is shared with the threadpool running sync endpoints, which copies the context.
+request_commands: ContextVar[dict] = ContextVar("request_commands", default=None)
+
+class CommandMetrics(monitoring.CommandListener):
+    """Record every MongoDB command in the metrics and in the current request."""
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        command_failures.inc(event.command_name)
+        self._record(event)
+
+    @staticmethod
+    def _record(event) -> None:
+        seconds = event.duration_micros / 1000000
+        command_duration.observe(seconds, event.command_name)
+        commands = request_commands.get()
+        if commands is not None:
+            commands["count"] += 1
+            commands["seconds"] += seconds
@@ -0,0 +1,55 @@
+"""MongoDB query profiler used by the profiling mode."""
+
+import os
+import sys
+from contextvars import ContextVar
+from typing import List
+from pymongo import monitoring
+
+# Commands issued while serving the current request, set by the profiler middleware.
+request_profile: ContextVar[List[dict]] = ContextVar("request_profile", default=None)
+
+def enabled() -> bool:
+    """Check if the profiling mode is on (PROFILE_QUERIES=1)."""
+    return os.getenv("PROFILE_QUERIES", "").lower() in ("1", "true", "yes")
+
+def origin() -> str:
+    """Innermost service method on the current stack, as `services/file.py:line method`."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename.replace("\\", "/")
+        if "/services/" in filename and "site-packages" not in filename:
+            path = filename[filename.rindex("/services/") + 1:]
+            return f"{path}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+class QueryProfiler(monitoring.CommandListener):
+    """Record the commands of the current request with the service method issuing them."""
+    def __init__(self) -> None:
+        self.pending = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        commands = request_profile.get()
+        if commands is None:
+            return
+        collection = event.command.get(event.command_name)
+        entry = {
+            "command": event.command_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "origin": origin(),
+            "ms": None,
+        }
+        commands.append(entry)
+        self.pending[(event.connection_id, event.request_id)] = entry
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event)
+
+    def _finish(self, event) -> None:
+        entry = self.pending.pop((event.connection_id, event.request_id), None)
+        if entry is not None:
+            entry["ms"] = round(event.duration_micros / 1000, 3)
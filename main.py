@@ -1,8 +1,20 @@
 """Main module."""
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from db.client import db_client
+from db import profiler
 from middlewares.error_handler import ErrorHandler
+from middlewares.timing import TimingMiddleware
+from middlewares.compression import CompressionMiddleware
+from middlewares.profiler import ProfilerMiddleware
+from middlewares.admission import AdmissionMiddleware
+from services.companies import company_cache
+from services.closed_periods import PeriodClosed
+from services.archive import start_mover
+from services.jobs import job_runner
+from utils.periods import InvalidPeriod
 from routers.companies import companies
 from routers.users import users
 from routers.w_fields import wfields
@@ -17,6 +29,10 @@ from routers.stalls import stalls
 from routers.shifts import shifts
 from routers.logs import logs
 from routers.websocket import ws
+from routers.migrations import migrations
+from routers.metrics import metrics
+from routers.periods import periods
+from routers.jobs import jobs
 
 app = FastAPI()
 app.add_middleware(
@@ -31,6 +47,28 @@ app.title = "Harmony API"
 app.version = "0.0.17"
 
 app.add_middleware(ErrorHandler)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(TimingMiddleware)
+if profiler.enabled():
+    app.add_middleware(ProfilerMiddleware)
+
+@app.on_event("startup")
+async def startup():
+    """Start the background watchers."""
+    company_cache.start_watching(db_client["harmony"].companies)
+    start_mover(db_client)
+    job_runner.start(db_client)
+
+@app.exception_handler(PeriodClosed)
+async def period_closed(_: Request, exception: PeriodClosed) -> JSONResponse:
+    """Reject writes to closed periods with a conflict."""
+    return JSONResponse(status_code=409, content={"detail": str(exception)})
+
+@app.exception_handler(InvalidPeriod)
+async def invalid_period(_: Request, exception: InvalidPeriod) -> JSONResponse:
+    """Reject months that don't exist as a bad request."""
+    return JSONResponse(status_code=400, content={"detail": str(exception)})
 
 @app.get(path="/", tags=["Root"])
 async def root():
@@ -51,3 +89,7 @@ app.include_router(stalls)
 app.include_router(shifts)
 app.include_router(logs)
 app.include_router(ws)
+app.include_router(migrations)
+app.include_router(metrics)
+app.include_router(periods)
+app.include_router(jobs)
@@ -0,0 +1,231 @@
+"""Admission control middleware."""
+
+import asyncio
+import math
+import os
+import re
+import time
+from typing import Dict, Tuple
+from jose import JWTError, jwt
+from pymongo.errors import PyMongoError
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from db.client import db_client
+from utils.auth import ALGORITHM, SECRET_KEY
+from utils.etags import tenants
+from utils.metrics import registry
+
+# Heavy endpoint classes, matched on the method and path before routing.
+CLASSES = [
+    ("import", "POST", re.compile(r"^/(workers|customers)/createAndUpdate$")),
+    ("import", "PUT", re.compile(r"^/migrations/[^/]+$")),
+    ("import", "POST", re.compile(r"^/(stalls/rollover|periods/close)$")),
+    ("month_read", "POST", re.compile(r"^/shifts/(getByMonthsAndYears|sync)$")),
+    ("month_read", "POST", re.compile(r"^/stalls/(getByCustomer|getByMonthsAndYears|calendar)$")),
+    ("export", "GET", re.compile(r"^/periods/[^/]+/[^/]+$")),
+]
+# Per tenant and class: requests in flight, then sustained requests per second and burst.
+LIMITS = {
+    "import": {"concurrency": 1, "rate": 0.2, "burst": 2},
+    "month_read": {"concurrency": 4, "rate": 10.0, "burst": 30},
+    "export": {"concurrency": 2, "rate": 2.0, "burst": 10},
+}
+# Paths never shed, so the process can still be observed while overloaded.
+EXEMPT = ("/", "/metrics")
+# Seconds an email without a user is remembered, so its requests don't all read MongoDB.
+UNKNOWN_USER_SECONDS = 300
+
+# Emails found without a user, with the time they're looked up again.
+unknown_users: Dict[str, float] = {}
+
+admission_requests = registry.counter(
+    "admission_requests_total",
+    "Requests of the heavy endpoint classes by admission result.",
+    ("tenant", "class", "result"))
+admission_in_flight = registry.gauge(
+    "admission_in_flight",
+    "Admitted requests of the heavy endpoint classes in flight.",
+    ("tenant", "class"))
+loop_lag = registry.gauge("event_loop_lag_seconds", "Latest event loop scheduling delay.")
+
+def classify(method: str, path: str) -> str:
+    """Heavy endpoint class of a request, or None."""
+    for name, class_method, pattern in CLASSES:
+        if method == class_method and pattern.match(path):
+            return name
+    return None
+
+def claims_of(scope: Scope) -> dict:
+    """Claims of the bearer token of a request, or None."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except JWTError:
+                return None
+    return None
+
+def company_of(email: str) -> str:
+    """
+    Company of a user, read once per process for tokens issued without it. Emails without
+    a user are remembered for UNKNOWN_USER_SECONDS.
+    """
+    if unknown_users.get(email, 0) > time.monotonic():
+        return None
+    try:
+        user = db_client["harmony"].users.find_one({"email": email}, {"company": 1})
+    except PyMongoError:
+        return None
+    if user:
+        tenants[email] = user["company"]
+        return user["company"]
+    unknown_users[email] = time.monotonic() + UNKNOWN_USER_SECONDS
+    return None
+
+async def tenant_of(scope: Scope) -> str:
+    """
+    Company of the bearer token of a request. Tokens carry it since they were issued with
+    it; older ones are looked up by email. Emails are never returned, since the tenant is
+    a metric label.
+    """
+    claims = claims_of(scope)
+    if not claims:
+        return "anonymous"
+    if claims.get("company"):
+        return claims["company"]
+    email = claims.get("sub")
+    if not email:
+        return "anonymous"
+    company = tenants.get(email)
+    if company is None and unknown_users.get(email, 0) <= time.monotonic():
+        company = await asyncio.to_thread(company_of, email)
+    return company or "anonymous"
+
+def refusal_headers(scope: Scope, retry_after: float) -> dict:
+    """
+    Headers of a refused request. CORS runs inside this middleware, so the origin is allowed
+    here, or browsers would report a CORS error instead of the status.
+    """
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+    for name, value in scope.get("headers", []):
+        if name == b"origin":
+            headers["Access-Control-Allow-Origin"] = value.decode("latin-1")
+            headers["Access-Control-Allow-Credentials"] = "true"
+            headers["Vary"] = "Origin"
+    return headers
+
+class TokenBucket():
+    """Token bucket refilled at `rate` tokens per second up to `burst`."""
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token. Returns 0 when granted, else the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Give back a token taken by a request that was refused anyway."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class AdmissionMiddleware():
+    """
+    Pure ASGI middleware protecting the process from a single tenant and from overload.
+    Requests of the heavy classes get a per tenant token bucket and concurrency limit, and
+    wait up to `queue_seconds` for a slot before a 429 with Retry-After, which gives their
+    token back. While the event loop lags more than `max_lag` seconds every request but the
+    exempt paths gets a 503.
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_lag: float = float(os.getenv("ADMISSION_MAX_LAG", "0.5")),
+        queue_seconds: float = float(os.getenv("ADMISSION_QUEUE_SECONDS", "2")),
+        enabled: bool = os.getenv("ADMISSION_CONTROL", "1") != "0"
+        ) -> None:
+        self.app = app
+        self.max_lag = max_lag
+        self.queue_seconds = queue_seconds
+        self.enabled = enabled
+        self.lag = 0.0
+        self.monitor = None
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.slots: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        if self.monitor is None:
+            self.monitor = asyncio.ensure_future(self.measure_lag())
+        path = scope["path"]
+        if self.lag > self.max_lag and path not in EXEMPT:
+            admission_requests.inc("all", "all", "shed")
+            response = PlainTextResponse(
+                "Service overloaded", status_code=503, headers=refusal_headers(scope, self.lag))
+            await response(scope, receive, send)
+            return
+        kind = classify(scope["method"], path)
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        tenant = await tenant_of(scope)
+        key = (tenant, kind)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(LIMITS[kind]["rate"], LIMITS[kind]["burst"])
+        wait = bucket.take()
+        if wait:
+            await self.reject(scope, receive, send, key, "rate_limited", wait)
+            return
+        slots = self.slots.get(key)
+        if slots is None:
+            slots = self.slots[key] = asyncio.Semaphore(LIMITS[kind]["concurrency"])
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_seconds)
+        except asyncio.TimeoutError:
+            # Only admitted requests spend the rate budget of the tenant.
+            bucket.refund()
+            await self.reject(scope, receive, send, key, "concurrency_limited", 1)
+            return
+        admission_requests.inc(tenant, kind, "admitted")
+        admission_in_flight.inc(tenant, kind)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_in_flight.dec(tenant, kind)
+            slots.release()
+
+    async def reject(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        key: Tuple[str, str],
+        result: str,
+        retry_after: float) -> None:
+        """Answer 429 with the seconds after which the tenant may retry."""
+        admission_requests.inc(*key, result)
+        response = PlainTextResponse(
+            "Too many requests", status_code=429, headers=refusal_headers(scope, retry_after))
+        await response(scope, receive, send)
+
+    async def measure_lag(self, interval: float = 0.1) -> None:
+        """Measure how late the event loop wakes up from a short sleep, forever."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.lag = max(0.0, loop.time() - start - interval)
+            loop_lag.set(value=self.lag)
@@ -0,0 +1,252 @@
+"""Response compression middleware."""
+
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from middlewares.timing import route_of
+from utils.metrics import registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Preferred encodings first, when the client accepts them with the same quality.
+ENCODINGS = [encoding for encoding, module in [("br", brotli), ("zstd", zstandard)] if module]
+ENCODINGS.append("gzip")
+DEFAULT_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+# Month lists are large and different on every request, so they favor speed. ETagged
+# responses are compressed once per version and cached, so they can afford the best ratio.
+ROUTE_LEVELS = {
+    "/shifts/getByMonthsAndYears": {"br": 3, "zstd": 3, "gzip": 4},
+    "/shifts/sync": {"br": 3, "zstd": 3, "gzip": 4},
+    "/stalls/getByMonthsAndYears": {"br": 3, "zstd": 3, "gzip": 4},
+    "/stalls/getByCustomer": {"br": 4, "zstd": 3, "gzip": 5},
+    "/stalls/calendar": {"br": 4, "zstd": 3, "gzip": 5},
+    "/customers/": {"br": 9, "zstd": 12, "gzip": 9},
+    "/users/profile": {"br": 9, "zstd": 12, "gzip": 9},
+}
+COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/xml")
+
+compressed_bytes = registry.counter(
+    "http_compression_bytes_total",
+    "Bytes before and after compressing responses.",
+    ("encoding", "stage"))
+cache_requests = registry.counter(
+    "http_compression_cache_requests_total",
+    "Compressed body cache lookups.",
+    ("result",))
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Best encoding accepted by an Accept-Encoding header, or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(encoding: str, data: bytes, level: int) -> bytes:
+    """Compress a whole body."""
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+class StreamEncoder():
+    """Incremental compressor flushing every chunk, so streamed responses keep streaming."""
+    def __init__(self, encoding: str, level: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress and flush a chunk."""
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        if self.encoding == "zstd":
+            return self.compressor.compress(data) + self.compressor.flush(
+                zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """End the compressed stream."""
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+class CompressedCache():
+    """LRU of compressed bodies of ETagged responses, bounded in bytes."""
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> bytes:
+        """Get a compressed body."""
+        with self._lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key: tuple, body: bytes) -> None:
+        """Store a compressed body, evicting the least recently used ones."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+class CompressionMiddleware():
+    """
+    Pure ASGI middleware compressing responses with the best encoding the client accepts.
+    Bodies under `minimum_size` and responses that already have a Content-Encoding pass
+    through, and the compressed bodies of ETagged responses are cached per credentials
+    and ETag.
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+        cache_bytes: int = int(os.getenv("COMPRESSION_CACHE_BYTES", str(32 * 1024 * 1024)))
+        ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = CompressedCache(cache_bytes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+class _Responder():
+    """Compression state of one response."""
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        scope: Scope,
+        send: Send,
+        encoding: str) -> None:
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.start = None
+        self.passthrough = False
+        self.stream = None
+
+    def identity(self) -> str:
+        """
+        Digest of the credentials of the request. ETagged bodies are per user, so a cached
+        one is only sent back to the same bearer even if two users share a validator.
+        """
+        authorization = Headers(scope=self.scope).get("authorization", "")
+        return hashlib.sha1(authorization.encode()).hexdigest()
+
+    def level(self) -> int:
+        """Compression level of the route."""
+        levels = ROUTE_LEVELS.get(route_of(self.scope), DEFAULT_LEVELS)
+        return levels.get(self.encoding, DEFAULT_LEVELS[self.encoding])
+
+    async def send(self, message: Message) -> None:
+        """Compress the response messages."""
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] < 200 or message["status"] in (204, 304)
+                or not content_type.startswith(COMPRESSIBLE))
+            if self.passthrough:
+                await self.downstream(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None and not more_body:
+            await self.send_whole(body)
+            return
+        if self.stream is None:
+            self.stream = StreamEncoder(self.encoding, self.level())
+            headers = MutableHeaders(raw=self.start["headers"])
+            del headers["content-length"]
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            self.start["headers"] = headers.raw
+            await self.downstream(self.start)
+        chunk = self.stream.compress(body) if body else b""
+        if not more_body:
+            chunk += self.stream.finish()
+        compressed_bytes.inc(self.encoding, "in", amount=len(body))
+        compressed_bytes.inc(self.encoding, "out", amount=len(chunk))
+        await self.downstream({
+            "type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def send_whole(self, body: bytes) -> None:
+        """Send a response whose body arrived in a single message."""
+        headers = MutableHeaders(raw=self.start["headers"])
+        if len(body) < self.middleware.minimum_size:
+            await self.downstream(self.start)
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+        etag = headers.get("etag")
+        key = (self.scope["path"], self.identity(), etag, self.encoding)
+        compressed = self.middleware.cache.get(key) if etag else None
+        if etag:
+            cache_requests.inc("hit" if compressed is not None else "miss")
+        if compressed is None:
+            compressed = compress(self.encoding, body, self.level())
+            if etag:
+                self.middleware.cache.put(key, compressed)
+        compressed_bytes.inc(self.encoding, "in", amount=len(body))
+        compressed_bytes.inc(self.encoding, "out", amount=len(compressed))
+        headers["content-encoding"] = self.encoding
+        headers["content-length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        self.start["headers"] = headers.raw
+        await self.downstream(self.start)
+        await self.downstream({"type": "http.response.body", "body": compressed})
@@ -1,13 +1,36 @@
-from fastapi import FastAPI, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-
-class ErrorHandler(BaseHTTPMiddleware):
-    def __init__(self, app: FastAPI) -> None:
-        super().__init__(app)
-        
-    async def dispatch(self, request: Request, call_next) -> Response :
+"""Error handling middleware."""
+
+import logging
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+class ErrorHandler():
+    """
+    Pure ASGI middleware answering unhandled exceptions with a 500 response.
+    It passes the response messages through untouched, so streaming responses keep
+    streaming and no extra task is spawned per request.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
         try:
-            return await call_next(request)
-        except Exception as e:
-            print(e)
-            return Response("Internal server error", status_code=500)
\ No newline at end of file
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            logger.exception("Unhandled error on %s %s", scope["method"], scope["path"])
+            if started:
+                raise
+            await Response("Internal server error", status_code=500)(scope, receive, send)
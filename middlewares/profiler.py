@@ -0,0 +1,123 @@
+"""Query profiler middleware."""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from db.profiler import request_profile
+from middlewares.timing import route_of
+
+logger = logging.getLogger(__name__)
+
+class ProfilerMiddleware():
+    """
+    Pure ASGI middleware grouping the MongoDB commands of each request.
+    Requests with more than PROFILE_MAX_ROUND_TRIPS commands or with a command slower than
+    PROFILE_SLOW_MS are logged with the service methods issuing them, and a per-endpoint
+    report is written to PROFILE_REPORT by a background thread, off the event loop.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.max_round_trips = int(os.getenv("PROFILE_MAX_ROUND_TRIPS", "5"))
+        self.slow_ms = float(os.getenv("PROFILE_SLOW_MS", "100"))
+        self.report_path = os.getenv("PROFILE_REPORT", "profile_report.json")
+        self.endpoints = {}
+        self.written = 0.0
+        self.dirty = threading.Event()
+        self.writer = None
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        commands = []
+        token = request_profile.set(commands)
+        response = {"status": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_profile.reset(token)
+            elapsed = (time.perf_counter() - start) * 1000
+            endpoint = f"{scope['method']} {route_of(scope)}"
+            self.record(endpoint, response["status"], elapsed, commands)
+
+    def record(self, endpoint: str, status: int, elapsed: float, commands: list) -> None:
+        """Add a request to the report, logging it if it's flagged."""
+        db_ms = sum(command["ms"] or 0 for command in commands)
+        slow = [command for command in commands if (command["ms"] or 0) > self.slow_ms]
+        flagged = len(commands) > self.max_round_trips or bool(slow)
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                "requests": 0, "flagged": 0, "roundTrips": 0, "maxRoundTrips": 0,
+                "dbMs": 0.0, "maxMs": 0.0, "origins": Counter(), "worst": []})
+            stats["requests"] += 1
+            stats["flagged"] += int(flagged)
+            stats["roundTrips"] += len(commands)
+            stats["dbMs"] += db_ms
+            stats["maxMs"] = max(stats["maxMs"], elapsed)
+            stats["origins"].update(command["origin"] for command in commands)
+            if len(commands) >= stats["maxRoundTrips"]:
+                stats["maxRoundTrips"] = len(commands)
+                stats["worst"] = commands
+        if flagged:
+            origins = Counter(command["origin"] for command in commands).most_common(5)
+            logger.warning(
+                "%s (%s) took %.1fms with %d round trips%s; slow: %s; from: %s",
+                endpoint, status, elapsed, len(commands),
+                " (N+1?)" if len(commands) > self.max_round_trips else "",
+                [f"{command['command']} {command['collection']} {command['ms']}ms "
+                 f"at {command['origin']}" for command in slow],
+                [f"{name} x{count}" for name, count in origins])
+        if flagged or time.monotonic() - self.written > 5:
+            self.schedule()
+
+    def schedule(self) -> None:
+        """Ask the writer thread for a fresh report, starting it the first time."""
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_forever, daemon=True)
+            self.writer.start()
+        self.dirty.set()
+
+    def write_forever(self) -> None:
+        """Write the report whenever it's requested, at most once a second."""
+        while True:
+            self.dirty.wait()
+            self.dirty.clear()
+            self.write()
+            time.sleep(1)
+
+    def report(self) -> dict:
+        """Per-endpoint report, endpoints with the most round trips first."""
+        with self._lock:
+            endpoints = {endpoint: {
+                "requests": stats["requests"],
+                "flagged": stats["flagged"],
+                "avgRoundTrips": round(stats["roundTrips"] / stats["requests"], 2),
+                "maxRoundTrips": stats["maxRoundTrips"],
+                "avgDbMs": round(stats["dbMs"] / stats["requests"], 3),
+                "maxMs": round(stats["maxMs"], 3),
+                "origins": dict(stats["origins"].most_common()),
+                "worst": stats["worst"],
+            } for endpoint, stats in self.endpoints.items()}
+        return dict(sorted(
+            endpoints.items(), key=lambda item: item[1]["avgRoundTrips"], reverse=True))
+
+    def write(self) -> None:
+        """Write the report to PROFILE_REPORT."""
+        self.written = time.monotonic()
+        try:
+            with open(self.report_path, "w", encoding="utf-8") as file:
+                json.dump(self.report(), file, indent=2)
+        except OSError as exception:
+            logger.error("Error writing profile report: %s", exception)
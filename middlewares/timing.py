@@ -0,0 +1,71 @@
+"""Timing middleware."""
+
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from db.monitoring import request_commands
+from utils.metrics import registry
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time until the last byte of the response.",
+    ("method", "route"))
+response_size = registry.histogram(
+    "http_response_size_bytes",
+    "Size of the response bodies.",
+    ("method", "route"),
+    SIZE_BUCKETS)
+request_db_commands = registry.histogram(
+    "http_request_db_commands",
+    "MongoDB commands issued per request.",
+    ("method", "route"),
+    (0, 1, 2, 5, 10, 20, 50, 100, 500))
+request_db_duration = registry.histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in MongoDB commands per request.",
+    ("method", "route"))
+requests_total = registry.counter(
+    "http_requests_total",
+    "Responses by status code.",
+    ("method", "route", "status"))
+
+def route_of(scope: Scope) -> str:
+    """Path template of the route that handled a request."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class TimingMiddleware():
+    """
+    Pure ASGI middleware recording per-route latency, response size and the MongoDB
+    commands issued while serving each request.
+    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        response = {"status": 500, "size": 0}
+        commands = {"count": 0, "seconds": 0.0}
+        token = request_commands.set(commands)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_commands.reset(token)
+            route = route_of(scope)
+            request_duration.observe(time.perf_counter() - start, scope["method"], route)
+            response_size.observe(response["size"], scope["method"], route)
+            request_db_commands.observe(commands["count"], scope["method"], route)
+            request_db_duration.observe(commands["seconds"], scope["method"], route)
+            requests_total.inc(scope["method"], route, str(response["status"]))
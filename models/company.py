@@ -33,6 +33,9 @@ class Step(BaseModel):
     startTime: str
     endTime: str
     color: str
+    abbreviation: str = ""
+    description: str = ""
+    sequence: str = "" #Sequence name
 
 class Sequence(BaseModel):
     """Sequence model."""
@@ -0,0 +1,8 @@
+"""Period models module."""
+
+from pydantic import BaseModel
+
+class ClosePeriod(BaseModel):
+    """Close period model."""
+    month: str
+    year: str
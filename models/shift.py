@@ -1,7 +1,7 @@
 """Shift model module."""
 
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from models.company import Step
 
 class Shift(BaseModel):
@@ -31,6 +31,8 @@ class Shift(BaseModel):
     updatedBy: str = None
     createdAt: str = None
     updatedAt: str = None
+    version: int = None
+    period: int = None
 
 class UpdateShift(BaseModel):
     """Update shift model."""
@@ -75,7 +77,16 @@ class AppliedSequence(BaseModel):
     jump: int
 
 class GetShifts(BaseModel):
-    """Get shifts model."""
+    """Get shifts model. `from`/`to` (yyyy-mm) select a range of months instead."""
+    months: List[str] = []
+    years: List[str] = []
+    types: List[str]
+    from_: str = Field(default=None, alias="from")
+    to: str = None
+
+class SyncShifts(BaseModel):
+    """Sync shifts model."""
+    since: int
     months: List[str]
     years: List[str]
     types: List[str]
@@ -1,7 +1,7 @@
 """Stall models module."""
 
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from models.company import Step
 from models.shift import Shift
 
@@ -37,6 +37,8 @@ class Stall(BaseModel):
     updatedBy: str = None
     createdAt: str = None
     updatedAt: str = None
+    version: int = None
+    period: int = None
 
 class UpdateStall(BaseModel):
     """Update stall model."""
@@ -54,16 +56,30 @@ class UpdateStallWorker(BaseModel):
     jump: int
 
 class GetStalls(BaseModel):
-    """Get stalls model."""
-    months: List[str]
-    years: List[str]
+    """Get stalls model. `from`/`to` (yyyy-mm) select a range of months instead."""
+    months: List[str] = []
+    years: List[str] = []
     types: List[str]
     customerId: str = None
+    from_: str = Field(default=None, alias="from")
+    to: str = None
     
 class GetOnlyStalls(BaseModel):
-    """Get only stalls model."""
-    months: List[str]
-    years: List[str]
+    """Get only stalls model. `from`/`to` (yyyy-mm) select a range of months instead."""
+    months: List[str] = []
+    years: List[str] = []
+    from_: str = Field(default=None, alias="from")
+    to: str = None
+
+class RolloverStalls(BaseModel):
+    """Rollover stalls model."""
+    fromMonth: str
+    fromYear: str
+    toMonth: str
+    toYear: str
+    customerId: str = None
+    expandShifts: bool = False
+    shiftType: str = "shift"
 
 class StallsAndShifts(BaseModel):
     """Stalls and shifts model."""
@@ -46,7 +46,7 @@ async def get_company(company_id: str, token: str = Depends(oauth2_scheme)):
     token = decode_access_token(token)
     required_roles(token["roles"], ["super_admin"])
     # Find company
-    result = companies_services.get_company(company_id)
+    result = companies_services.get_company_with_arrays(company_id)
     result = company_entity(result)
     # Return
     return JSONResponse(status_code=status.HTTP_200_OK, content=result)
@@ -90,6 +90,24 @@ async def update_company(
     # Return
     return JSONResponse(status_code=status.HTTP_200_OK, content=result)
 
+@companies.put(
+    path="/{company_id}/arrays",
+    summary="Move the company arrays to their own collections",
+    description=
+    "This endpoint moves the sequences, positions, conventions and tags of a company out of "
+    "the company document into collections of the company database.",
+    status_code=200)
+async def externalize_arrays(company_id: str, token: str = Depends(oauth2_scheme)):
+    """Move the company arrays to their own collections."""
+    # Validations
+    token = decode_access_token(token)
+    required_roles(token["roles"], ["super_admin"])
+    # Move arrays
+    result = companies_services.externalize_arrays(company_id)
+    result = company_entity(result)
+    # Return
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+
 # Delete a company
 @companies.delete(
     path="/{company_id}",
@@ -1,6 +1,7 @@
 """Customers router module."""
 
-from fastapi import APIRouter, Depends, status
+from typing import List
+from fastapi import APIRouter, Depends, Query, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.encoders import jsonable_encoder
@@ -17,6 +18,7 @@ from schemas.customer import customer_entity, customer_entity_list
 from schemas.user import user_entity
 from utils.auth import decode_access_token
 from utils.roles import allowed_roles
+from utils.etags import tenants, tenant_etag, is_fresh, not_modified, etag_headers
 
 customers = APIRouter(
     prefix='/customers',
@@ -102,18 +104,53 @@ async def create_and_update_customers(
     summary="Find all customers",
     description="This endpoint returns all customers",
     status_code=200)
-async def get_all_customers(token: str = Depends(oauth2_scheme)) -> JSONResponse:
+async def get_all_customers(
+    request: Request, token: str = Depends(oauth2_scheme)) -> JSONResponse:
     """get all customers."""
     # Validations
     token = decode_access_token(token)
     allowed_roles(token["roles"], ["read_customers", "admin"])
+    # Conditional request
+    etag = tenant_etag(token["email"], "customers")
+    if is_fresh(request, etag):
+        return not_modified(etag)
     # Find all customers
     user = users_services.get_by_email(token["email"])
+    tenants[token["email"]] = user["company"]
     company = companies_services.get_company(user["company"])
     company_db = db_client[company["db"]]
     result = customers_services(company_db).get_all_customers(user["company"], user["customers"])
     result = customer_entity_list(result)
     # Return
+    return JSONResponse(
+        status_code=status.HTTP_200_OK, content=result, headers=etag_headers(etag))
+
+@customers.get(
+    path="/search",
+    summary="Search customers",
+    description=
+    "This endpoint searches customers by the start of their name words or identification, "
+    "accent and case insensitive, optionally filtered by tags, and pages with the cursor "
+    "returned as `next`.",
+    status_code=200)
+async def search_customers(
+    q: str = "",
+    tags: List[str] = Query(default=[]),
+    limit: int = 20,
+    after: str = None,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Search customers."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["read_customers", "admin"])
+    # Search customers
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = customers_services(company_db).search_customers(
+        user["company"], q, tags, limit, after, user["customers"])
+    result = {"customers": customer_entity_list(result["customers"]), "next": result["next"]}
+    # Return
     return JSONResponse(status_code=status.HTTP_200_OK, content=result)
 
 @customers.put(
@@ -0,0 +1,209 @@
+"""Jobs router module."""
+
+from typing import Callable
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordBearer
+from pymongo.database import Database
+from db.client import db_client
+from models.customer import CreateAndUpdate as CreateAndUpdateCustomers
+from models.stall import RolloverStalls
+from models.worker import CreateAndUpdate as CreateAndUpdateWorkers
+from routers.migrations import migrations_registry
+from schemas.job import job_entity, job_entity_list
+from services.companies import CompaniesServices
+from services.customers import CustomersServices
+from services.jobs import JobsServices, job_runner, Error as JobsError
+from services.logs import LogsServices
+from services.stalls import StallsServices
+from services.users import UsersServices
+from services.workers import WorkersServices
+from utils.auth import decode_access_token
+from utils.errorsResponses import errors
+from utils.roles import allowed_roles, required_roles
+
+jobs = APIRouter(prefix='/jobs', tags=['Jobs'], responses={404: {"description": "Not found"}})
+database = db_client["harmony"]
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+users_services = UsersServices(database)
+companies_services = CompaniesServices(database)
+jobs_services = JobsServices(database)
+
+# Handlers, run by the job runner in a thread with the tenant database.
+def import_workers(company_db: Database, job: dict, progress: Callable[[dict], None]) -> dict:
+    """Create and update the workers of an import."""
+    workers = job["payload"]["workers"]
+    progress({"phase": "importing", "done": 0, "total": len(workers)})
+    _ = WorkersServices(company_db).create_and_update_workers(
+        job["company"], workers, job["user"], progress)
+    return {"workers": len(workers)}
+
+def import_customers(company_db: Database, job: dict, progress: Callable[[dict], None]) -> dict:
+    """Create and update the customers of an import."""
+    customers = job["payload"]["customers"]
+    progress({"phase": "importing", "done": 0, "total": len(customers)})
+    _ = CustomersServices(company_db).create_and_update_customers(
+        job["company"], customers, job["user"], progress)
+    return {"customers": len(customers)}
+
+def rollover_stalls(company_db: Database, job: dict, progress: Callable[[dict], None]) -> dict:
+    """Copy the stalls of a month into another month."""
+    data, user = job["payload"], job["user"]
+    progress({"phase": "copying", "done": 0})
+    result = StallsServices(company_db).rollover_stalls(job["company"], data, user, progress)
+    message = (
+        f"El usuario {user['userName']} ha copiado {len(result['stalls'])} puestos "
+        f"del mes {data['fromMonth']}/{data['fromYear']} al mes {data['toMonth']}/{data['toYear']}")
+    _ = LogsServices(company_db).create_log({
+        "company": job["company"],
+        "user": user["email"],
+        "userName": user["userName"],
+        "type": "Puestos",
+        "message": message
+    })
+    return {"stalls": len(result["stalls"]), "shifts": len(result["shifts"])}
+
+def run_migration(company_db: Database, job: dict, progress: Callable[[dict], None]) -> dict:
+    """Run a migration, resuming from its checkpoint on retries."""
+    payload = job["payload"]
+    resume = payload["resume"] or job["attempts"] > 1
+    return migrations_registry(company_db)[payload["name"]](resume, progress)
+
+job_runner.register("workers_import", import_workers)
+job_runner.register("customers_import", import_customers)
+# A retry would skip the stalls a failed attempt already copied and leave them without shifts.
+job_runner.register("stalls_rollover", rollover_stalls, retry=False)
+job_runner.register("migration", run_migration)
+
+def queue(kind: str, user: dict, company: dict, payload: dict) -> JSONResponse:
+    """Queue a job for the company of a user."""
+    job = jobs_services.create_job(kind, user["company"], company["db"], user, payload)
+    job_runner.wake()
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_entity(job))
+
+@jobs.post(
+    path="/workers/import",
+    summary="Queue a workers import",
+    description="This endpoint queues the creation and update of workers as a background job.",
+    status_code=202)
+async def queue_workers_import(
+    data: CreateAndUpdateWorkers,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Queue a workers import."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_workers", "admin"])
+    # Queue job
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    return queue("workers_import", user, company, jsonable_encoder(data))
+
+@jobs.post(
+    path="/customers/import",
+    summary="Queue a customers import",
+    description="This endpoint queues the creation and update of customers as a background job.",
+    status_code=202)
+async def queue_customers_import(
+    data: CreateAndUpdateCustomers,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Queue a customers import."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_customers", "admin"])
+    # Queue job
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    return queue("customers_import", user, company, jsonable_encoder(data))
+
+@jobs.post(
+    path="/stalls/rollover",
+    summary="Queue a stalls rollover",
+    description=
+    "This endpoint queues the copy of the stalls of a month into another month as a "
+    "background job.",
+    status_code=202)
+async def queue_stalls_rollover(
+    data: RolloverStalls,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Queue a stalls rollover."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_stalls", "admin"])
+    # Queue job
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    return queue("stalls_rollover", user, company, jsonable_encoder(data))
+
+@jobs.post(
+    path="/migrations/{name}",
+    summary="Queue a migration",
+    description="This endpoint queues a migration of the company database as a background job.",
+    status_code=202)
+async def queue_migration(
+    name: str,
+    resume: bool = True,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Queue a migration."""
+    # Validations
+    token = decode_access_token(token)
+    required_roles(token["roles"], ["super_admin"])
+    # Queue job
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    if name not in migrations_registry(db_client[company["db"]]):
+        raise errors["Update error"]
+    return queue("migration", user, company, {"name": name, "resume": resume})
+
+@jobs.get(
+    path="",
+    summary="Find the latest jobs",
+    description="This endpoint returns the latest jobs of the company, newest first.",
+    status_code=200)
+async def get_jobs(token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Find the latest jobs."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_workers", "handle_customers", "handle_stalls", "admin"])
+    # Find jobs
+    user = users_services.get_by_email(token["email"])
+    result = job_entity_list(jobs_services.get_jobs(user["company"]))
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@jobs.get(
+    path="/{job_id}",
+    summary="Find a job",
+    description="This endpoint returns the state, progress and result of a job.",
+    status_code=200)
+async def get_job(job_id: str, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Find a job."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_workers", "handle_customers", "handle_stalls", "admin"])
+    # Find job
+    user = users_services.get_by_email(token["email"])
+    try:
+        result = job_entity(jobs_services.get_job(user["company"], job_id))
+    except JobsError as exception:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exception))
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@jobs.delete(
+    path="/{job_id}",
+    summary="Cancel a job",
+    description=
+    "This endpoint cancels a queued job, or asks a running one to stop at its next "
+    "progress report.",
+    status_code=200)
+async def cancel_job(job_id: str, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Cancel a job."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_workers", "handle_customers", "handle_stalls", "admin"])
+    # Cancel job
+    user = users_services.get_by_email(token["email"])
+    try:
+        result = job_entity(jobs_services.cancel_job(user["company"], job_id))
+    except JobsError as exception:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exception))
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
@@ -0,0 +1,32 @@
+"""Metrics router module."""
+
+import os
+import secrets
+from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from utils.metrics import registry
+
+metrics = APIRouter(
+    prefix='/metrics',
+    tags=['Metrics'],
+    responses={404: {"description": "Not found"}})
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Get metrics
+@metrics.get(
+    path='',
+    summary='Get metrics',
+    description='Get the process metrics in the Prometheus text format. '
+    'Requires the METRICS_TOKEN bearer token',
+    response_class=PlainTextResponse,
+    status_code=200)
+async def get_metrics(request: Request) -> PlainTextResponse:
+    """Get metrics."""
+    # Validations: the metrics stay private until a scrape token is configured
+    header = request.headers.get("authorization", "")
+    if not METRICS_TOKEN or not secrets.compare_digest(header, f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    # Return
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,64 @@
+"""Migrations router module."""
+
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordBearer
+from pymongo.database import Database
+from db.client import db_client
+from services.users import UsersServices
+from services.companies import CompaniesServices
+from services.shifts import ShiftsServices
+from services.stalls import StallsServices
+from services.shift_buckets import shifts_storage, BucketedShiftsServices
+from services.workers import WorkersServices
+from services.customers import CustomersServices
+from services.archive import ArchiveServices
+from utils.auth import decode_access_token
+from utils.roles import required_roles
+from utils.errorsResponses import errors
+
+migrations = APIRouter(
+    prefix='/migrations',
+    tags=['Migrations'],
+    responses={404: {"description": "Not found"}})
+database = db_client["harmony"]
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+users_services = UsersServices(database)
+companies_services = CompaniesServices(database)
+def migrations_registry(company_db: Database) -> dict:
+    """Migrations available for a company database."""
+    return {
+        "shifts_model": shifts_storage(company_db).update_model,
+        "workers_search": WorkersServices(company_db).update_search_model,
+        "customers_search": CustomersServices(company_db).update_search_model,
+        "shifts_period": ShiftsServices(company_db).update_periods,
+        "stalls_period": StallsServices(company_db).update_periods,
+        "shifts_v2": ShiftsServices(company_db).compact_model,
+        "shift_buckets": BucketedShiftsServices(company_db).import_shifts,
+        "archive": ArchiveServices(company_db).migrate,
+    }
+
+# Runs a registered migration inline; long ones are better queued through /jobs/migrations.
+@migrations.put(
+    path='/{name}',
+    summary='Run a migration',
+    description='Run or resume a migration on the company database and return its stats',
+    status_code=200)
+async def run_migration(
+    name: str,
+    resume: bool = True,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Run a migration."""
+    # Validations
+    token = decode_access_token(token)
+    required_roles(token["roles"], ["super_admin"])
+    # Run migration
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    registry = migrations_registry(company_db)
+    if name not in registry:
+        raise errors["Update error"]
+    result = registry[name](resume)
+    # Return
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
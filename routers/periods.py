@@ -0,0 +1,146 @@
+"""Periods router module."""
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi.security import OAuth2PasswordBearer
+from pymongo.database import Database
+from db.client import db_client
+from models.period import ClosePeriod
+from models.websocket import WebsocketResponse
+from schemas.period import period_entity, periods_entity
+from services.companies import CompaniesServices
+from services.logs import LogsServices
+from services.periods import PeriodsServices
+from services.users import UsersServices
+from services.websocket import manager
+from utils.auth import decode_access_token
+from utils.periods import parse_period
+from utils.roles import allowed_roles
+from utils.snapshots import snapshot_response
+
+periods = APIRouter(
+    prefix='/periods',
+    tags=['Periods'],
+    responses={404: {"description": "Not found"}})
+database = db_client["harmony"]
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+companies_services = CompaniesServices(database)
+users_services = UsersServices(database)
+def periods_services(company_db: Database):
+    """Periods services."""
+    return PeriodsServices(company_db)
+def logs_services(company_db: Database):
+    """Logs services."""
+    return LogsServices(company_db)
+
+@periods.post(
+    path="/close",
+    summary="Close a period",
+    description=
+    "This endpoint freezes the stalls and shifts of a month, writes their snapshots and "
+    "rejects further writes to it.",
+    status_code=201)
+async def close_period(data: ClosePeriod, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Close a period."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["admin"])
+    # Close period
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = periods_services(company_db).close_period(
+        user["company"], data.month, data.year, user)
+    result = period_entity(result)
+    # Websocket
+    message = WebsocketResponse(
+        event="period_closed",
+        data=result,
+        userName=user["userName"],
+        company=user["company"])
+    await manager.broadcast(message)
+    # Log
+    _ = logs_services(company_db).create_log({
+        "company": user["company"],
+        "user": user["email"],
+        "userName": user["userName"],
+        "type": "Periodos",
+        "message": f"El usuario {user['userName']} ha cerrado el periodo "
+                   f"{data.month}/{data.year}."
+    })
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content=result)
+
+@periods.get(
+    path="",
+    summary="Find the closed periods",
+    description="This endpoint returns the closed periods and their snapshots.",
+    status_code=200)
+async def get_closed_periods(token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Find the closed periods."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["admin", "read_stalls", "read_shifts"])
+    # Find closed periods
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = periods_entity(periods_services(company_db).get_closed_periods())
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+
+@periods.get(
+    path="/{period}/{kind}",
+    summary="Get a closed period snapshot",
+    description=
+    "This endpoint returns the stalls or the shifts of a closed period (2024-01 or 202401) "
+    "as they were when it was closed, gzip encoded when the client accepts it.",
+    status_code=200)
+async def get_snapshot(
+    period: str,
+    kind: str,
+    request: Request,
+    token: str = Depends(oauth2_scheme)) -> Response:
+    """Get a closed period snapshot."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["admin", f"read_{kind}"])
+    # Find snapshot
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    snapshot = periods_services(company_db).snapshot(parse_period(period), kind)
+    if not snapshot:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Snapshot not found")
+    return snapshot_response(request, *snapshot)
+
+@periods.delete(
+    path="/{period}",
+    summary="Reopen a period",
+    description="This endpoint reopens a closed period and deletes its snapshots.",
+    status_code=200)
+async def reopen_period(period: str, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Reopen a period."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["admin"])
+    # Reopen period
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = period_entity(periods_services(company_db).reopen_period(parse_period(period)))
+    # Websocket
+    message = WebsocketResponse(
+        event="period_reopened",
+        data=result,
+        userName=user["userName"],
+        company=user["company"])
+    await manager.broadcast(message)
+    # Log
+    _ = logs_services(company_db).create_log({
+        "company": user["company"],
+        "user": user["email"],
+        "userName": user["userName"],
+        "type": "Periodos",
+        "message": f"El usuario {user['userName']} ha reabierto el periodo "
+                   f"{result['month']}/{result['year']}."
+    })
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
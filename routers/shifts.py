@@ -1,38 +1,46 @@
 """Shifts router module."""
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.encoders import jsonable_encoder
 from pymongo.database import Database
 from db.client import db_client
-from schemas.stall import stall_entity
+from schemas.stall import stall_entity, changes_entity
 from schemas.shift import shift_entity
 from services.users import UsersServices
 from services.companies import CompaniesServices
-from services.shifts import ShiftsServices
+from services.shift_buckets import shifts_storage
 from services.stalls import StallsServices
 # from services.websocket import manager
 from services.logs import LogsServices
-from models.shift import GetShifts, CreateShifts, UpdateShifts, DeleteShifts
+from services.periods import PeriodsServices
+from models.shift import GetShifts, SyncShifts, CreateShifts, UpdateShifts, DeleteShifts
 # from models.websocket import WebsocketResponse
 from utils.auth import decode_access_token
+from utils.result_cache import ResultKey, read_periods, results, single_period
 from utils.roles import allowed_roles
+from utils.singleflight import SingleFlight, serialize
+from utils.snapshots import snapshot_response
 
 shifts = APIRouter(prefix='/shifts', tags=['Shifts'], responses={404: {"description": "Not found"}})
 database = db_client["harmony"]
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 users_services = UsersServices(database)
 companies_services = CompaniesServices(database)
+month_reads = SingleFlight("shifts_by_months")
 def stalls_services(company_db: Database):
     """Stalls services."""
     return StallsServices(company_db)
 def shifts_services(company_db: Database):
     """Shifts services."""
-    return ShiftsServices(company_db)
+    return shifts_storage(company_db)
 def logs_services(company_db: Database):
     """Logs services."""
     return LogsServices(company_db)
+def periods_services(company_db: Database):
+    """Periods services."""
+    return PeriodsServices(company_db)
 
 @shifts.post(path='', summary='Create shifts', description='Create shifts', status_code=201)
 async def create_shifts(data: CreateShifts , token: str = Depends(oauth2_scheme)) -> JSONResponse:
@@ -73,6 +81,7 @@ async def create_shifts(data: CreateShifts , token: str = Depends(oauth2_scheme)
     status_code=200)
 async def get_shifts(
     data: GetShifts,
+    request: Request,
     token: str = Depends(oauth2_scheme)) -> JSONResponse:
     """Get shifts."""
     # Validations
@@ -82,12 +91,56 @@ async def get_shifts(
     user = users_services.get_by_email(token["email"])
     company = companies_services.get_company(user["company"])
     company_db = db_client[company["db"]]
+    # Month reads don't depend on the user beyond the tenant, so they are cached per tenant
+    # and identical concurrent requests of a company share one query and its serialized body.
+    key = ResultKey(
+        company["db"], ("shifts",), read_periods(data.months, data.years, data.from_, data.to),
+        types=tuple(sorted(data.types)))
+    if single_period(key.periods) is not None:
+        snapshot = periods_services(company_db).snapshot(
+            single_period(key.periods), "shifts", data.types)
+        if snapshot:
+            return snapshot_response(request, *snapshot)
+    content = results.get(key)
+    if content is None:
+        content = await month_reads.do(
+            key, results.load, key, read_shifts, company_db, user["company"], data)
+    return Response(status_code=200, content=content, media_type="application/json")
+
+def read_shifts(company_db: Database, company: str, data: GetShifts) -> bytes:
+    """Read and serialize the shifts of some months."""
     result = shifts_services(company_db).get_shifts_by_month_and_year(
+        company,
+        data.months,
+        data.years,
+        data.types,
+        data.from_,
+        data.to)
+    return serialize([shift_entity(shift) for shift in result])
+
+@shifts.post(
+    path='/sync',
+    summary='Sync shifts',
+    description='Get the shifts and stalls changed or deleted after a change version',
+    status_code=200)
+async def sync_shifts(
+    data: SyncShifts,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Sync shifts."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["admin", "read_shifts", "handle_shifts"])
+    # Get changes
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = shifts_services(company_db).get_changes(
         user["company"],
+        data.since,
         data.months,
         data.years,
         data.types)
-    result = [shift_entity(shift) for shift in result]
+    result = changes_entity(result)
     return JSONResponse(status_code=200, content=result)
 
 @shifts.put(path='', summary='Update shifts', description='Update shifts', status_code=200)
@@ -157,23 +210,3 @@ async def delete_shifts(
         "message": message,
         })
     return JSONResponse(status_code=200, content=result)
-
-# UpdateModel (use carefully)
-# @shifts.put(
-#     path='/updateModel',
-#     summary='Update shifts model',
-#     description='Update shifts model',
-#     status_code=200)
-# async def update_shifts_model(token: str = Depends(oauth2_scheme)) -> JSONResponse:
-#     """Update shifts model."""
-#     print("update_shifts_model")
-#     # Validations
-#     token = decode_access_token(token)
-#     allowed_roles(token["roles"], ["super_admin"])
-#     # Update shifts model
-#     user = users_services.get_by_email(token["email"])
-#     company = companies_services.get_company(user["company"])
-#     company_db = db_client[company["db"]]
-#     _ = shifts_services(company_db).update_model()
-#     return JSONResponse(status_code=200, content={
-    # "message": "Shifts model updated successfully."})
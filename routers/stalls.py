@@ -1,6 +1,6 @@
 """Stalls router module."""
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.encoders import jsonable_encoder
@@ -12,18 +12,25 @@ from services.stalls import StallsServices
 from services.websocket import manager
 from services.workers import WorkersServices
 from services.logs import LogsServices
+from services.periods import PeriodsServices
 from models.shift import DeleteShifts
-from models.stall import GetOnlyStalls, GetStalls, Stall, StallWorker, UpdateStall, UpdateStallWorker
+from models.stall import (
+    GetOnlyStalls, GetStalls, Stall, StallWorker, UpdateStall, UpdateStallWorker, RolloverStalls)
 from models.websocket import WebsocketResponse
-from schemas.stall import stall_entity, stalls_entity, stalls_and_shifts
+from schemas.stall import stall_entity, stalls_entity, stalls_and_shifts, calendar_entity
 from utils.auth import decode_access_token
+from utils.result_cache import ResultKey, read_periods, results, single_period
 from utils.roles import allowed_roles
+from utils.singleflight import SingleFlight, serialize
+from utils.snapshots import snapshot_response
 
 stalls = APIRouter(prefix='/stalls', tags=['Stalls'], responses={404: {"description": "Not found"}})
 database = db_client["harmony"]
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 companies_services = CompaniesServices(database)
 users_services = UsersServices(database)
+customer_reads = SingleFlight("stalls_by_customer")
+month_reads = SingleFlight("stalls_by_months")
 def stalls_services(company_db: Database):
     """Stalls services."""
     return StallsServices(company_db)
@@ -33,6 +40,9 @@ def workers_services(company_db: Database):
 def logs_services(company_db: Database):
     """Logs services."""
     return LogsServices(company_db)
+def periods_services(company_db: Database):
+    """Periods services."""
+    return PeriodsServices(company_db)
 
 
 @stalls.post(
@@ -88,9 +98,44 @@ async def get_customer_stalls(data: GetStalls, token: str = Depends(oauth2_schem
     user = users_services.get_by_email(token["email"])
     company = companies_services.get_company(user["company"])
     company_db = db_client[company["db"]]
+    # Cached per tenant, and identical concurrent requests of a company share one query
+    key = ResultKey(
+        company["db"], ("stalls", "shifts"),
+        read_periods(data.months, data.years, data.from_, data.to),
+        data.customerId, tuple(sorted(data.types)))
+    content = results.get(key)
+    if content is None:
+        content = await customer_reads.do(
+            key, results.load, key, read_customer_stalls, company_db, user["company"], data)
+    return Response(status_code=status.HTTP_200_OK, content=content, media_type="application/json")
+
+def read_customer_stalls(company_db: Database, company: str, data: GetStalls) -> bytes:
+    """Read and serialize the stalls and shifts of a customer."""
     result = stalls_services(company_db).get_customer_stalls(
-        user["company"], data.customerId, data.months, data.years, data.types)
-    result = stalls_and_shifts(result["stalls"], result["shifts"])
+        company, data.customerId, data.months, data.years, data.types,
+        data.from_, data.to)
+    return serialize(stalls_and_shifts(result["stalls"], result["shifts"]))
+
+@stalls.post(
+    path="/calendar",
+    summary="Find the calendar of a customer",
+    description=
+    "This endpoint returns the stalls of a customer, their shifts grouped by stall, worker and "
+    "day, and the workers they reference.",
+    status_code=200)
+async def get_calendar(data: GetStalls, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Find the calendar of a customer."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["read_stalls", "admin"])
+    # Find calendar
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = stalls_services(company_db).get_calendar(
+        user["company"], data.customerId, data.months, data.years, data.types,
+        data.from_, data.to)
+    result = calendar_entity(result)
     return JSONResponse(status_code=status.HTTP_200_OK, content=result)
 
 @stalls.post(
@@ -99,7 +144,9 @@ async def get_customer_stalls(data: GetStalls, token: str = Depends(oauth2_schem
     description="This endpoint returns all stalls",
     status_code=200)
 async def get_customers_stalls(
-    data: GetOnlyStalls, token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    data: GetOnlyStalls,
+    request: Request,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
     """Find all stalls."""
     # Validations
     token = decode_access_token(token)
@@ -108,9 +155,63 @@ async def get_customers_stalls(
     user = users_services.get_by_email(token["email"])
     company = companies_services.get_company(user["company"])
     company_db = db_client[company["db"]]
-    result = stalls_services(company_db).get_stalls(data.months, data.years)
-    result = stalls_entity(result)
-    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+    key = ResultKey(
+        company["db"], ("stalls",), read_periods(data.months, data.years, data.from_, data.to))
+    if single_period(key.periods) is not None:
+        snapshot = periods_services(company_db).snapshot(single_period(key.periods), "stalls")
+        if snapshot:
+            return snapshot_response(request, *snapshot)
+    content = results.get(key)
+    if content is None:
+        content = await month_reads.do(key, results.load, key, read_stalls, company_db, data)
+    return Response(status_code=status.HTTP_200_OK, content=content, media_type="application/json")
+
+def read_stalls(company_db: Database, data: GetOnlyStalls) -> bytes:
+    """Read and serialize the stalls of some months."""
+    result = stalls_services(company_db).get_stalls(
+        data.months, data.years, data.from_, data.to)
+    return serialize(stalls_entity(result))
+
+@stalls.post(
+    path="/rollover",
+    summary="Copy the stalls of a month into another month",
+    description=
+    "This endpoint copies the stalls of a customer, or of the whole company, with their workers "
+    "into the target month and optionally creates the shifts from the workers sequences.",
+    status_code=201)
+async def rollover_stalls(data: RolloverStalls, token: str = Depends(oauth2_scheme)):
+    """Copy the stalls of a month into another month."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["handle_stalls", "admin"])
+    # Encode rollover
+    data = jsonable_encoder(data)
+    # Copy stalls
+    user = users_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = stalls_services(company_db).rollover_stalls(user["company"], data, user)
+    result = stalls_and_shifts(result["stalls"], result["shifts"])
+    # Websocket
+    message = WebsocketResponse(
+        event="stalls_created",
+        data=result["stalls"],
+        userName=user["userName"],
+        company=user["company"])
+    await manager.broadcast(message)
+    # Log
+    message = (
+        f"El usuario {user['userName']} ha copiado {len(result['stalls'])} puestos "
+        f"del mes {data['fromMonth']}/{data['fromYear']} al mes {data['toMonth']}/{data['toYear']}")
+    _ = logs_services(company_db).create_log({
+        "company": user["company"],
+        "user": user["email"],
+        "userName": user["userName"],
+        "type": "Puestos",
+        "message": message
+    })
+    # Return
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content=result)
 
 @stalls.put(
     path="/{stall_id}",
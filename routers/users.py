@@ -1,6 +1,6 @@
 """Users router module."""
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.encoders import jsonable_encoder
@@ -12,6 +12,7 @@ from schemas.user import user_entity, user_entity_list
 from utils.auth import decode_access_token
 from utils.roles import required_roles
 from utils.errorsResponses import errors
+from utils.etags import tenants, tenant_etag, is_fresh, not_modified, etag_headers
 from services.companies import CompaniesServices
 from services.websocket import manager
 from services.users import UsersServices
@@ -81,15 +82,21 @@ async def login(data: Login):
     summary="Get user by token",
     description="This endpoint returns a user by token.",
     status_code=200)
-async def get_by_profile(token: str = Depends(oauth2_scheme)):
+async def get_by_profile(request: Request, token: str = Depends(oauth2_scheme)):
     """Get user by token."""
     # Get token data
     token = decode_access_token(token)
+    # Conditional request
+    etag = tenant_etag(token["email"], "company")
+    if is_fresh(request, etag):
+        return not_modified(etag)
     # Get profile
     result = user_services.get_profile(token["email"])
     result = user_entity(result)
+    tenants[token["email"]] = result["company"]["id"]
     # Return
-    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK, content=result, headers=etag_headers(etag))
 
 @users.get(
     path="/company/{company}",
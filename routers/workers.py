@@ -92,6 +92,32 @@ async def create_and_update_workers(
     # Return
     return JSONResponse(status_code=status.HTTP_201_CREATED, content="Workers created")
 
+@workers.get(
+    path="/search",
+    summary="Search workers by name or identification",
+    description=
+    "This endpoint searches workers by the start of their name words or identification, "
+    "accent and case insensitive, and pages with the cursor returned as `next`.",
+    status_code=200)
+async def search_workers(
+    q: str = "",
+    limit: int = 20,
+    after: str = None,
+    token: str = Depends(oauth2_scheme)) -> JSONResponse:
+    """Search workers by name or identification."""
+    # Validations
+    token = decode_access_token(token)
+    allowed_roles(token["roles"], ["read_workers", "admin"])
+    # Search workers
+    user = user_services.get_by_email(token["email"])
+    company = companies_services.get_company(user["company"])
+    company_db = db_client[company["db"]]
+    result = workers_services(company_db).search_workers(
+        user["company"], q, limit, after, user["workers"])
+    result = {"workers": worker_entity_list(result["workers"]), "next": result["next"]}
+    # Return
+    return JSONResponse(status_code=status.HTTP_200_OK, content=result)
+
 @workers.get(
     path="/{search}/{limit}/{skip}",
     summary="Find workers by name or identification",
@@ -0,0 +1,23 @@
+"""Job schemas module."""
+
+def job_entity(job) -> dict:
+    """Job entity."""
+    return {
+        "id": str(job["_id"]),
+        "kind": job["kind"],
+        "state": job["state"],
+        "attempts": job["attempts"],
+        "maxAttempts": job["maxAttempts"],
+        "cancelRequested": job["cancelRequested"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+        "userName": job["user"]["userName"],
+        "createdAt": job["createdAt"],
+        "startedAt": job.get("startedAt"),
+        "finishedAt": job.get("finishedAt")
+    }
+
+def job_entity_list(jobs) -> list:
+    """Job entity list."""
+    return [job_entity(job) for job in jobs]
@@ -0,0 +1,17 @@
+"""Period schemas module."""
+
+def period_entity(record) -> dict:
+    """Closed period entity."""
+    return {
+        "period": record["_id"],
+        "month": record["month"],
+        "year": record["year"],
+        "state": record["state"],
+        "snapshots": record.get("snapshots", {}),
+        "closedBy": record["closedBy"],
+        "closedAt": record["closedAt"]
+    }
+
+def periods_entity(records) -> list:
+    """Closed periods entity."""
+    return [period_entity(record) for record in records]
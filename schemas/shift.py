@@ -26,7 +26,10 @@ def shift_entity(shift) -> dict:
         "createdBy": shift["createdBy"],
         "updatedBy": shift["updatedBy"],
         "createdAt": shift["createdAt"],
-        "updatedAt": shift["updatedAt"]
+        "updatedAt": shift["updatedAt"],
+        "version": shift.get("version", 0),
+        "period": shift.get("period"),
+        "date": shift["date"].strftime("%Y-%m-%d") if shift.get("date") else None
     }
 
 def shifts_entity(shifts) -> list:
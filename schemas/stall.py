@@ -1,6 +1,7 @@
 """Stall schemas."""
 
 from schemas.shift import shift_entity
+from schemas.worker import worker_entity
 
 def stall_entity(stall) -> dict:
     """Stall entity."""
@@ -20,7 +21,9 @@ def stall_entity(stall) -> dict:
         "createdBy": stall["createdBy"],
         "updatedBy": stall["updatedBy"],
         "createdAt": stall["createdAt"],
-        "updatedAt": stall["updatedAt"]
+        "updatedAt": stall["updatedAt"],
+        "version": stall.get("version", 0),
+        "period": stall.get("period")
     }
 
 def stalls_entity(stalls) -> dict:
@@ -33,3 +36,29 @@ def stalls_and_shifts(stalls, shifts) -> dict:
         "stalls": [stall_entity(stall) for stall in stalls],
         "shifts": [shift_entity(shift) for shift in shifts]
     }
+
+def changes_entity(changes) -> dict:
+    """Changes entity."""
+    return {
+        "version": changes["version"],
+        "stalls": [stall_entity(stall) for stall in changes["stalls"]],
+        "shifts": [shift_entity(shift) for shift in changes["shifts"]],
+        "deleted": changes["deleted"]
+    }
+
+def calendar_entity(stalls) -> dict:
+    """Calendar entity: stalls, shifts grouped by stall, worker and day, and workers."""
+    shifts = {}
+    workers = {}
+    for stall in stalls:
+        stall_shifts = shifts.setdefault(str(stall["_id"]), {})
+        for shift in stall["shifts"]:
+            worker_shifts = stall_shifts.setdefault(shift["worker"], {})
+            worker_shifts.setdefault(shift["day"], []).append(shift_entity(shift))
+        for worker in stall["workerRecords"]:
+            workers[str(worker["_id"])] = worker_entity(worker)
+    return {
+        "stalls": [stall_entity(stall) for stall in stalls],
+        "shifts": shifts,
+        "workers": list(workers.values())
+    }
@@ -0,0 +1,221 @@
+"""Archive services module."""
+
+import datetime
+import os
+import threading
+import time
+from itertools import chain
+from typing import Callable, Dict, Iterable, List
+import pytz
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, PyMongoError
+from db.indexes import ensure_indexes
+from utils.metrics import registry
+from utils.periods import parse_period, period, periods_of
+
+# Months kept in the hot collections before the current one. Unset or 0 disables the mover.
+ARCHIVE_HORIZON_MONTHS = int(os.getenv("ARCHIVE_HORIZON_MONTHS", "0"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "50"))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", "0.2"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVED_COLLECTIONS = ["shifts", "shift_buckets", "stalls"]
+
+archived_documents = registry.counter(
+    "archive_documents_total", "Documents moved to the archive collections.", ("collection",))
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class ArchiveHorizons():
+    """
+    First hot period of every tenant database. Older periods live in the `<collection>_archive`
+    collections. Read from the `archive` collection once per process and raised by the mover.
+    """
+    def __init__(self) -> None:
+        self.horizons: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def before(self, database: Database) -> int:
+        """
+        First hot period of a tenant, or 0 if nothing was archived.
+        Args:
+            database (Database): Tenant database.
+        Returns:
+            int: Period.
+        Raises:
+            Exception: If there's an error reading the horizon.
+        """
+        horizon = self.horizons.get(database.name)
+        if horizon is not None:
+            return horizon
+        try:
+            state = database.archive.find_one({"_id": "horizon"})
+        except PyMongoError as exception:
+            raise Error(f"Error reading archive horizon: {exception}") from exception
+        with self._lock:
+            return self.horizons.setdefault(database.name, state["before"] if state else 0)
+
+    def raise_to(self, database: Database, before: int) -> int:
+        """Move the horizon of a tenant forward, never back."""
+        try:
+            database.archive.update_one(
+                {"_id": "horizon"}, {"$max": {"before": before}}, upsert=True)
+            before = database.archive.find_one({"_id": "horizon"})["before"]
+        except PyMongoError as exception:
+            raise Error(f"Error saving archive horizon: {exception}") from exception
+        with self._lock:
+            self.horizons[database.name] = before
+        return before
+
+archive_horizons = ArchiveHorizons()
+
+def tiers(
+    database: Database,
+    collection: str,
+    months: List[str] = None,
+    years: List[str] = None,
+    start: str = None,
+    end: str = None) -> List[str]:
+    """Collections holding the periods of a read: the hot one, plus its archive if needed."""
+    before = archive_horizons.before(database)
+    if not before:
+        return [collection]
+    if start is not None or end is not None:
+        historical = start is None or parse_period(start) < before
+    else:
+        historical = any(value < before for value in periods_of(months or [], years or []))
+    return [collection, f"{collection}_archive"] if historical else [collection]
+
+def find_tiered(
+    database: Database,
+    collections: List[str],
+    query: dict,
+    projection: dict = None) -> Iterable[dict]:
+    """
+    Find documents in some tiers. A document being moved can be in both for a moment,
+    so it's only returned once.
+    """
+    if len(collections) == 1:
+        return database[collections[0]].find(query, projection)
+    return unique(chain.from_iterable(
+        database[collection].find(query, projection) for collection in collections))
+
+def unique(documents: Iterable[dict]) -> Iterable[dict]:
+    """Drop repeated ids."""
+    seen = set()
+    for document in documents:
+        if document["_id"] not in seen:
+            seen.add(document["_id"])
+            yield document
+
+def horizon_period(months: int) -> int:
+    """Period `months` before the current month."""
+    today = datetime.datetime.now(pytz.timezone("America/Bogota"))
+    index = today.year * 12 + today.month - 1 - months
+    return period(index % 12 + 1, index // 12)
+
+class ArchiveServices():
+    """
+    Archive services class.
+    Moves the shifts, shift buckets and stalls of the periods before the horizon into
+    `<collection>_archive` collections, so the hot indexes only cover recent months. The
+    horizon is raised before anything moves, which rejects writes to those periods and makes
+    reads of them look in both tiers. Documents are copied before they are deleted and
+    copies already in the archive are skipped, so an interrupted run just resumes.
+    """
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def archive(
+        self,
+        months: int = ARCHIVE_HORIZON_MONTHS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        max_batches: int = ARCHIVE_MAX_BATCHES,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Move old documents to the archive, a bounded number per collection by default.
+        Args:
+            months (int): Months kept before the current one.
+            batch_size (int): Documents per batch.
+            max_batches (int): Batches per collection in this run, or None for all of them.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Horizon and documents moved per collection.
+        Raises:
+            Exception: If there's an error moving the documents.
+        """
+        if months <= 0:
+            raise Error("Archive horizon not configured")
+        try:
+            before = archive_horizons.raise_to(self.database, horizon_period(months))
+            stats = {"before": before}
+            for collection in ARCHIVED_COLLECTIONS:
+                ensure_indexes(self.database, f"{collection}_archive")
+                stats[collection] = 0
+                batches = 0
+                while max_batches is None or batches < max_batches:
+                    moved = self._move(collection, before, batch_size)
+                    batches += 1
+                    stats[collection] += moved
+                    if progress:
+                        progress(dict(stats, collection=collection))
+                    if moved < batch_size:
+                        break
+                    time.sleep(ARCHIVE_PAUSE)
+            return stats
+        except PyMongoError as exception:
+            raise Error(f"Error archiving documents: {exception}") from exception
+
+    def migrate(self, resume: bool = True, progress: Callable[[dict], None] = None) -> dict:
+        """
+        Move every document older than the horizon to the archive, as a migration. Moves
+        are idempotent, so every run resumes.
+        Args:
+            resume (bool): Unused, runs always resume.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Horizon and documents moved per collection.
+        Raises:
+            Exception: If there's an error moving the documents.
+        """
+        _ = resume
+        return self.archive(max_batches=None, progress=progress)
+
+    def _move(self, collection: str, before: int, batch_size: int) -> int:
+        """Move one batch of documents older than the horizon."""
+        documents = list(self.database[collection].find(
+            {"period": {"$lt": before}}).sort("_id", 1).limit(batch_size))
+        if not documents:
+            return 0
+        try:
+            self.database[f"{collection}_archive"].insert_many(documents, ordered=False)
+        except BulkWriteError as exception:
+            if any(error["code"] != 11000 for error in exception.details["writeErrors"]):
+                raise
+        self.database[collection].delete_many(
+            {"_id": {"$in": [document["_id"] for document in documents]}})
+        archived_documents.inc(collection, amount=len(documents))
+        return len(documents)
+
+def move_all(client: MongoClient) -> None:
+    """Archive every tenant database, forever, in bounded runs."""
+    while True:
+        try:
+            companies = client["harmony"].companies.find({}, {"db": 1})
+            tenants = [company["db"] for company in companies if company.get("db")]
+        except PyMongoError as exception:
+            print(f"Error listing tenants to archive: {exception}")
+            tenants = []
+        for tenant in tenants:
+            try:
+                ArchiveServices(client[tenant]).archive()
+            except Error as exception:
+                print(f"Error archiving {tenant}: {exception}")
+        time.sleep(ARCHIVE_INTERVAL)
+
+def start_mover(client: MongoClient) -> None:
+    """Run the archive mover in a background thread when a horizon is configured."""
+    if ARCHIVE_HORIZON_MONTHS > 0:
+        threading.Thread(target=move_all, args=(client,), daemon=True).start()
@@ -1,10 +1,12 @@
 """CFields services module."""
 
+from pymongo import ReturnDocument
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 from models.company import Company, Field
-from .companies import CompaniesServices
+from utils.etags import versions
+from .company_arrays import load_arrays, company_exists
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -27,13 +29,16 @@ class CFieldsServices():
         """
         try:
             field["id"] = str(ObjectId())
-            if self.database.companies.find_one(
-                {"_id": ObjectId(company_id), "customerFields.name": field["name"]}):
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "customerFields.name": {"$ne": field["name"]}},
+                {"$push": {"customerFields": field}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                if not company_exists(self.database, company_id):
+                    raise Error("Company not found")
                 raise Error("Field already exists")
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$push": {"customerFields": field}})
-            company = CompaniesServices(self.database).get_company(company_id)
-            return company
+            versions.bump("company", company_id)
+            return load_arrays(self.database, company)
         except PyMongoError as exception:
             raise Error(f"Error adding customer field: {exception}") from exception
 
@@ -51,11 +56,15 @@ class CFieldsServices():
         """
         try:
             field["id"] = field_id
-            self.database.companies.update_one(
+            company = self.database.companies.find_one_and_update(
                 {"_id": ObjectId(company_id), "customerFields.id": field_id},
-                {"$set": {"customerFields.$": field}})
-            company = CompaniesServices(self.database).get_company(company_id)
-            return company
+                {"$set": {"customerFields.$[item]": field}},
+                array_filters=[{"item.id": field_id}],
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Field not found")
+            versions.bump("company", company_id)
+            return load_arrays(self.database, company)
         except PyMongoError as exception:
             raise Error(f"Error updating customer field: {exception}") from exception
 
@@ -71,10 +80,14 @@ class CFieldsServices():
             Exception: If there's an error updating the company.
         """
         try:
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$pull": {"customerFields": {"id": field_id}}})
-            company = CompaniesServices(self.database).get_company(company_id)
-            return company
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id)},
+                {"$pull": {"customerFields": {"id": field_id}}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Company not found")
+            versions.bump("company", company_id)
+            return load_arrays(self.database, company)
         except PyMongoError as exception:
             raise Error(f"Error deleting customer field: {exception}") from exception
         
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Cascades services module."""
+
+import time
+from typing import List, Tuple
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from db.indexes import ensure_indexes
+from utils.metrics import registry
+from utils.result_cache import results
+from .changes import ChangesServices, tracked
+from .shift_buckets import shifts_storage
+from .shift_resolver import name_cache
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+cascade_documents = registry.counter(
+    "cascade_documents_total",
+    "Denormalized copies refreshed by rename cascades.",
+    ("entity", "collection"))
+cascade_duration = registry.histogram(
+    "cascade_duration_seconds",
+    "Duration of rename cascades.",
+    ("entity",))
+
+class CascadesServices():
+    """
+    Cascades services class.
+    Shifts copy the worker, stall and customer names, and stalls copy the customer name and
+    the name of their workers. When one of those names changes the copies are refreshed with
+    indexed update_many operations. Shift buckets keep the names once per bucket under the
+    same field names, so the same operations refresh them. v2 shifts don't store the names,
+    so they are skipped and the cached name is dropped instead.
+    """
+    def __init__(self, database: Database) -> None:
+        self.database = database
+        self.shifts = shifts_storage(database).collection
+        ensure_indexes(database, "stalls")
+
+    @tracked
+    def worker_renamed(self, worker_id: str, name: str) -> dict:
+        """
+        Refresh the copies of a worker name.
+        Args:
+            worker_id (str): Worker id.
+            name (str): New worker name.
+        Returns:
+            dict: Documents refreshed per collection and duration.
+        Raises:
+            Exception: If there's an error refreshing the copies.
+        """
+        name_cache.invalidate(self.database.name, "worker", worker_id)
+        version = ChangesServices(self.database).next_version()
+        return self._cascade("worker", [
+            (self.shifts,
+             {"worker": worker_id, "workerName": {"$exists": True, "$ne": name}},
+             {"$set": {"workerName": name, "version": version}},
+             None),
+            ("stalls",
+             {"workers": {"$elemMatch": {"id": worker_id, "name": {"$ne": name}}}},
+             {"$set": {"workers.$[worker].name": name, "version": version}},
+             [{"worker.id": worker_id}]),
+        ])
+
+    @tracked
+    def stall_renamed(self, stall_id: str, name: str) -> dict:
+        """
+        Refresh the copies of a stall name.
+        Args:
+            stall_id (str): Stall id.
+            name (str): New stall name.
+        Returns:
+            dict: Documents refreshed per collection and duration.
+        Raises:
+            Exception: If there's an error refreshing the copies.
+        """
+        name_cache.invalidate(self.database.name, "stall", stall_id)
+        version = ChangesServices(self.database).next_version()
+        return self._cascade("stall", [
+            (self.shifts,
+             {"stall": stall_id, "stallName": {"$exists": True, "$ne": name}},
+             {"$set": {"stallName": name, "version": version}},
+             None),
+        ])
+
+    @tracked
+    def customer_renamed(self, customer_id: str, name: str) -> dict:
+        """
+        Refresh the copies of a customer name.
+        Args:
+            customer_id (str): Customer id.
+            name (str): New customer name.
+        Returns:
+            dict: Documents refreshed per collection and duration.
+        Raises:
+            Exception: If there's an error refreshing the copies.
+        """
+        name_cache.invalidate(self.database.name, "customer", customer_id)
+        version = ChangesServices(self.database).next_version()
+        return self._cascade("customer", [
+            (self.shifts,
+             {"customer": customer_id, "customerName": {"$exists": True, "$ne": name}},
+             {"$set": {"customerName": name, "version": version}},
+             None),
+            ("stalls",
+             {"customer": customer_id, "customerName": {"$ne": name}},
+             {"$set": {"customerName": name, "version": version}},
+             None),
+        ])
+
+    def _cascade(self, entity: str, operations: List[Tuple[str, dict, dict, list]]) -> dict:
+        """Run the update_many operations of a cascade and record its fan-out."""
+        try:
+            start = time.perf_counter()
+            result = {"entity": entity}
+            for collection, query, update, array_filters in operations:
+                updated = self.database[collection].update_many(
+                    query, update, array_filters=array_filters)
+                result[collection] = updated.modified_count
+                cascade_documents.inc(entity, collection, amount=updated.modified_count)
+            results.invalidate_tenant(self.database.name)
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            cascade_duration.observe(result["seconds"], entity)
+            return result
+        except PyMongoError as exception:
+            raise Error(f"Error refreshing {entity} name: {exception}") from exception
@@ -0,0 +1,236 @@
+"""Changes services module."""
+
+import datetime
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Set, Tuple
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from db.indexes import ensure_indexes
+
+# Seconds after which a version still being written no longer holds the watermark back,
+# so a write that died halfway can't stall the sync. Versions of running writes are renewed
+# every third of it, and both are measured with the clock of the database server.
+CHANGES_LEASE_SECONDS = int(os.getenv("CHANGES_LEASE_SECONDS", "60"))
+
+logger = logging.getLogger(__name__)
+
+_writes = threading.local()
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class Leases():
+    """
+    Versions being written by this process, per tenant database. A background thread renews
+    them while their writes run, however long they take.
+    """
+    def __init__(self) -> None:
+        self.live: Dict[str, Tuple[Database, Set[int]]] = {}
+        self.renewer = None
+        self._lock = threading.Lock()
+
+    def add(self, database: Database, version: int) -> None:
+        """Hold the lease of a version until it's discarded."""
+        with self._lock:
+            self.live.setdefault(database.name, (database, set()))[1].add(version)
+            if self.renewer is None:
+                self.renewer = threading.Thread(target=self.renew_forever, daemon=True)
+                self.renewer.start()
+
+    def discard(self, database: Database, versions: List[int]) -> None:
+        """Stop renewing versions."""
+        with self._lock:
+            if database.name in self.live:
+                self.live[database.name][1].difference_update(versions)
+                if not self.live[database.name][1]:
+                    del self.live[database.name]
+
+    def renew_forever(self) -> None:
+        """Renew the live versions every third of the lease."""
+        while True:
+            time.sleep(CHANGES_LEASE_SECONDS / 3)
+            with self._lock:
+                live = [(database, list(versions)) for database, versions in self.live.values()]
+            for database, versions in live:
+                try:
+                    ChangesServices(database).renew(versions)
+                except Error as exception:
+                    logger.error("%s", exception)
+
+leases = Leases()
+
+def tracked(method: Callable) -> Callable:
+    """
+    Release the change versions allocated by a service write once it returns. Nested
+    writes, like the cascades of a rename, are released by the outermost one.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_writes, "versions", None) is not None:
+            return method(self, *args, **kwargs)
+        _writes.versions = []
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            versions, _writes.versions = _writes.versions, None
+            if versions:
+                ChangesServices(self.database).release(versions)
+    return wrapper
+
+class ChangesServices():
+    """
+    Changes services class.
+    Every tenant database keeps a monotonically increasing change version. Shifts and
+    stalls are stamped with the version of the write that last touched them, and deletions
+    leave a tombstone so clients can resync with only what changed since a version.
+    Versions are allocated before their write lands, so the counter keeps the versions
+    still being written and the sync watermark stays below the lowest of them.
+    """
+    def __init__(self, database: Database) -> None:
+        self.database = database
+        ensure_indexes(database, "tombstones")
+
+    def next_version(self) -> int:
+        """
+        Allocate the next change version and mark it as being written until the tracked
+        write that allocated it returns.
+        Returns:
+            int: Change version.
+        Raises:
+            Exception: If there's an error allocating the version.
+        """
+        live = {"$gt": ["$$this.at", {"$subtract": ["$$NOW", CHANGES_LEASE_SECONDS * 1000]}]}
+        try:
+            counter = self.database.counters.find_one_and_update(
+                {"_id": "changes"},
+                [{"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}},
+                 {"$set": {"pending": {"$concatArrays": [
+                     {"$filter": {"input": {"$ifNull": ["$pending", []]}, "cond": live}},
+                     [{"version": "$version", "at": "$$NOW"}]]}}}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER)
+        except PyMongoError as exception:
+            raise Error(f"Error allocating change version: {exception}") from exception
+        if getattr(_writes, "versions", None) is not None:
+            _writes.versions.append(counter["version"])
+            leases.add(self.database, counter["version"])
+        return counter["version"]
+
+    def renew(self, versions: List[int]) -> None:
+        """
+        Restart the lease of change versions still being written.
+        Args:
+            versions (List[int]): Change versions.
+        Raises:
+            Exception: If there's an error renewing the versions.
+        """
+        try:
+            self.database.counters.update_one(
+                {"_id": "changes"},
+                [{"$set": {"pending": {"$map": {
+                    "input": {"$ifNull": ["$pending", []]},
+                    "in": {"$cond": [
+                        {"$in": ["$$this.version", versions]},
+                        {"version": "$$this.version", "at": "$$NOW"},
+                        "$$this"]}}}}}])
+        except PyMongoError as exception:
+            raise Error(f"Error renewing change versions: {exception}") from exception
+
+    def release(self, versions: List[int]) -> None:
+        """
+        Mark change versions as written. Writes that run in batches release the version of
+        each batch as soon as it lands, instead of holding the watermark until they return.
+        Args:
+            versions (List[int]): Change versions.
+        Raises:
+            Exception: If there's an error releasing the versions.
+        """
+        leases.discard(self.database, versions)
+        if getattr(_writes, "versions", None):
+            _writes.versions = [
+                version for version in _writes.versions if version not in versions]
+        try:
+            self.database.counters.update_one(
+                {"_id": "changes"}, {"$pull": {"pending": {"version": {"$in": versions}}}})
+        except PyMongoError as exception:
+            raise Error(f"Error releasing change versions: {exception}") from exception
+
+    def current_version(self) -> int:
+        """
+        Get the change version every write up to which has landed.
+        Returns:
+            int: Change version.
+        Raises:
+            Exception: If there's an error reading the version.
+        """
+        live = {"$gt": ["$$this.at", {"$subtract": ["$$NOW", CHANGES_LEASE_SECONDS * 1000]}]}
+        try:
+            counter = next(self.database.counters.aggregate([
+                {"$match": {"_id": "changes"}},
+                {"$project": {"version": 1, "pending": {"$min": {"$map": {
+                    "input": {"$filter": {"input": {"$ifNull": ["$pending", []]}, "cond": live}},
+                    "in": "$$this.version"}}}}}]), None)
+        except PyMongoError as exception:
+            raise Error(f"Error reading change version: {exception}") from exception
+        if not counter:
+            return 0
+        if counter["pending"] is not None:
+            return counter["pending"] - 1
+        return counter["version"]
+
+    def record_deletions(self, kind: str, documents: List[dict], version: int) -> None:
+        """
+        Record tombstones for deleted documents.
+        Args:
+            kind (str): Collection of the deleted documents.
+            documents (List[dict]): Deleted documents.
+            version (int): Change version of the deletion.
+        Raises:
+            Exception: If there's an error recording the tombstones.
+        """
+        if not documents:
+            return
+        try:
+            deleted_at = datetime.datetime.utcnow()
+            self.database.tombstones.insert_many([{
+                "kind": kind,
+                "ref": str(document["_id"]),
+                "month": document.get("month"),
+                "year": document.get("year"),
+                "version": version,
+                "deletedAt": deleted_at,
+            } for document in documents], ordered=False)
+        except PyMongoError as exception:
+            raise Error(f"Error recording deletions: {exception}") from exception
+
+    def get_deletions(
+        self,
+        kind: str,
+        since: int,
+        months: List[str],
+        years: List[str]) -> List[str]:
+        """
+        Get the ids deleted after a version.
+        Args:
+            kind (str): Collection of the deleted documents.
+            since (int): Change version.
+            months (List[str]): Months.
+            years (List[str]): Years.
+        Returns:
+            List[str]: Deleted ids.
+        Raises:
+            Exception: If there's an error reading the tombstones.
+        """
+        try:
+            tombstones = self.database.tombstones.find(
+                {"kind": kind, "version": {"$gt": since},
+                 "month": {"$in": months}, "year": {"$in": years}},
+                {"ref": 1})
+            return [tombstone["ref"] for tombstone in tombstones]
+        except PyMongoError as exception:
+            raise Error(f"Error reading deletions: {exception}") from exception
@@ -0,0 +1,91 @@
+"""Closed periods module."""
+
+import threading
+from typing import Dict, Iterable
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from utils.periods import document_period
+from .archive import archive_horizons, Error as ArchiveError
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class PeriodClosed(Error):
+    """Write to a closed period."""
+
+class ClosedPeriods():
+    """
+    Closed periods of every tenant database, read from `closed_periods` once per process
+    and kept up to date by the periods services, so writes check them without a query.
+    Periods before the archive horizon are closed as well.
+    """
+    def __init__(self) -> None:
+        self.periods: Dict[str, Dict[int, dict]] = {}
+        self._lock = threading.Lock()
+
+    def of(self, database: Database) -> Dict[int, dict]:
+        """
+        Closed periods of a tenant.
+        Args:
+            database (Database): Tenant database.
+        Returns:
+            Dict[int, dict]: Closed period records by period.
+        Raises:
+            Exception: If there's an error reading the closed periods.
+        """
+        periods = self.periods.get(database.name)
+        if periods is not None:
+            return periods
+        try:
+            periods = {record["_id"]: record for record in database.closed_periods.find()}
+        except PyMongoError as exception:
+            raise Error(f"Error reading closed periods: {exception}") from exception
+        with self._lock:
+            return self.periods.setdefault(database.name, periods)
+
+    def add(self, database: Database, record: dict) -> None:
+        """Mark a period as closed."""
+        periods = self.of(database)
+        with self._lock:
+            periods[record["_id"]] = record
+
+    def remove(self, database: Database, period: int) -> None:
+        """Mark a period as open."""
+        periods = self.of(database)
+        with self._lock:
+            periods.pop(period, None)
+
+    def guarded(self, database: Database) -> bool:
+        """Check if a tenant has any closed or archived period."""
+        try:
+            return bool(self.of(database)) or archive_horizons.before(database) > 0
+        except ArchiveError as exception:
+            raise Error(f"Error reading archive horizon: {exception}") from exception
+
+    def ensure_open(self, database: Database, periods: Iterable[int]) -> None:
+        """
+        Reject a write to closed or archived periods.
+        Args:
+            database (Database): Tenant database.
+            periods (Iterable[int]): Written periods.
+        Raises:
+            PeriodClosed: If any of the periods is closed or archived.
+        """
+        if not self.guarded(database):
+            return
+        closed = self.of(database)
+        before = archive_horizons.before(database)
+        for period in periods:
+            if period is None:
+                continue
+            if period in closed:
+                raise PeriodClosed(f"Period {period // 100}-{period % 100:02d} is closed")
+            if period < before:
+                raise PeriodClosed(f"Period {period // 100}-{period % 100:02d} is archived")
+
+    def ensure_documents_open(self, database: Database, documents: Iterable[dict]) -> None:
+        """Reject a write to the periods of some shifts or stalls."""
+        if self.guarded(database):
+            self.ensure_open(database, {document_period(document) for document in documents})
+
+closed_periods = ClosedPeriods()
@@ -1,14 +1,67 @@
 """Companies services module."""
 
+import copy
+import os
+import threading
+import time
 from typing import List
 from bson import ObjectId
+from pymongo.collection import Collection
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from models.company import Company, UpdateCompany
+from utils.etags import versions
+from utils.metrics import registry
+from .company_arrays import CompanyArraysServices, load_arrays
 
 class Error(Exception):
     """Base class for exceptions in this module."""
 
+cache_requests = registry.counter(
+    "company_cache_requests_total", "Company cache lookups.", ("result",))
+
+class CompanyCache():
+    """
+    Read-through cache of company documents.
+    Entries remember the company version they were read at, so every bump made by the
+    company services invalidates them. Writes from other processes are picked up from a
+    change stream on the companies collection, or after the TTL when there is none.
+    Callers get deep copies, so changing nested arrays of a company never changes the cache.
+    """
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, company_id: str) -> Company:
+        """Get a cached company, or None."""
+        entry = self.entries.get(company_id)
+        if (entry and entry["version"] == versions.get("company", company_id)
+                and time.monotonic() - entry["at"] < self.ttl):
+            cache_requests.inc("hit")
+            return copy.deepcopy(entry["company"])
+        cache_requests.inc("miss")
+        return None
+
+    def put(self, company_id: str, company: Company, version: int) -> None:
+        """Cache a company read at a version."""
+        self.entries[company_id] = {
+            "company": copy.deepcopy(company), "version": version, "at": time.monotonic()}
+
+    def watch(self, collection: Collection) -> None:
+        """Invalidate the companies changed by any process. Needs a replica set."""
+        try:
+            with collection.watch() as stream:
+                for change in stream:
+                    versions.bump("company", str(change["documentKey"]["_id"]))
+        except PyMongoError as exception:
+            print(f"Company cache change stream unavailable: {exception}")
+
+    def start_watching(self, collection: Collection) -> None:
+        """Watch the companies collection in a background thread."""
+        threading.Thread(target=self.watch, args=(collection,), daemon=True).start()
+
+company_cache = CompanyCache(float(os.getenv("COMPANY_CACHE_TTL", "60")))
+
 class CompaniesServices():
     """Companies services class."""
     def __init__(self, database: Database) -> None:
@@ -47,11 +100,44 @@ class CompaniesServices():
             Exception: If there's an error reading the company.
         """
         try:
+            company = company_cache.get(company_id)
+            if company:
+                return company
+            version = versions.get("company", company_id)
             company = self.database.companies.find_one({"_id": ObjectId(company_id)})
+            if company:
+                company_cache.put(company_id, company, version)
             return company
         except PyMongoError as exception:
             raise Error(f"Error reading company: {exception}") from exception
 
+    def get_company_with_arrays(self, company_id: str) -> Company:
+        """
+        Get a company with its sequences, positions, conventions and tags.
+        Args:
+            company_id (str): Company id.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If there's an error reading the company.
+        """
+        return load_arrays(self.database, self.get_company(company_id))
+
+    def externalize_arrays(self, company_id: str) -> Company:
+        """
+        Move the sequences, positions, conventions and tags of a company to their collections.
+        Args:
+            company_id (str): Company id.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If there's an error moving the arrays.
+        """
+        company = self.get_company(company_id)
+        if not company:
+            raise Error("Company not found")
+        return CompanyArraysServices(self.database, company).externalize()
+
     def get_all_companies(self) -> List[Company]:
         """
         Get all companies.
@@ -64,7 +150,7 @@ class CompaniesServices():
         """
         try:
             companies = self.database.companies.find()
-            return list(companies)
+            return [load_arrays(self.database, company) for company in companies]
         except PyMongoError as exception:
             raise Error(f"Error reading companies: {exception}") from exception
 
@@ -80,7 +166,8 @@ class CompaniesServices():
         """
         try:
             self.database.companies.update_one({"_id": ObjectId(company_id)}, {"$set": company})
-            company = self.get_company(company_id)
+            versions.bump("company", company_id)
+            company = self.get_company_with_arrays(company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error updating company: {exception}") from exception
@@ -88,10 +175,11 @@ class CompaniesServices():
     def delete_company(self, company_id: str) -> Company:
         """Delete a company."""
         try:
-            company = self.get_company(company_id)
+            company = self.get_company_with_arrays(company_id)
             if not company:
                 raise Error("Company not found")
             self.database.companies.delete_one({"_id": ObjectId(company_id)})
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error deleting company: {exception}") from exception
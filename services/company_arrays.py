@@ -0,0 +1,168 @@
+"""Company arrays services module."""
+
+from pymongo.database import Database
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+from bson import ObjectId
+from models.company import Company
+from db.indexes import ensure_indexes
+from utils.etags import versions
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+# Arrays that can live in their own collections, with the fields that make an item unique.
+ARRAYS = {
+    "sequences": ["name"],
+    "positions": ["name"],
+    "conventions": ["name"],
+    "tags": ["name", "scope"],
+}
+
+def is_external(company: Company) -> bool:
+    """Check if a company keeps its arrays in their own collections."""
+    return bool(company) and company.get("arraysStorage") == "collections"
+
+class CompanyArraysServices():
+    """
+    Company arrays services class.
+    Companies with `arraysStorage: "collections"` keep their sequences, positions,
+    conventions and tags in collections of their own database instead of embedded in the
+    company document, so the company document read on every request stays small.
+    """
+    def __init__(self, database: Database, company: Company) -> None:
+        self.database = database
+        self.company = company
+        self.company_id = str(company["_id"])
+        self.tenant = database.client[company["db"]]
+
+    def _collection(self, array: str):
+        """Collection of an array, with its unique index."""
+        ensure_indexes(self.tenant, array)
+        return self.tenant[array]
+
+    def load(self) -> Company:
+        """
+        Get the company with its arrays loaded from their collections.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If there's an error reading the arrays.
+        """
+        try:
+            company = dict(self.company)
+            for array in ARRAYS:
+                company[array] = list(self.tenant[array].find(
+                    {"company": self.company_id}, {"_id": 0, "company": 0}))
+            return company
+        except PyMongoError as exception:
+            raise Error(f"Error reading company arrays: {exception}") from exception
+
+    def add(self, array: str, item: dict) -> Company:
+        """
+        Add an item to an array.
+        Args:
+            array (str): Array name.
+            item (dict): Item to add.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If the item already exists or there's an error adding it.
+        """
+        try:
+            item["id"] = str(ObjectId())
+            self._collection(array).insert_one({"company": self.company_id, **item})
+            versions.bump("company", self.company_id)
+            return self.load()
+        except DuplicateKeyError as exception:
+            raise Error(f"{array} item already exists") from exception
+        except PyMongoError as exception:
+            raise Error(f"Error adding {array} item: {exception}") from exception
+
+    def update(self, array: str, item_id: str, item: dict) -> Company:
+        """
+        Update an item of an array.
+        Args:
+            array (str): Array name.
+            item_id (str): Item id.
+            item (dict): Item data.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If the item doesn't exist, its name is taken or there's an error updating it.
+        """
+        try:
+            item["id"] = item_id
+            result = self._collection(array).update_one(
+                {"company": self.company_id, "id": item_id}, {"$set": item})
+            if not result.matched_count:
+                raise Error(f"{array} item not found")
+            versions.bump("company", self.company_id)
+            return self.load()
+        except DuplicateKeyError as exception:
+            raise Error(f"{array} item already exists") from exception
+        except PyMongoError as exception:
+            raise Error(f"Error updating {array} item: {exception}") from exception
+
+    def delete(self, array: str, item_id: str) -> Company:
+        """
+        Delete an item of an array.
+        Args:
+            array (str): Array name.
+            item_id (str): Item id.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If there's an error deleting the item.
+        """
+        try:
+            self.tenant[array].delete_one({"company": self.company_id, "id": item_id})
+            versions.bump("company", self.company_id)
+            return self.load()
+        except PyMongoError as exception:
+            raise Error(f"Error deleting {array} item: {exception}") from exception
+
+    def externalize(self) -> Company:
+        """
+        Move the embedded arrays of the company into their collections.
+        Returns:
+            Company: Company.
+        Raises:
+            Exception: If there's an error moving the arrays.
+        """
+        try:
+            if is_external(self.company):
+                return self.load()
+            for array in ARRAYS:
+                items = [{"company": self.company_id, **item}
+                         for item in self.company.get(array, [])]
+                if not items:
+                    continue
+                try:
+                    self._collection(array).insert_many(items, ordered=False)
+                except BulkWriteError as exception:
+                    # Duplicates are items copied by an interrupted previous run
+                    if any(error["code"] != 11000 for error in exception.details["writeErrors"]):
+                        raise
+                copied = set(self._collection(array).distinct("id", {"company": self.company_id}))
+                if not {item["id"] for item in items} <= copied:
+                    raise Error(f"Not every {array} item was copied, the company was not changed")
+            # The embedded arrays are only dropped once every item is in its collection.
+            self.database.companies.update_one(
+                {"_id": self.company["_id"]},
+                {"$set": {"arraysStorage": "collections"},
+                 "$unset": {array: "" for array in ARRAYS}})
+            versions.bump("company", self.company_id)
+            self.company = self.database.companies.find_one({"_id": self.company["_id"]})
+            return self.load()
+        except PyMongoError as exception:
+            raise Error(f"Error moving company arrays: {exception}") from exception
+
+def load_arrays(database: Database, company: Company) -> Company:
+    """Get a company with its arrays, wherever they are stored."""
+    if not is_external(company):
+        return company
+    return CompanyArraysServices(database, company).load()
+
+def company_exists(database: Database, company_id: str) -> bool:
+    """Check if a company exists, to tell an unknown company from a rejected array change."""
+    return database.companies.count_documents({"_id": ObjectId(company_id)}, limit=1) > 0
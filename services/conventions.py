@@ -1,19 +1,43 @@
 """Conventions services module."""
 
+from pymongo import ReturnDocument
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 from models.company import Convention, Company
+from utils.etags import versions
+from utils.result_cache import results
 from .companies import CompaniesServices
+from .company_arrays import CompanyArraysServices, is_external, load_arrays
+from .shift_resolver import CONVENTION_FIELDS
 
 class Error(Exception):
     """Base class for exceptions in this module."""
 
 class ConventionsServices():
-    """Conventions services class."""
+    """
+    Conventions services class.
+    v2 shifts store only the id of their convention, so before one is changed or deleted
+    its fields are written back into the shifts referencing it, which keep their look.
+    """
     def __init__(self, database: Database) -> None:
         self.database = database
 
+    def _detach_shifts(self, company: Company, convention_id: str) -> int:
+        """Write the fields of a convention into the v2 shifts referencing it."""
+        conventions = load_arrays(self.database, company).get("conventions", [])
+        convention = next(
+            (convention for convention in conventions if convention["id"] == convention_id), None)
+        if convention is None:
+            return 0
+        fields = {field: convention.get(source) for field, source in CONVENTION_FIELDS.items()}
+        tenant = self.database.client[company["db"]]
+        return sum(
+            tenant[collection].update_many(
+                {"convention": convention_id},
+                {"$set": fields, "$unset": {"convention": ""}}).modified_count
+            for collection in ("shifts", "shifts_archive"))
+
     def add_convention(self, company_id: str, convention: Convention) -> Company:
         """
         Add a convention.
@@ -27,12 +51,16 @@ class ConventionsServices():
         """
         try:
             convention["id"] = str(ObjectId())
-            if self.database.companies.find_one(
-                {"_id": ObjectId(company_id), "conventions.name": convention["name"]}):
-                raise Error("Convention already exists")
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$push": {"conventions": convention}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).add("conventions", convention)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "conventions.name": {"$ne": convention["name"]}},
+                {"$push": {"conventions": convention}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Convention already exists")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error adding convention: {exception}") from exception
@@ -55,10 +83,24 @@ class ConventionsServices():
         """
         try:
             convention["id"] = convention_id
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id), "conventions.id": convention_id},
-                {"$set": {"conventions.$": convention}})
             company = CompaniesServices(self.database).get_company(company_id)
+            # v2 shifts are read with the fields of their convention
+            tenant = company["db"]
+            self._detach_shifts(company, convention_id)
+            if is_external(company):
+                company = CompanyArraysServices(self.database, company).update(
+                    "conventions", convention_id, convention)
+                results.invalidate(tenant, "shifts")
+                return company
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "conventions.id": convention_id},
+                {"$set": {"conventions.$[item]": convention}},
+                array_filters=[{"item.id": convention_id}],
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Convention not found")
+            versions.bump("company", company_id)
+            results.invalidate(tenant, "shifts")
             return company
         except PyMongoError as exception:
             raise Error(f"Error updating convention: {exception}") from exception
@@ -75,9 +117,22 @@ class ConventionsServices():
             Exception: If there's an error updating the company.
         """
         try:
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$pull": {"conventions": {"id": convention_id}}})
             company = CompaniesServices(self.database).get_company(company_id)
+            tenant = company["db"]
+            self._detach_shifts(company, convention_id)
+            if is_external(company):
+                company = CompanyArraysServices(self.database, company).delete(
+                    "conventions", convention_id)
+                results.invalidate(tenant, "shifts")
+                return company
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id)},
+                {"$pull": {"conventions": {"id": convention_id}}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Company not found")
+            versions.bump("company", company_id)
+            results.invalidate(tenant, "shifts")
             return company
         except PyMongoError as exception:
             raise Error(f"Error deleting convention: {exception}") from exception
@@ -1,7 +1,8 @@
 """Cussomers services module."""
 
 import datetime
-from typing import List
+import os
+from typing import Callable, List
 import pytz
 from bson import ObjectId
 from pymongo.database import Database
@@ -9,6 +10,14 @@ from pymongo.errors import PyMongoError
 from pymongo import UpdateOne, InsertOne
 from models.customer import Customer, UpdateCustomer
 from schemas.user import user_entity
+from db.indexes import ensure_indexes
+from utils.etags import versions
+from utils.search import search_fields, search_query, after_query, encode_cursor, SEARCH_SORT
+from .cascades import CascadesServices
+from .migrations import BatchMigration, Error as MigrationError
+
+# Customers written per chunk by an import.
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "500"))
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -17,6 +26,7 @@ class CustomersServices():
     """Customers services class."""
     def __init__(self, database: Database) -> None:
         self.database = database
+        ensure_indexes(database, "customers")
 
     def create_customer(self , company: str, customer: Customer, user: user_entity) -> Customer:
         """
@@ -46,7 +56,9 @@ class CustomersServices():
             for field in customer["fields"]:
                 fields.append(dict(field))
             customer["fields"] = fields
+            customer.update(search_fields(customer["name"]))
             customer = self.database.customers.insert_one(customer)
+            versions.bump("customers", company)
             customer = self.database.customers.find_one({"_id": customer.inserted_id})
             return customer
         except PyMongoError as exception:
@@ -56,13 +68,16 @@ class CustomersServices():
         self,
         company: str,
         customers: List[Customer],
-        user: user_entity) -> Customer:
+        user: user_entity,
+        progress: Callable[[dict], None] = None) -> Customer:
         """
         Create customers.
+        Customers are written in chunks of IMPORT_CHUNK, renames cascaded with each chunk.
         Args:
             company (str): Company name.
             customers (List[Customer]): Customers data.
             user (user_entity): User data.
+            progress (Callable[[dict], None]): Called after each chunk.
         Returns:
             Customers: Customers created.
         Raises:
@@ -71,37 +86,52 @@ class CustomersServices():
         try:
             existing_customers = self.database.customers.find({})
             existing_customers = [dict(customer) for customer in existing_customers]
-            existing_identifications = [customer[
-                "identification"] for customer in existing_customers]
-            create_operations = []
-            update_operations = []
-            for customer in customers:
-                del customer["id"]
-                customer["company"] = company
-                fields = []
-                for field in customer["fields"]:
-                    fields.append(dict(field))
-                if customer["identification"] in existing_identifications:
-                    customer["updatedBy"] = user["userName"]
-                    customer["updatedAt"] = datetime.datetime.now(
-                        pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-                    customer["fields"] = fields
-                    update_operations.append(
-                        UpdateOne(
-                            {"identification": customer["identification"]}, {"$set": customer}))
-                else:
-                    customer["userName"] = user["userName"]
-                    customer["updatedBy"] = user["userName"]
-                    customer["createdAt"] = datetime.datetime.now(
-                        pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-                    customer["updatedAt"] = datetime.datetime.now(
-                        pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-                    customer["fields"] = fields
-                    create_operations.append(InsertOne(customer))
-            if create_operations:
-                self.database.customers.bulk_write(create_operations)
-            if update_operations:
-                self.database.customers.bulk_write(update_operations)
+            existing_by_identification = {
+                customer["identification"]: customer for customer in existing_customers}
+            for start in range(0, len(customers), IMPORT_CHUNK):
+                create_operations = []
+                update_operations = []
+                renamed = []
+                for customer in customers[start:start + IMPORT_CHUNK]:
+                    del customer["id"]
+                    customer["company"] = company
+                    customer.update(search_fields(customer["name"]))
+                    fields = []
+                    for field in customer["fields"]:
+                        fields.append(dict(field))
+                    if customer["identification"] in existing_by_identification:
+                        existing = existing_by_identification[customer["identification"]]
+                        if existing["name"] != customer["name"]:
+                            renamed.append((str(existing["_id"]), customer["name"]))
+                        customer["updatedBy"] = user["userName"]
+                        customer["updatedAt"] = datetime.datetime.now(
+                            pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+                        customer["fields"] = fields
+                        update_operations.append(
+                            UpdateOne(
+                                {"identification": customer["identification"]},
+                                {"$set": customer}))
+                    else:
+                        customer["userName"] = user["userName"]
+                        customer["updatedBy"] = user["userName"]
+                        customer["createdAt"] = datetime.datetime.now(
+                            pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+                        customer["updatedAt"] = datetime.datetime.now(
+                            pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+                        customer["fields"] = fields
+                        create_operations.append(InsertOne(customer))
+                if create_operations:
+                    self.database.customers.bulk_write(create_operations)
+                if update_operations:
+                    self.database.customers.bulk_write(update_operations)
+                versions.bump("customers", company)
+                for customer_id, name in renamed:
+                    CascadesServices(self.database).customer_renamed(customer_id, name)
+                if progress:
+                    progress({
+                        "phase": "importing",
+                        "done": min(start + IMPORT_CHUNK, len(customers)),
+                        "total": len(customers)})
             return True
         except PyMongoError as exception:
             raise Error(f"Error creating or updating customer: {exception}") from exception
@@ -127,6 +157,44 @@ class CustomersServices():
         except PyMongoError as exception:
             raise Error(f"Error finding customers: {exception}") from exception
 
+    def search_customers(
+        self,
+        company: str,
+        search: str,
+        tags: List[str],
+        limit: int,
+        after: str,
+        user_tags: list) -> dict:
+        """
+        Search customers by name or identification with keyset pagination.
+        Args:
+            company (str): Company name.
+            search (str): Search text.
+            tags (List[str]): Tags to filter by.
+            limit (int): Limit.
+            after (str): Cursor returned by the previous page.
+            user_tags (list): User tags.
+        Returns:
+            dict: Customers found and the cursor of the next page.
+        Raises:
+            Error: Error finding customers.
+        """
+        try:
+            query = {"company": company, **search_query(search)}
+            tag_filters = []
+            if tags:
+                tag_filters.append({"tags": {"$in": tags}})
+            if "all" not in user_tags:
+                tag_filters.append({"tags": {"$in": user_tags}})
+            after = after_query(after)
+            query = {"$and": [query, *tag_filters, after] if after else [query, *tag_filters]}
+            customers = list(
+                self.database.customers.find(query).sort(SEARCH_SORT).limit(limit))
+            cursor = encode_cursor(customers[-1]) if len(customers) == limit else None
+            return {"customers": customers, "next": cursor}
+        except PyMongoError as exception:
+            raise Error(f"Error finding customers: {exception}") from exception
+
     def update_customer(
         self,
         company: str,
@@ -160,7 +228,11 @@ class CustomersServices():
             data["updatedAt"] = datetime.datetime.now(
                 pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
             data["updatedBy"] = user["userName"]
+            data.update(search_fields(data["name"]))
             self.database.customers.update_one({"_id": ObjectId(customer_id)}, {"$set": data})
+            versions.bump("customers", company)
+            if customer["name"] != data["name"]:
+                CascadesServices(self.database).customer_renamed(customer_id, data["name"])
             customer = self.database.customers.find_one({"_id": ObjectId(customer_id)})
             return customer
         except PyMongoError as exception:
@@ -187,10 +259,41 @@ class CustomersServices():
             if not set(customer["tags"]).intersection(user_tags) and "all" not in user_tags:
                 raise Error("Customer not found")
             self.database.customers.delete_one({"_id": ObjectId(customer_id)})
+            versions.bump("customers", company)
             return customer
         except PyMongoError as exception:
             raise Error(f"Error deleting customer: {exception}") from exception
 
+    def update_search_model(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Backfill the search fields of the customers.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Migration stats.
+        Raises:
+            Error: Error updating the model.
+        """
+        def refresh(customer: dict) -> dict:
+            fields = search_fields(customer["name"])
+            if all(customer.get(key) == value for key, value in fields.items()):
+                return {}
+            return fields
+        try:
+            return BatchMigration(
+                self.database,
+                "customers_search",
+                "customers",
+                refresh,
+                projection={"name": 1, "searchName": 1, "searchTokens": 1},
+                progress=progress).run(resume)
+        except MigrationError as exception:
+            raise Error(f"Error updating model: {exception}") from exception
+
 
 # Update Model
 
@@ -0,0 +1,354 @@
+"""Jobs services module."""
+
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Set
+import pytz
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from db.indexes import ensure_indexes
+from models.websocket import WebsocketResponse
+from schemas.job import job_entity
+from utils.metrics import registry
+from utils.periods import InvalidPeriod
+from .closed_periods import PeriodClosed
+from .websocket import manager
+
+# Jobs run at once in the process, never more than one per tenant.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A failed attempt is retried after JOB_RETRY_SECONDS, doubled on every attempt.
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", "30"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+
+logger = logging.getLogger(__name__)
+
+jobs_total = registry.counter(
+    "jobs_total", "Finished job attempts by kind and state.", ("kind", "state"))
+jobs_running = registry.gauge("jobs_running", "Jobs running.", ("kind",))
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class JobCancelled(Error):
+    """Cancellation requested while the job was running."""
+
+def now() -> datetime.datetime:
+    """Current UTC time, as stored in the scheduling fields."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def timestamp() -> str:
+    """Current time in the format of the other records."""
+    return datetime.datetime.now(pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+
+class JobsServices():
+    """
+    Jobs services class.
+    Jobs are documents of the `jobs` collection of the harmony database. Their payload is
+    kept as gzip compressed JSON, since imports can carry thousands of records. A job is
+    queued, running, then done, failed or cancelled; a failed attempt goes back to queued
+    until it runs out of attempts.
+    """
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def create_job(self, kind: str, company: str, db: str, user: dict, payload: dict) -> dict:
+        """
+        Queue a job.
+        Args:
+            kind (str): Registered job kind.
+            company (str): Company id.
+            db (str): Company database.
+            user (dict): User that queued the job.
+            payload (dict): Arguments of the job handler.
+        Returns:
+            dict: Job.
+        Raises:
+            Exception: If there's an error queueing the job.
+        """
+        job = {
+            "kind": kind,
+            "company": company,
+            "db": db,
+            "user": {"email": user["email"], "userName": user["userName"]},
+            "payload": Binary(gzip.compress(json.dumps(payload).encode())),
+            "state": "queued",
+            "attempts": 0,
+            "maxAttempts": JOB_MAX_ATTEMPTS,
+            "cancelRequested": False,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "runAfter": now(),
+            "createdAt": timestamp(),
+        }
+        try:
+            job["_id"] = self.database.jobs.insert_one(job).inserted_id
+            return job
+        except PyMongoError as exception:
+            raise Error(f"Error creating job: {exception}") from exception
+
+    def get_job(self, company: str, job_id: str) -> dict:
+        """
+        Get a job of a company.
+        Args:
+            company (str): Company id.
+            job_id (str): Job id.
+        Returns:
+            dict: Job.
+        Raises:
+            Exception: If the job doesn't exist or there's an error reading it.
+        """
+        try:
+            job = self.database.jobs.find_one({"_id": ObjectId(job_id), "company": company})
+        except (PyMongoError, InvalidId) as exception:
+            raise Error(f"Error getting job: {exception}") from exception
+        if not job:
+            raise Error("Job not found")
+        return job
+
+    def get_jobs(self, company: str, limit: int = 50) -> List[dict]:
+        """
+        Get the latest jobs of a company.
+        Args:
+            company (str): Company id.
+            limit (int): Jobs returned.
+        Returns:
+            List[dict]: Jobs, newest first.
+        Raises:
+            Exception: If there's an error reading the jobs.
+        """
+        try:
+            return list(self.database.jobs.find(
+                {"company": company}, {"payload": 0}).sort("_id", -1).limit(limit))
+        except PyMongoError as exception:
+            raise Error(f"Error getting jobs: {exception}") from exception
+
+    def cancel_job(self, company: str, job_id: str) -> dict:
+        """
+        Cancel a queued job, or ask a running one to stop at its next progress report.
+        Args:
+            company (str): Company id.
+            job_id (str): Job id.
+        Returns:
+            dict: Job.
+        Raises:
+            Exception: If the job already finished or there's an error cancelling it.
+        """
+        try:
+            query = {"_id": ObjectId(job_id), "company": company}
+            job = self.database.jobs.find_one_and_update(
+                dict(query, state="queued"),
+                {"$set": {"state": "cancelled", "finishedAt": timestamp()}},
+                return_document=ReturnDocument.AFTER)
+            if not job:
+                job = self.database.jobs.find_one_and_update(
+                    dict(query, state="running"),
+                    {"$set": {"cancelRequested": True}},
+                    return_document=ReturnDocument.AFTER)
+        except (PyMongoError, InvalidId) as exception:
+            raise Error(f"Error cancelling job: {exception}") from exception
+        if not job:
+            raise Error("Job not found or already finished")
+        return job
+
+    def claim(self, busy: Set[str]) -> dict:
+        """Take the next due job of a tenant without running jobs, or None."""
+        try:
+            job = self.database.jobs.find_one_and_update(
+                {"state": "queued", "runAfter": {"$lte": now()}, "company": {"$nin": list(busy)}},
+                {"$set": {"state": "running", "startedAt": timestamp()}, "$inc": {"attempts": 1}},
+                sort=[("runAfter", 1), ("_id", 1)],
+                return_document=ReturnDocument.AFTER)
+        except PyMongoError as exception:
+            raise Error(f"Error claiming job: {exception}") from exception
+        if job:
+            job["payload"] = json.loads(gzip.decompress(job["payload"]))
+        return job
+
+    def report(self, job_id: ObjectId, progress: dict) -> bool:
+        """Save the progress of a job. Returns whether its cancellation was requested."""
+        try:
+            job = self.database.jobs.find_one_and_update(
+                {"_id": job_id}, {"$set": {"progress": progress}}, {"cancelRequested": 1})
+        except PyMongoError as exception:
+            raise Error(f"Error saving job progress: {exception}") from exception
+        return bool(job and job["cancelRequested"])
+
+    def finish(self, job_id: ObjectId, state: str, result: dict = None, error: str = None) -> dict:
+        """Mark a job as done, failed or cancelled."""
+        try:
+            return self.database.jobs.find_one_and_update(
+                {"_id": job_id},
+                {"$set": {
+                    "state": state, "result": result, "error": error, "finishedAt": timestamp()}},
+                {"payload": 0},
+                return_document=ReturnDocument.AFTER)
+        except PyMongoError as exception:
+            raise Error(f"Error finishing job: {exception}") from exception
+
+    def retry(self, job: dict, error: str) -> dict:
+        """Queue a failed attempt again after a backoff, or fail the job for good."""
+        if job["attempts"] >= job["maxAttempts"]:
+            return self.finish(job["_id"], "failed", error=error)
+        delay = JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1)
+        try:
+            return self.database.jobs.find_one_and_update(
+                {"_id": job["_id"]},
+                {"$set": {
+                    "state": "queued",
+                    "error": error,
+                    "runAfter": now() + datetime.timedelta(seconds=delay)}},
+                {"payload": 0},
+                return_document=ReturnDocument.AFTER)
+        except PyMongoError as exception:
+            raise Error(f"Error retrying job: {exception}") from exception
+
+    def requeue_interrupted(self, single_attempt: Set[str] = frozenset()) -> int:
+        """
+        Queue again the jobs left running by a previous process, failing those of the kinds
+        that can't run again.
+        """
+        try:
+            if single_attempt:
+                self.database.jobs.update_many(
+                    {"state": "running", "kind": {"$in": list(single_attempt)}},
+                    {"$set": {
+                        "state": "failed",
+                        "error": "Interrupted by a restart",
+                        "finishedAt": timestamp()}})
+            return self.database.jobs.update_many(
+                {"state": "running"}, {"$set": {"state": "queued", "runAfter": now()}}
+            ).modified_count
+        except PyMongoError as exception:
+            raise Error(f"Error requeueing jobs: {exception}") from exception
+
+Handler = Callable[[Database, dict, Callable[[dict], None]], dict]
+
+class JobRunner():
+    """
+    Runs the queued jobs in a pool of JOB_WORKERS asyncio tasks, each handler in a thread
+    so the event loop keeps serving requests. A tenant never has two jobs running at once.
+    Handlers get the tenant database, the job with its decoded payload and a `progress`
+    callback, which saves the progress, pushes a `job_progress` event to the websocket
+    connections of the company and raises JobCancelled once a cancellation was requested.
+    The app runs a single process, so jobs still running at startup were interrupted and
+    are queued again. Kinds registered with `retry=False` fail on their first error, for
+    handlers that can't safely run again over what a failed attempt already wrote.
+    """
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Handler] = {}
+        self.single_attempt: Set[str] = set()
+        self.services: JobsServices = None
+        self.client: MongoClient = None
+        self.busy: Set[str] = set()
+        self.wakeup: asyncio.Event = None
+        self.workers: List[asyncio.Task] = []
+
+    def register(self, kind: str, handler: Handler, retry: bool = True) -> None:
+        """Register the handler of a job kind, and whether its failed attempts are retried."""
+        self.handlers[kind] = handler
+        if retry:
+            self.single_attempt.discard(kind)
+        else:
+            self.single_attempt.add(kind)
+
+    def start(self, client: MongoClient, workers: int = JOB_WORKERS) -> None:
+        """Requeue the interrupted jobs and start the workers in the running event loop."""
+        self.client = client
+        self.services = JobsServices(client["harmony"])
+        self.wakeup = asyncio.Event()
+        ensure_indexes(client["harmony"], "jobs")
+        try:
+            self.services.requeue_interrupted(self.single_attempt)
+        except Error as exception:
+            logger.error("%s", exception)
+        self.workers = [asyncio.ensure_future(self.work()) for _ in range(workers)]
+
+    def wake(self) -> None:
+        """Look for due jobs now instead of at the next poll."""
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def work(self) -> None:
+        """Claim and run jobs, forever."""
+        while True:
+            try:
+                job = await asyncio.to_thread(self.services.claim, set(self.busy))
+            except Error as exception:
+                logger.error("%s", exception)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            self.busy.add(job["company"])
+            jobs_running.inc(job["kind"])
+            try:
+                await self.run(job)
+            except Error as exception:
+                logger.error("%s", exception)
+            finally:
+                jobs_running.dec(job["kind"])
+                self.busy.discard(job["company"])
+                self.wake()
+
+    async def run(self, job: dict) -> None:
+        """Run one attempt of a job and record how it ended."""
+        loop = asyncio.get_running_loop()
+
+        def progress(data: dict) -> None:
+            cancel = self.services.report(job["_id"], data)
+            asyncio.run_coroutine_threadsafe(
+                self.notify(job, "job_progress", dict(job_entity(job), progress=data)), loop)
+            if cancel:
+                raise JobCancelled("Job cancelled")
+
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self.services.finish(job["_id"], "failed", error=f"Unknown job kind {job['kind']}")
+            return
+        await self.notify(job, "job_started", job_entity(job))
+        try:
+            database = self.client[job["db"]]
+            result = await asyncio.to_thread(handler, database, job, progress)
+            state, finished = "done", self.services.finish(job["_id"], "done", result)
+        except JobCancelled:
+            state, finished = "cancelled", self.services.finish(job["_id"], "cancelled")
+        except (PeriodClosed, InvalidPeriod) as exception:
+            # Retrying can't succeed until the period is reopened or the payload fixed.
+            state, finished = "failed", self.services.finish(
+                job["_id"], "failed", error=str(exception))
+        except Exception as exception:
+            logger.exception("Job %s of kind %s failed", job["_id"], job["kind"])
+            if job["kind"] in self.single_attempt:
+                finished = self.services.finish(job["_id"], "failed", error=str(exception))
+            else:
+                finished = self.services.retry(job, str(exception))
+            state = finished["state"] if finished else "failed"
+        jobs_total.inc(job["kind"], state)
+        if finished:
+            await self.notify(job, f"job_{state}", job_entity(finished))
+
+    async def notify(self, job: dict, event: str, data: dict) -> None:
+        """Push a job event to the websocket connections of its company."""
+        try:
+            await manager.broadcast(WebsocketResponse(
+                event=event,
+                data=data,
+                userName=job["user"]["userName"],
+                company=job["company"]))
+        except Exception:
+            logger.exception("Error broadcasting %s of job %s", event, job["_id"])
+
+job_runner = JobRunner()
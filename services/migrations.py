@@ -0,0 +1,116 @@
+"""Migrations services module."""
+
+import time
+from typing import Callable
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from utils.result_cache import results
+from .changes import ChangesServices, Error as ChangesError
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class BatchMigration():
+    """
+    Batch migration class.
+    Streams a collection in _id order, asks `transform` for the fields that changed on each
+    document (or for an update document with operators such as `$unset`) and writes them
+    with chunked unordered bulk writes. A checkpoint with the last
+    processed _id is kept in the `migrations` collection so an interrupted run resumes
+    where it stopped. With `versioned`, every chunk is stamped with its own change version,
+    released once the chunk lands, so a long run never holds the sync watermark back.
+    """
+    def __init__(
+        self,
+        database: Database,
+        name: str,
+        collection: str,
+        transform: Callable[[dict], dict],
+        query: dict = None,
+        projection: dict = None,
+        batch_size: int = 1000,
+        progress: Callable[[dict], None] = None,
+        versioned: bool = False) -> None:
+        self.database = database
+        self.name = name
+        self.collection = collection
+        self.transform = transform
+        self.query = query or {}
+        self.projection = projection
+        self.batch_size = batch_size
+        self.progress = progress
+        self.versioned = versioned
+
+    def run(self, resume: bool = True) -> dict:
+        """
+        Run the migration.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+        Returns:
+            dict: Processed and modified documents, elapsed seconds and throughput.
+        Raises:
+            Exception: If there's an error running the migration.
+        """
+        try:
+            checkpoint = self.database.migrations.find_one({"_id": self.name})
+            last_id = None
+            if resume and checkpoint and not checkpoint["done"]:
+                last_id = checkpoint["lastId"]
+            query = dict(self.query)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            cursor = self.database[self.collection].find(
+                query, self.projection).sort("_id", 1).batch_size(self.batch_size)
+            stats = {"name": self.name, "processed": 0, "modified": 0}
+            start = time.perf_counter()
+            operations = []
+            for document in cursor:
+                changes = self.transform(document)
+                if changes:
+                    if not all(field.startswith("$") for field in changes):
+                        changes = {"$set": changes}
+                    operations.append((document["_id"], changes))
+                stats["processed"] += 1
+                last_id = document["_id"]
+                if stats["processed"] % self.batch_size == 0:
+                    stats["modified"] += self._flush(operations)
+                    operations = []
+                    self._checkpoint(last_id, False, stats, start)
+            stats["modified"] += self._flush(operations)
+            return self._checkpoint(last_id, True, stats, start)
+        except (PyMongoError, ChangesError) as exception:
+            raise Error(f"Error running migration {self.name}: {exception}") from exception
+
+    def _flush(self, operations: list) -> int:
+        """Write a chunk of updates, stamped with a version of its own if `versioned`."""
+        if not operations:
+            return 0
+        changes = ChangesServices(self.database) if self.versioned else None
+        version = changes.next_version() if changes else None
+        try:
+            if version is not None:
+                for _, update in operations:
+                    update.setdefault("$set", {})["version"] = version
+            result = self.database[self.collection].bulk_write(
+                [UpdateOne({"_id": _id}, update) for _id, update in operations], ordered=False)
+        finally:
+            if version is not None:
+                changes.release([version])
+        results.invalidate_tenant(self.database.name)
+        return result.modified_count
+
+    def _checkpoint(self, last_id, done: bool, stats: dict, start: float) -> dict:
+        """Save the checkpoint and report progress."""
+        seconds = time.perf_counter() - start
+        stats = dict(
+            stats,
+            seconds=round(seconds, 3),
+            rate=round(stats["processed"] / seconds, 1) if seconds else 0)
+        self.database.migrations.update_one(
+            {"_id": self.name},
+            {"$set": {"lastId": last_id, "done": done, "stats": stats}},
+            upsert=True)
+        if self.progress:
+            self.progress(stats)
+        return stats
@@ -0,0 +1,182 @@
+"""Periods services module."""
+
+import datetime
+import gzip
+import hashlib
+import os
+import uuid
+from typing import List, Tuple
+import pytz
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from schemas.shift import shift_entity
+from schemas.stall import stalls_entity
+from schemas.user import user_entity
+from utils.periods import period
+from utils.singleflight import serialize
+from .archive import tiers, Error as ArchiveError
+from .closed_periods import closed_periods, Error as ClosedPeriodsError
+from .shift_buckets import shifts_storage
+from .shifts import Error as ShiftsError
+from .stalls import StallsServices, Error as StallsError
+
+SNAPSHOTS_DIR = os.getenv("SNAPSHOTS_DIR", "snapshots")
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+class PeriodsServices():
+    """
+    Periods services class.
+    Closing a period freezes its stalls and shifts: writes to it are rejected and its month
+    reads are written once as gzip snapshots named by the SHA-256 of their JSON body, under
+    SNAPSHOTS_DIR/<tenant db>. The snapshots hold the exact bodies of the month reads of the
+    stalls and of the shifts of every type, so they are served as they are stored.
+    """
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def close_period(self, company: str, month: str, year: str, user: user_entity) -> dict:
+        """
+        Close a period.
+        Args:
+            company (str): Company id.
+            month (str): Month.
+            year (str): Year.
+            user (user_entity): User.
+        Returns:
+            dict: Closed period record.
+        Raises:
+            Exception: If the period is already closed or there's an error writing it.
+        """
+        try:
+            value = period(month, year)
+            if value in closed_periods.of(self.database):
+                raise Error("Period already closed")
+            record = {
+                "_id": value,
+                "month": month,
+                "year": year,
+                "state": "closing",
+                "closedBy": user["userName"],
+                "closedAt": datetime.datetime.now(
+                    pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")}
+            # Writes are rejected before the snapshot is read, so it can't miss any of them.
+            self.database.closed_periods.insert_one(record)
+            closed_periods.add(self.database, record)
+            try:
+                snapshots = self._write_snapshots(company, value, month, year)
+            except (PyMongoError, OSError, ShiftsError, StallsError, ArchiveError):
+                self.database.closed_periods.delete_one({"_id": value})
+                closed_periods.remove(self.database, value)
+                raise
+            record = dict(record, state="closed", snapshots=snapshots)
+            self.database.closed_periods.update_one(
+                {"_id": value}, {"$set": {"state": "closed", "snapshots": snapshots}})
+            closed_periods.add(self.database, record)
+            return record
+        except (PyMongoError, OSError, ClosedPeriodsError, ShiftsError, StallsError,
+                ArchiveError) as exception:
+            raise Error(f"Error closing period: {exception}") from exception
+
+    def reopen_period(self, value: int) -> dict:
+        """
+        Reopen a closed period and delete its snapshots.
+        Args:
+            value (int): Period.
+        Returns:
+            dict: Removed closed period record.
+        Raises:
+            Exception: If the period isn't closed or there's an error reopening it.
+        """
+        try:
+            record = closed_periods.of(self.database).get(value)
+            if not record:
+                raise Error("Period not closed")
+            self.database.closed_periods.delete_one({"_id": value})
+            closed_periods.remove(self.database, value)
+            # Identical bodies, like those of empty months, share a file
+            shared = {snapshot["sha256"]
+                      for other in closed_periods.of(self.database).values()
+                      for snapshot in other.get("snapshots", {}).values()}
+            for snapshot in record.get("snapshots", {}).values():
+                if snapshot["sha256"] not in shared and os.path.exists(self.path(snapshot)):
+                    os.remove(self.path(snapshot))
+            return record
+        except (PyMongoError, OSError, ClosedPeriodsError) as exception:
+            raise Error(f"Error reopening period: {exception}") from exception
+
+    def get_closed_periods(self) -> List[dict]:
+        """
+        Get the closed periods.
+        Returns:
+            List[dict]: Closed period records.
+        Raises:
+            Exception: If there's an error reading the closed periods.
+        """
+        try:
+            records = closed_periods.of(self.database).values()
+            return sorted(records, key=lambda record: record["_id"])
+        except ClosedPeriodsError as exception:
+            raise Error(f"Error reading closed periods: {exception}") from exception
+
+    def snapshot(self, value: int, kind: str, types: List[str] = None) -> Tuple[str, dict]:
+        """
+        Snapshot of a closed period.
+        Args:
+            value (int): Period.
+            kind (str): "stalls" or "shifts".
+            types (List[str]): Shift types of the read, which must include every type stored.
+        Returns:
+            Tuple[str, dict]: Path and description of the snapshot, or None.
+        Raises:
+            Exception: If there's an error reading the closed periods.
+        """
+        try:
+            record = closed_periods.of(self.database).get(value)
+        except ClosedPeriodsError as exception:
+            raise Error(f"Error reading closed periods: {exception}") from exception
+        if not record or record["state"] != "closed" or kind not in record["snapshots"]:
+            return None
+        snapshot = record["snapshots"][kind]
+        if types is not None and not set(snapshot.get("types", [])) <= set(types):
+            return None
+        return self.path(snapshot), snapshot
+
+    def path(self, snapshot: dict) -> str:
+        """File of a snapshot."""
+        return os.path.join(SNAPSHOTS_DIR, self.database.name, f"{snapshot['sha256']}.json.gz")
+
+    def _write_snapshots(self, company: str, value: int, month: str, year: str) -> dict:
+        """Write the snapshots of the stalls and shifts of a period."""
+        storage = shifts_storage(self.database)
+        types = sorted({
+            shift_type
+            for collection in tiers(self.database, storage.collection, [month], [year])
+            for shift_type in self.database[collection].distinct(
+                storage.type_field, {"period": value})
+            if shift_type is not None})
+        stalls = StallsServices(self.database).get_stalls([month], [year])
+        shifts = storage.get_shifts_by_month_and_year(company, [month], [year], types)
+        return {
+            "stalls": self._write(serialize(stalls_entity(stalls))),
+            "shifts": dict(
+                self._write(serialize([shift_entity(shift) for shift in shifts])),
+                types=types),
+        }
+
+    def _write(self, body: bytes) -> dict:
+        """Write a gzip snapshot named by the SHA-256 of its body, if it doesn't exist."""
+        snapshot = {"sha256": hashlib.sha256(body).hexdigest(), "size": len(body)}
+        path = self.path(snapshot)
+        if os.path.exists(path):
+            snapshot["bytes"] = os.path.getsize(path)
+            return snapshot
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(compressed)
+        os.replace(temporary, path)
+        snapshot["bytes"] = len(compressed)
+        return snapshot
@@ -1,10 +1,13 @@
 """Positions services module."""
 
+from pymongo import ReturnDocument
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 from models.company import Position, Company
+from utils.etags import versions
 from .companies import CompaniesServices
+from .company_arrays import CompanyArraysServices, is_external, company_exists
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -28,12 +31,18 @@ class PositionsServices():
         """
         try:
             position["id"] = str(ObjectId())
-            if self.database.companies.find_one(
-                {"_id": ObjectId(company_id), "positions.name": position["name"]}):
-                raise Error("Position already exists")
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$push": {"positions": position}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).add("positions", position)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "positions.name": {"$ne": position["name"]}},
+                {"$push": {"positions": position}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                if not company_exists(self.database, company_id):
+                    raise Error("Company not found")
+                raise Error("Position already exists")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error adding position: {exception}") from exception
@@ -52,10 +61,18 @@ class PositionsServices():
         """
         try:
             position["id"] = position_id
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id), "positions.id": position_id},
-                {"$set": {"positions.$": position}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).update(
+                    "positions", position_id, position)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "positions.id": position_id},
+                {"$set": {"positions.$[item]": position}},
+                array_filters=[{"item.id": position_id}],
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Position not found")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error updating position: {exception}") from exception
@@ -72,9 +89,17 @@ class PositionsServices():
             Exception: If there's an error updating the company.
         """
         try:
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$pull": {"positions": {"id": position_id}}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).delete(
+                    "positions", position_id)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id)},
+                {"$pull": {"positions": {"id": position_id}}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Company not found")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error deleting position: {exception}") from exception
@@ -1,10 +1,13 @@
 """Sequence services module."""
 
 from pymongo.errors import PyMongoError
+from pymongo import ReturnDocument
 from pymongo.database import Database
 from bson import ObjectId
 from models.company import Sequence, Company
-from .companies import CompaniesServices\
+from utils.etags import versions
+from .companies import CompaniesServices
+from .company_arrays import CompanyArraysServices, is_external, company_exists
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -30,12 +33,18 @@ class SequencesServices():
                 steps.append(dict(step))
             sequence["steps"] = steps
             sequence["id"] = str(ObjectId())
-            if self.database.companies.find_one(
-                {"_id": ObjectId(company_id), "sequences.name": sequence["name"]}):
-                raise Error("Sequence already exists")
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$push": {"sequences": sequence}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).add("sequences", sequence)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "sequences.name": {"$ne": sequence["name"]}},
+                {"$push": {"sequences": sequence}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                if not company_exists(self.database, company_id):
+                    raise Error("Company not found")
+                raise Error("Sequence already exists")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error adding sequence: {exception}") from exception
@@ -57,10 +66,18 @@ class SequencesServices():
                 steps.append(dict(step))
             sequence["steps"] = steps
             sequence["id"] = sequence_id
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id), "sequences.id": sequence_id},
-                {"$set": {"sequences.$": sequence}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).update(
+                    "sequences", sequence_id, sequence)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id), "sequences.id": sequence_id},
+                {"$set": {"sequences.$[item]": sequence}},
+                array_filters=[{"item.id": sequence_id}],
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Sequence not found")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error updating sequence: {exception}") from exception
@@ -76,9 +93,17 @@ class SequencesServices():
             Exception: If there's an error updating the company.
         """
         try:
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$pull": {"sequences": {"id": sequence_id}}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).delete(
+                    "sequences", sequence_id)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id)},
+                {"$pull": {"sequences": {"id": sequence_id}}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Company not found")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error deleting sequence: {exception}") from exception
@@ -0,0 +1,364 @@
+"""Shift buckets services module."""
+
+import os
+import datetime
+from typing import Callable, List
+import pytz
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from bson import ObjectId
+from models.shift import Shift
+from schemas.user import user_entity
+from utils.periods import period_fields, period_query
+from utils.result_cache import results
+from .shifts import ShiftsServices, Error
+from .changes import ChangesServices, tracked
+from .closed_periods import closed_periods
+from .archive import find_tiered, tiers, Error as ArchiveError
+
+# Fields shared by every shift of a worker in a stall and month, stored once per bucket.
+HEADER_FIELDS = [
+    "company", "stall", "stallName", "worker", "workerName", "customer", "customerName",
+    "month", "year", "period"]
+BUCKET_KEY = ["stall", "worker", "period"]
+
+def bucketed(database: Database) -> bool:
+    """Check if a tenant database stores its shifts in buckets (BUCKETED_SHIFTS_DBS)."""
+    names = {name.strip() for name in os.getenv("BUCKETED_SHIFTS_DBS", "").split(",")}
+    return "*" in names or database.name in names
+
+def shifts_storage(database: Database) -> ShiftsServices:
+    """Shifts services of the storage layout used by a tenant database."""
+    if bucketed(database):
+        return BucketedShiftsServices(database)
+    return ShiftsServices(database)
+
+def import_update(bucket: dict) -> list:
+    """
+    Pipeline update adding the imported entries of a bucket whose id isn't in it yet. An
+    entry already there may have been edited since, so it's never replaced.
+    """
+    existing = {"$ifNull": ["$days.id", []]}
+    return [{"$set": {
+        **{field: {"$ifNull": [f"${field}", {"$literal": value}]}
+           for field, value in bucket["header"].items()},
+        "version": {"$max": [{"$ifNull": ["$version", 0]}, bucket["version"]]},
+        "days": {"$concatArrays": [
+            {"$ifNull": ["$days", []]},
+            {"$filter": {
+                "input": {"$literal": bucket["days"]},
+                "cond": {"$not": [{"$in": ["$$this.id", existing]}]}}}]},
+    }}]
+
+def expand_bucket(bucket: dict, types: List[str] = None, ids: set = None) -> List[Shift]:
+    """Shifts of a bucket, in the shape of the documents of the shifts collection."""
+    header = {field: bucket.get(field) for field in HEADER_FIELDS}
+    shifts = []
+    for entry in bucket.get("days", []):
+        if types is not None and entry.get("type") not in types:
+            continue
+        if ids is not None and entry["id"] not in ids:
+            continue
+        shift = {"_id": entry["id"], **header}
+        shift.update((field, value) for field, value in entry.items() if field != "id")
+        shifts.append(shift)
+    return shifts
+
+class BucketedShiftsServices(ShiftsServices):
+    """
+    Bucketed shifts services class.
+    Stores one `shift_buckets` document per worker, stall and month with the names copied
+    once and a `days` array of compact entries, so a month read touches one document per
+    worker instead of one per shift. The ShiftsServices API is kept: reads return shifts
+    shaped like the documents of the shifts collection.
+    """
+    collection = "shift_buckets"
+    id_field = "days.id"
+    type_field = "days.type"
+
+    def insert_shifts(self, shifts: list) -> List[Shift]:
+        """
+        Insert shifts that already carry their company, version, period and audit fields.
+        Args:
+            shifts (list): Shifts to insert.
+        Returns:
+            List[Shift]: Inserted shifts, with their ids.
+        Raises:
+            Exception: If there's an error inserting the shifts.
+        """
+        try:
+            buckets = {}
+            for shift in shifts:
+                shift["_id"] = shift.get("_id") or ObjectId()
+                key = tuple(shift[field] for field in BUCKET_KEY)
+                bucket = buckets.setdefault(key, {
+                    "header": {field: shift.get(field) for field in HEADER_FIELDS
+                               if field not in BUCKET_KEY},
+                    "version": shift.get("version", 0),
+                    "days": []})
+                entry = {field: value for field, value in shift.items()
+                         if field not in HEADER_FIELDS and field != "_id"}
+                bucket["days"].append({"id": shift["_id"], **entry})
+            operations = [UpdateOne(
+                dict(zip(BUCKET_KEY, key)),
+                {"$setOnInsert": bucket["header"],
+                 "$max": {"version": bucket["version"]},
+                 "$push": {"days": {"$each": bucket["days"]}}},
+                upsert=True) for key, bucket in buckets.items()]
+            if operations:
+                self.database.shift_buckets.bulk_write(operations, ordered=False)
+            return shifts
+        except PyMongoError as exception:
+            raise Error(f"Error inserting shifts: {exception}") from exception
+
+    def _find(
+        self,
+        query: dict,
+        types: List[str] = None,
+        ids: set = None,
+        collections: List[str] = None) -> List[Shift]:
+        """Shifts of the buckets matching a query, in the hot tier unless told otherwise."""
+        if types is not None:
+            query["days.type"] = {"$in": types}
+        buckets = find_tiered(self.database, collections or [self.collection], query)
+        return [shift for bucket in buckets for shift in expand_bucket(bucket, types, ids)]
+
+    def get_shifts_by_workers(
+        self,
+        company: str,
+        workers_ids: List[str],
+        types: List[str]) -> List[Shift]:
+        """
+        Get shifts by workers.
+        Args:
+            company (str): Company id.
+            workers_ids (List[str]): Workers ids.
+            types (List[str]): Shift types.
+        Returns:
+            List[Shift]: Shifts.
+        Raises:
+            Exception: If there's an error finding the shifts.
+        """
+        try:
+            return self._find({"company": company, "worker": {"$in": workers_ids}}, types)
+        except PyMongoError as exception:
+            raise Error(f"Error finding shifts by customer: {exception}") from exception
+
+    def get_by_customer_and_month_and_year(
+        self,
+        company: str,
+        customer: str,
+        months: List[str],
+        years: List[str],
+        types: List[str],
+        start: str = None,
+        end: str = None) -> List[Shift]:
+        """
+        Get shifts by customer and month and year.
+        Args:
+            company (str): Company id.
+            customer (str): Customer id.
+            months (List[str]): Months.
+            years (List[str]): Years.
+            types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
+        Returns:
+            List[Shift]: Shifts.
+        Raises:
+            Exception: If there's an error finding the shifts.
+        """
+        try:
+            return self._find(
+                {"company": company, "customer": customer,
+                 **period_query(months, years, start, end)},
+                types,
+                collections=tiers(self.database, self.collection, months, years, start, end))
+        except (PyMongoError, ArchiveError) as exception:
+            raise Error(
+                f"Error finding shifts by customer and month and year: {exception}") from exception
+
+    def get_shifts_by_month_and_year(
+        self,
+        company: str,
+        months: List[str],
+        years: List[str],
+        types: List[str],
+        start: str = None,
+        end: str = None) -> List[Shift]:
+        """
+        Get shifts by month and year.
+        Args:
+            company (str): Company id.
+            months (List[str]): Months.
+            years (List[str]): Years.
+            types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
+        Returns:
+            List[Shift]: Shifts.
+        Raises:
+            Exception: If there's an error finding the shifts.
+        """
+        try:
+            return self._find(
+                {"company": company, **period_query(months, years, start, end)},
+                types,
+                collections=tiers(self.database, self.collection, months, years, start, end))
+        except (PyMongoError, ArchiveError) as exception:
+            raise Error(f"Error finding shifts by month and year: {exception}") from exception
+
+    @tracked
+    def update_shifts(self, company_id: str, shifts: list, user: user_entity) -> List[Shift]:
+        """
+        Update shifts.
+        Args:
+            company_id (str): Company id.
+            shifts (list): Shifts to update.
+            user (user_entity): User.
+        Returns:
+            List[Shift]: Shifts.
+        Raises:
+            Exception: If there's an error updating the shifts.
+        """
+        try:
+            ids = [ObjectId(shift["id"]) for shift in shifts]
+            self._ensure_open(ids)
+            version = ChangesServices(self.database).next_version()
+            now = datetime.datetime.now(
+                pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+            update_operations = []
+            for shift_id, shift in zip(ids, shifts):
+                updated_shift = dict(shift, version=version, updatedBy=user["userName"],
+                                     updatedAt=now)
+                del updated_shift["id"]
+                update_operations.append(UpdateOne(
+                    {"company": company_id, "days.id": shift_id},
+                    {"$set": {
+                        "version": version,
+                        **{f"days.$[day].{field}": value
+                           for field, value in updated_shift.items()}}},
+                    array_filters=[{"day.id": shift_id}]))
+            if update_operations:
+                self.database.shift_buckets.bulk_write(update_operations, ordered=False)
+            shifts = self._find({"company": company_id, "days.id": {"$in": ids}}, ids=set(ids))
+            results.invalidate_documents(self.database.name, "shifts", shifts)
+            return shifts
+        except PyMongoError as exception:
+            raise Error(f"Error updating shifts: {exception}") from exception
+
+    @tracked
+    def delete_shifts(self, company: str, stall_id: str, shifts_ids: List[str]) -> List[Shift]:
+        """
+        Delete shifts.
+        Args:
+            company (str): Company id.
+            stall_id (str): Stall id.
+            shifts_ids (List[str]): Shifts ids.
+        Returns:
+            List[Shift]: Shifts.
+        Raises:
+            Exception: If there's an error deleting the shifts.
+        """
+        try:
+            ids = [ObjectId(id) for id in shifts_ids]
+            query = {"company": company, "stall": stall_id, "days.id": {"$in": ids}}
+            shifts = self._find(dict(query), ids=set(ids))
+            if not shifts:
+                return []
+            closed_periods.ensure_documents_open(self.database, shifts)
+            changes = ChangesServices(self.database)
+            version = changes.next_version()
+            self.database.shift_buckets.update_many(
+                query,
+                {"$pull": {"days": {"id": {"$in": ids}}}, "$set": {"version": version}})
+            self.database.shift_buckets.delete_many({"stall": stall_id, "days": {"$size": 0}})
+            changes.record_deletions("shifts", shifts, version)
+            results.invalidate_documents(self.database.name, "shifts", shifts)
+            return shifts
+        except PyMongoError as exception:
+            raise Error(f"Error deleting shifts: {exception}") from exception
+
+    def _changed_shifts(
+        self,
+        company: str,
+        since: int,
+        months: List[str],
+        years: List[str],
+        types: List[str]) -> List[Shift]:
+        """Shifts of the buckets written after a version, including renames of the bucket."""
+        return self._find(
+            {"company": company, "version": {"$gt": since}, **period_query(months, years)},
+            types)
+
+    # Updating Model (Use carefully)
+    def import_shifts(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Copy the shifts collection into buckets. Entries already copied are skipped, so an
+        interrupted import can be run again. A checkpoint with the last stall and worker
+        written is kept in the `migrations` collection to resume from.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every chunk.
+        Returns:
+            dict: Processed shifts and written buckets.
+        Raises:
+            Exception: If there's an error copying the shifts.
+        """
+        try:
+            stats = {"name": "shift_buckets", "processed": 0, "modified": 0}
+            checkpoint = self.database.migrations.find_one({"_id": "shift_buckets"})
+            query = {}
+            if resume and checkpoint and not checkpoint["done"] and checkpoint.get("lastKey"):
+                # The last stall and worker may have been split across chunks, so it's
+                # read again; its copied entries are skipped.
+                stall, worker = checkpoint["lastKey"]
+                query = {"$or": [
+                    {"stall": {"$gt": stall}}, {"stall": stall, "worker": {"$gte": worker}}]}
+            cursor = self.database.shifts.find(query, allow_disk_use=True).sort(
+                [("stall", 1), ("worker", 1), ("_id", 1)]).batch_size(1000)
+            buckets = {}
+
+            def flush(done: bool = False) -> None:
+                operations = [UpdateOne(
+                    dict(zip(BUCKET_KEY, key)), import_update(bucket), upsert=True)
+                    for key, bucket in buckets.items()]
+                if operations:
+                    result = self.database.shift_buckets.bulk_write(operations, ordered=False)
+                    stats["modified"] += result.modified_count + result.upserted_count
+                last = list(buckets)[-1][:2] if buckets else None
+                buckets.clear()
+                self.database.migrations.update_one(
+                    {"_id": "shift_buckets"},
+                    {"$set": {"done": done, "stats": stats,
+                              **({"lastKey": list(last)} if last else {})}},
+                    upsert=True)
+                if progress:
+                    progress(dict(stats))
+
+            for shift in cursor:
+                shift = dict(shift)
+                if "period" not in shift:
+                    shift.update(period_fields(shift))
+                key = tuple(shift[field] for field in BUCKET_KEY)
+                bucket = buckets.setdefault(key, {
+                    "header": {field: shift.get(field) for field in HEADER_FIELDS
+                               if field not in BUCKET_KEY},
+                    "version": 0,
+                    "days": []})
+                bucket["version"] = max(bucket["version"], shift.get("version", 0))
+                bucket["days"].append({"id": shift["_id"], **{
+                    field: value for field, value in shift.items()
+                    if field not in HEADER_FIELDS and field != "_id"}})
+                stats["processed"] += 1
+                if len(buckets) >= 1000:
+                    flush()
+            flush(done=True)
+            results.invalidate_tenant(self.database.name)
+            return stats
+        except PyMongoError as exception:
+            raise Error(f"Error importing shifts into buckets: {exception}") from exception
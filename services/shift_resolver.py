@@ -0,0 +1,154 @@
+"""Shift resolver services module."""
+
+import os
+import threading
+import time
+from typing import Dict, List
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from bson import ObjectId
+from models.shift import Shift
+from .companies import CompaniesServices
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+# Names a v2 shift doesn't store: reference field -> (collection, name field).
+REFERENCES = {
+    "worker": ("workers", "workerName"),
+    "stall": ("stalls", "stallName"),
+    "customer": ("customers", "customerName"),
+}
+# Fields of a v2 shift replaced by its `convention` when they match one.
+CONVENTION_FIELDS = {"color": "color", "abbreviation": "abbreviation", "description": "name"}
+
+def schema_version() -> int:
+    """Schema of the shifts written from now on (SHIFTS_SCHEMA, 1 or 2)."""
+    return int(os.getenv("SHIFTS_SCHEMA", "1"))
+
+class NameCache():
+    """Names of workers, stalls and customers per tenant database, expiring after `ttl`."""
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.names: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, database: str, kind: str, ref: str):
+        """Cached name, or None."""
+        entry = self.names.get((database, kind, ref))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, database: str, kind: str, ref: str, name: str) -> None:
+        """Cache a name."""
+        with self._lock:
+            self.names[(database, kind, ref)] = (name, time.monotonic() + self.ttl)
+
+    def invalidate(self, database: str, kind: str, ref: str) -> None:
+        """Forget a name after a rename."""
+        with self._lock:
+            self.names.pop((database, kind, ref), None)
+
+name_cache = NameCache(float(os.getenv("SHIFT_NAMES_TTL", "300")))
+
+def convention_key(shift: dict) -> tuple:
+    """Fields of a shift compared with the conventions."""
+    return tuple(shift.get(field) for field in CONVENTION_FIELDS)
+
+def compact_shift(shift: dict, conventions: Dict[tuple, str]) -> dict:
+    """
+    v2 document of a shift: references only, plus the fields that override its convention.
+    Args:
+        shift (dict): Shift with every field.
+        conventions (Dict[tuple, str]): Convention ids by `convention_key`.
+    Returns:
+        dict: Compact shift.
+    """
+    document = {field: value for field, value in shift.items()
+                if field != "company" and field not in
+                [name for _, name in REFERENCES.values()]}
+    convention = conventions.get(convention_key(shift))
+    if convention:
+        document["convention"] = convention
+        for field in CONVENTION_FIELDS:
+            document.pop(field, None)
+    return document
+
+class ShiftResolver():
+    """
+    Shift resolver class.
+    Fills the names and convention fields that v2 shifts don't store, with names cached
+    per tenant database and conventions taken from the cached company document. v1 shifts
+    pass through untouched.
+    """
+    def __init__(self, database: Database, company: str) -> None:
+        self.database = database
+        self.company = company
+        self._conventions = None
+
+    def conventions(self) -> Dict[str, dict]:
+        """Conventions of the company by id."""
+        if self._conventions is None:
+            company = CompaniesServices(self.database.client["harmony"]).get_company_with_arrays(
+                self.company) or {}
+            self._conventions = {
+                convention["id"]: convention for convention in company.get("conventions", [])}
+        return self._conventions
+
+    def convention_ids(self) -> Dict[tuple, str]:
+        """Convention ids by `convention_key`, for compacting shifts."""
+        return {
+            tuple(convention.get(field) for field in CONVENTION_FIELDS.values()): convention_id
+            for convention_id, convention in self.conventions().items()}
+
+    def resolve(self, shifts) -> List[Shift]:
+        """
+        Fill the fields v2 shifts don't store.
+        Args:
+            shifts: Shifts.
+        Returns:
+            List[Shift]: Shifts with every field.
+        Raises:
+            Exception: If there's an error reading the names.
+        """
+        shifts = [dict(shift) for shift in shifts]
+        try:
+            names = self._names(shifts)
+            for shift in shifts:
+                shift.setdefault("company", self.company)
+                for kind, (_, field) in REFERENCES.items():
+                    if field not in shift:
+                        shift[field] = names.get((kind, shift.get(kind)), "")
+                if "convention" in shift:
+                    convention = self.conventions().get(shift["convention"], {})
+                    for field, source in CONVENTION_FIELDS.items():
+                        shift.setdefault(field, convention.get(source, ""))
+            return shifts
+        except PyMongoError as exception:
+            raise Error(f"Error resolving shifts: {exception}") from exception
+
+    def _names(self, shifts: List[dict]) -> Dict[tuple, str]:
+        """Names referenced by the shifts that don't store them."""
+        names = {}
+        missing = {kind: set() for kind in REFERENCES}
+        for shift in shifts:
+            for kind, (_, field) in REFERENCES.items():
+                ref = shift.get(kind)
+                if field in shift or not ref or (kind, ref) in names:
+                    continue
+                name = name_cache.get(self.database.name, kind, ref)
+                if name is None:
+                    missing[kind].add(ref)
+                else:
+                    names[(kind, ref)] = name
+        for kind, refs in missing.items():
+            ids = [ObjectId(ref) for ref in refs if ObjectId.is_valid(ref)]
+            if not ids:
+                continue
+            collection = REFERENCES[kind][0]
+            for document in self.database[collection].find({"_id": {"$in": ids}}, {"name": 1}):
+                ref = str(document["_id"])
+                names[(kind, ref)] = document["name"]
+                name_cache.put(self.database.name, kind, ref, document["name"])
+        return names
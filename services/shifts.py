@@ -1,6 +1,6 @@
 """Shifts services module."""
 
-from typing import List
+from typing import Callable, List
 import datetime
 import pytz
 from pymongo.database import Database
@@ -9,15 +9,36 @@ from pymongo import UpdateOne
 from bson import ObjectId
 from models.shift import Shift
 from schemas.user import user_entity
+from db.indexes import ensure_indexes
+from utils.periods import period_fields, period_query
+from utils.result_cache import results
+from .changes import ChangesServices, tracked
+from .closed_periods import closed_periods
+from .archive import find_tiered, tiers, Error as ArchiveError
+from .migrations import BatchMigration, Error as MigrationError
+from .shift_resolver import (
+    ShiftResolver, CONVENTION_FIELDS, compact_shift, convention_key, schema_version,
+    Error as ResolverError)
 
 class Error(Exception):
     """Base class for exceptions in this module."""
 
 class ShiftsServices():
-    """Shifts services class."""
+    """
+    Shifts services class.
+    With SHIFTS_SCHEMA=2 shifts are written without the company and the names they
+    reference, and with a `convention` id instead of the convention color, abbreviation and
+    description. Reads fill them back through the ShiftResolver.
+    """
+    collection = "shifts"
+    id_field = "_id"
+    type_field = "type"
+
     def __init__(self, database: Database) -> None:
         self.database = database
+        ensure_indexes(database, self.collection)
 
+    @tracked
     def create_shifts(self, company: str, shifts: list, user: user_entity) -> List[Shift]:
         """
         Create shifts.
@@ -31,20 +52,49 @@ class ShiftsServices():
             Exception: If there's an error creating the shifts.
         """
         try:
+            version = ChangesServices(self.database).next_version()
             for shift in shifts:
                 shift["company"] = company
+                shift["version"] = version
+                shift.update(period_fields(shift))
                 shift["createdBy"] = user["userName"]
                 shift["updatedBy"] = user["userName"]
                 shift["createdAt"] = datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
                 shift["updatedAt"] = datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-            shifts = self.database.shifts.insert_many(shifts)
-            shifts = self.database.shifts.find({"_id": {"$in": shifts.inserted_ids}})
+            closed_periods.ensure_documents_open(self.database, shifts)
+            shifts = self.insert_shifts(shifts)
+            results.invalidate_documents(self.database.name, "shifts", shifts)
             return shifts
         except PyMongoError as exception:
             raise Error(f"Error creating shifts: {exception}") from exception
 
+    def insert_shifts(self, shifts: list) -> List[Shift]:
+        """
+        Insert shifts that already carry their company, version, period and audit fields.
+        Args:
+            shifts (list): Shifts to insert.
+        Returns:
+            List[Shift]: Inserted shifts, with their ids.
+        Raises:
+            Exception: If there's an error inserting the shifts.
+        """
+        try:
+            if not shifts:
+                return shifts
+            documents = shifts
+            if schema_version() == 2:
+                conventions = ShiftResolver(
+                    self.database, shifts[0]["company"]).convention_ids()
+                documents = [compact_shift(shift, conventions) for shift in shifts]
+            self.database.shifts.insert_many(documents, ordered=False)
+            for shift, document in zip(shifts, documents):
+                shift["_id"] = document["_id"]
+            return shifts
+        except (PyMongoError, ResolverError) as exception:
+            raise Error(f"Error inserting shifts: {exception}") from exception
+
     def get_shifts_by_workers(
         self,
         company: str,
@@ -63,9 +113,9 @@ class ShiftsServices():
         """
         try:
             shifts = self.database.shifts.find(
-                {"company": company, "worker": {"$in": workers_ids}, "type": {"$in": types}})
-            return shifts
-        except PyMongoError as exception:
+                {"worker": {"$in": workers_ids}, "type": {"$in": types}})
+            return ShiftResolver(self.database, company).resolve(shifts)
+        except (PyMongoError, ResolverError) as exception:
             raise Error(f"Error finding shifts by customer: {exception}") from exception
 
     def get_by_customer_and_month_and_year(
@@ -74,7 +124,9 @@ class ShiftsServices():
         customer: str,
         months: List[str],
         years: List[str],
-        types: List[str]) -> List[Shift]:
+        types: List[str],
+        start: str = None,
+        end: str = None) -> List[Shift]:
         """
         Get shifts by customer and month and year.
         Args:
@@ -83,17 +135,21 @@ class ShiftsServices():
             months (List[str]): Months.
             years (List[str]): Years.
             types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
         Returns:
             List[Shift]: Shifts.
         Raises:
             Exception: If there's an error finding the shifts.
         """
         try:
-            shifts = self.database.shifts.find(
-                {"company": company, "customer": customer, "month": {"$in": months},
-                 "year": {"$in": years}, "type": {"$in": types}})
-            return shifts
-        except PyMongoError as exception:
+            shifts = find_tiered(
+                self.database,
+                tiers(self.database, self.collection, months, years, start, end),
+                {"customer": customer, **period_query(months, years, start, end),
+                 "type": {"$in": types}})
+            return ShiftResolver(self.database, company).resolve(shifts)
+        except (PyMongoError, ResolverError, ArchiveError) as exception:
             raise Error(
                 f"Error finding shifts by customer and month and year: {exception}") from exception
 
@@ -102,7 +158,9 @@ class ShiftsServices():
         company: str,
         months: List[str],
         years: List[str],
-        types: List[str]) -> List[Shift]:
+        types: List[str],
+        start: str = None,
+        end: str = None) -> List[Shift]:
         """
         Get shifts by month and year.
         Args:
@@ -110,19 +168,23 @@ class ShiftsServices():
             months (List[str]): Months.
             years (List[str]): Years.
             types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
         Returns:
             List[Shift]: Shifts.
         Raises:
             Exception: If there's an error finding the shifts.
         """
         try:
-            shifts = self.database.shifts.find(
-                {"company": company, "month": {"$in": months}, "year": {"$in": years},
-                 "type": {"$in": types}})
-            return shifts
-        except PyMongoError as exception:
+            shifts = find_tiered(
+                self.database,
+                tiers(self.database, self.collection, months, years, start, end),
+                {**period_query(months, years, start, end), "type": {"$in": types}})
+            return ShiftResolver(self.database, company).resolve(shifts)
+        except (PyMongoError, ResolverError, ArchiveError) as exception:
             raise Error(f"Error finding shifts by month and year: {exception}") from exception
 
+    @tracked
     def update_shifts(self, company_id: str, shifts: list, user: user_entity) -> List[Shift]:
         """
         Update shifts.
@@ -137,21 +199,37 @@ class ShiftsServices():
         """
         try:
             ids = [ObjectId(shift["id"]) for shift in shifts]
+            self._ensure_open(ids)
+            version = ChangesServices(self.database).next_version()
+            resolver = ShiftResolver(self.database, company_id)
+            conventions = resolver.convention_ids() if schema_version() == 2 else None
             update_operations = []
             for shift in shifts:
                 updated_shift = dict(shift)
+                updated_shift["version"] = version
                 updated_shift["updatedBy"] = user["userName"]
                 updated_shift["updatedAt"] = datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
                 del updated_shift["id"]
-                update_operations.append(
-                    UpdateOne({"_id": ObjectId(shift["id"])}, {"$set": updated_shift}))
+                update = {"$set": updated_shift}
+                if conventions is not None:
+                    convention = conventions.get(convention_key(updated_shift))
+                    if convention:
+                        for field in CONVENTION_FIELDS:
+                            updated_shift.pop(field, None)
+                        updated_shift["convention"] = convention
+                        update["$unset"] = {field: "" for field in CONVENTION_FIELDS}
+                    else:
+                        update["$unset"] = {"convention": ""}
+                update_operations.append(UpdateOne({"_id": ObjectId(shift["id"])}, update))
             self.database.shifts.bulk_write(update_operations)
-            shifts = self.database.shifts.find({"company": company_id, "_id": {"$in": ids}})
+            shifts = resolver.resolve(self.database.shifts.find({"_id": {"$in": ids}}))
+            results.invalidate_documents(self.database.name, "shifts", shifts)
             return shifts
-        except PyMongoError as exception:
+        except (PyMongoError, ResolverError) as exception:
             raise Error(f"Error updating shifts: {exception}") from exception
 
+    @tracked
     def delete_shifts(self, company: str, stall_id: str, shifts_ids: List[str]) -> List[Shift]:
         """
         Delete shifts.
@@ -166,55 +244,187 @@ class ShiftsServices():
         """
         try:
             shifts = self.database.shifts.find(
-                {"company": company, "stall": stall_id, "_id": {"$in":
-                    [ObjectId(id) for id in shifts_ids]}})
+                {"stall": stall_id, "_id": {"$in": [ObjectId(id) for id in shifts_ids]}})
+            shifts = list(shifts)
             if not shifts:
-                raise Error("Shifts not found")
+                return []
+            closed_periods.ensure_documents_open(self.database, shifts)
             self.database.shifts.delete_many(
-                {"company": company, "stall": stall_id, "_id": {"$in":
-                    [ObjectId(id) for id in shifts_ids]}})
-            return shifts or []
-        except PyMongoError as exception:
+                {"stall": stall_id, "_id": {"$in": [shift["_id"] for shift in shifts]}})
+            changes = ChangesServices(self.database)
+            changes.record_deletions("shifts", shifts, changes.next_version())
+            results.invalidate_documents(self.database.name, "shifts", shifts)
+            return ShiftResolver(self.database, company).resolve(shifts)
+        except (PyMongoError, ResolverError) as exception:
             raise Error(f"Error deleting shifts: {exception}") from exception
 
+    def _ensure_open(self, ids: List[ObjectId]) -> None:
+        """Reject an update of shifts of a closed or archived period."""
+        if closed_periods.guarded(self.database):
+            for collection in [self.collection, f"{self.collection}_archive"]:
+                closed_periods.ensure_open(self.database, self.database[collection].distinct(
+                    "period", {self.id_field: {"$in": ids}}))
+
+    def get_changes(
+        self,
+        company: str,
+        since: int,
+        months: List[str],
+        years: List[str],
+        types: List[str]) -> dict:
+        """
+        Get the shifts and stalls changed after a version.
+        Args:
+            company (str): Company id.
+            since (int): Change version already known by the client.
+            months (List[str]): Months.
+            years (List[str]): Years.
+            types (List[str]): Shift types.
+        Returns:
+            dict: Current version, changed shifts and stalls, and deleted ids.
+        Raises:
+            Exception: If there's an error reading the changes.
+        """
+        try:
+            changes = ChangesServices(self.database)
+            version = changes.current_version()
+            shifts = self._changed_shifts(company, since, months, years, types)
+            stalls = self.database.stalls.find(
+                {"version": {"$gt": since}, **period_query(months, years)})
+            return {
+                "version": version,
+                "shifts": shifts,
+                "stalls": list(stalls),
+                "deleted": {
+                    "shifts": changes.get_deletions("shifts", since, months, years),
+                    "stalls": changes.get_deletions("stalls", since, months, years),
+                }
+            }
+        except (PyMongoError, ResolverError) as exception:
+            raise Error(f"Error reading changes: {exception}") from exception
+
+    def _changed_shifts(
+        self,
+        company: str,
+        since: int,
+        months: List[str],
+        years: List[str],
+        types: List[str]) -> List[Shift]:
+        """Shifts written after a version."""
+        shifts = self.database.shifts.find(
+            {"version": {"$gt": since}, **period_query(months, years), "type": {"$in": types}})
+        return ShiftResolver(self.database, company).resolve(shifts)
+
 # Updating Model (Use carefully)
-    def update_model(self) -> List[Shift]:
+    @tracked
+    def update_model(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
         """
-        Update model.
+        Refresh the month, year and customer copied from the stall into every shift (or
+        shift bucket).
         Args:
-            None
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
         Returns:
-            None
+            dict: Migration stats.
         Raises:
             Exception: If there's an error updating the model.
         """
         try:
-            # find all stalls
-            stalls = self.database.stalls.find({})
-            stalls = [dict(stall) for stall in stalls]
-            shifts = self.database.shifts.find({})
-            shifts = [dict(shift) for shift in shifts]
-            # For each stall
-            update_operations = []
-            print("prev")
-            for stall in stalls:
-                print("first for")
-                # For each shift
-                for shift in shifts:
-                    print("second for")
-                    # If stall id == shift stall
-                    if str(stall["_id"]) == shift["stall"]:
-                        # Update shift month and year
-                        shift["month"] = stall["month"]
-                        shift["year"] = stall["year"]
-                        # Update shift customer and customerName
-                        shift["customer"] = stall["customer"]
-                        shift["customerName"] = stall["customerName"]
-                        # Update shift
-                        update_operations.append(
-                            UpdateOne({"_id": shift["_id"]}, {"$set": shift}))
-            self.database.shifts.bulk_write(update_operations)
-            shifts = self.database.shifts.find({})
-            return shifts
-        except PyMongoError as exception:
+            fields = ["month", "year", "customer", "customerName"]
+            stalls = self.database.stalls.find({}, {field: 1 for field in fields})
+            stalls = {str(stall["_id"]): stall for stall in stalls}
+            def refresh(shift: dict) -> dict:
+                stall = stalls.get(shift["stall"])
+                if not stall:
+                    return {}
+                # v2 shifts resolve the customer name instead of storing it
+                changes = {
+                    field: stall[field] for field in fields
+                    if shift.get(field) != stall[field]
+                    and (field != "customerName" or field in shift)}
+                if "month" in changes or "year" in changes:
+                    changes.update(period_fields({**shift, **changes}))
+                return changes
+            return BatchMigration(
+                self.database,
+                f"{self.collection}_model",
+                self.collection,
+                refresh,
+                projection={"stall": 1, "day": 1, **{field: 1 for field in fields}},
+                progress=progress,
+                versioned=True).run(resume)
+        except (PyMongoError, MigrationError) as exception:
             raise Error(f"Error updating model: {exception}") from exception
+
+    def update_periods(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Stamp the period and date of the shifts written before they existed.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Migration stats.
+        Raises:
+            Exception: If there's an error updating the shifts.
+        """
+        try:
+            def stamp(shift: dict) -> dict:
+                return period_fields(shift)
+            return BatchMigration(
+                self.database,
+                "shifts_period",
+                "shifts",
+                stamp,
+                query={"period": {"$exists": False}},
+                projection={"day": 1, "month": 1, "year": 1},
+                progress=progress).run(resume)
+        except (PyMongoError, MigrationError) as exception:
+            raise Error(f"Error updating periods: {exception}") from exception
+
+    def compact_model(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Rewrite the shifts in the v2 schema.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Migration stats.
+        Raises:
+            Exception: If there's an error updating the shifts.
+        """
+        try:
+            company = self.database.client["harmony"].companies.find_one(
+                {"db": self.database.name}, {"_id": 1})
+            if not company:
+                raise Error("Company not found")
+            conventions = ShiftResolver(self.database, str(company["_id"])).convention_ids()
+            def compact(shift: dict) -> dict:
+                document = compact_shift(shift, conventions)
+                removed = [field for field in shift if field not in document]
+                if not removed:
+                    return {}
+                update = {"$unset": {field: "" for field in removed}}
+                if "convention" in document:
+                    update["$set"] = {"convention": document["convention"]}
+                return update
+            return BatchMigration(
+                self.database,
+                "shifts_v2",
+                "shifts",
+                compact,
+                query={"$or": [{"company": {"$exists": True}}, {"workerName": {"$exists": True}}]},
+                projection={
+                    "company": 1, "workerName": 1, "stallName": 1, "customerName": 1,
+                    **{field: 1 for field in CONVENTION_FIELDS}},
+                progress=progress).run(resume)
+        except (PyMongoError, MigrationError, ResolverError) as exception:
+            raise Error(f"Error compacting shifts: {exception}") from exception
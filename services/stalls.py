@@ -1,23 +1,59 @@
 """Stalls services module."""
 
+import calendar
 import datetime
-from typing import List
+import os
+from typing import Callable, List
 import pytz
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson.objectid import ObjectId
-from models.stall import Stall, UpdateStall, StallWorker, StallsAndShifts, UpdateStallWorker
+from models.stall import (
+    Stall, UpdateStall, StallWorker, StallsAndShifts, UpdateStallWorker, RolloverStalls)
 from schemas.user import user_entity
-from .shifts import ShiftsServices
+from db.indexes import ensure_indexes
+from utils.periods import checked_period, period, period_fields, period_query
+from utils.result_cache import results
+from .shift_buckets import shifts_storage, bucketed, expand_bucket
+from .shift_resolver import ShiftResolver, Error as ResolverError
+from .changes import ChangesServices, tracked
+from .closed_periods import closed_periods
+from .archive import find_tiered, tiers, unique, Error as ArchiveError
+from .cascades import CascadesServices
+from .migrations import BatchMigration, Error as MigrationError
+
+# Stalls copied per write by a rollover, each chunk with its shifts.
+ROLLOVER_CHUNK = int(os.getenv("ROLLOVER_CHUNK", "200"))
 
 class Error(Exception):
     """Base class for exceptions in this module."""
 
+def days_in_month(month: str, year: str) -> int:
+    """Number of days of a month."""
+    return calendar.monthrange(int(year), int(month))[1]
+
+def advance_worker(worker: StallWorker, days: int) -> StallWorker:
+    """
+    Move a stall worker sequence to the first day of the next month.
+    The sequence starts `jump` days into the month at step `index` and repeats, so the step
+    of the next month's first day is `days - jump` steps after `index`.
+    """
+    worker = dict(worker)
+    steps = len(worker["sequence"])
+    if worker["jump"] >= days:
+        worker["jump"] -= days
+    elif steps:
+        worker["index"] = (worker["index"] + days - worker["jump"]) % steps
+        worker["jump"] = 0
+    return worker
+
 class StallsServices():
     """Stalls services class."""
     def __init__(self, database: Database) -> None:
         self.database = database
+        ensure_indexes(database, "stalls")
 
+    @tracked
     def create_stall(self, stall: Stall, user: user_entity) -> Stall:
         """
         Create a stall.
@@ -31,6 +67,9 @@ class StallsServices():
         """
         try:
             del stall["id"]
+            stall["version"] = ChangesServices(self.database).next_version()
+            stall.update(period_fields(stall))
+            closed_periods.ensure_documents_open(self.database, [stall])
             stall["createdBy"] = user["userName"]
             stall["updatedBy"] = user["userName"]
             stall["createdAt"] = datetime.datetime.now(
@@ -39,10 +78,12 @@ class StallsServices():
                 pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
             stall = self.database.stalls.insert_one(stall)
             stall = self.database.stalls.find_one({"_id": stall.inserted_id})
+            results.invalidate_documents(self.database.name, "stalls", [stall])
             return stall
         except PyMongoError as exception:
             raise Error(f"Error creating stall: {exception}") from exception
 
+    @tracked
     def create_stalls(self, stalls: List[Stall], user: user_entity) -> List[Stall]:
         """
         Create stalls.
@@ -55,20 +96,151 @@ class StallsServices():
             Exception: If there's an error creating the stalls.
         """
         try:
+            version = ChangesServices(self.database).next_version()
             for stall in stalls:
                 del stall["id"]
+                stall["version"] = version
+                stall.update(period_fields(stall))
                 stall["createdBy"] = user["userName"]
                 stall["updatedBy"] = user["userName"]
                 stall["createdAt"] = datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
                 stall["updatedAt"] = datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+            closed_periods.ensure_documents_open(self.database, stalls)
             stalls = self.database.stalls.insert_many(stalls)
-            stalls = self.database.stalls.find({"_id": {"$in": stalls.inserted_ids}})
+            stalls = list(self.database.stalls.find({"_id": {"$in": stalls.inserted_ids}}))
+            results.invalidate_documents(self.database.name, "stalls", stalls)
             return stalls
         except PyMongoError as exception:
             raise Error(f"Error creating stalls: {exception}") from exception
 
+    @tracked
+    def rollover_stalls(
+        self,
+        company: str,
+        data: RolloverStalls,
+        user: user_entity,
+        progress: Callable[[dict], None] = None) -> StallsAndShifts:
+        """
+        Copy the stalls of a month into another month.
+        Stalls are written in chunks of ROLLOVER_CHUNK along with their shifts, each with a
+        change version of its own, so a `progress` callback raising between chunks never
+        leaves a copied stall without them.
+        Args:
+            company (str): Company id.
+            data (RolloverStalls): Source and target months, customer and options.
+            user (user_entity): User.
+            progress (Callable[[dict], None]): Called after each chunk.
+        Returns:
+            StallsAndShifts: Created stalls and shifts.
+        Raises:
+            Exception: If there's an error copying the stalls.
+        """
+        try:
+            query = {"period": checked_period(data["fromMonth"], data["fromYear"])}
+            target = {"period": checked_period(data["toMonth"], data["toYear"])}
+            closed_periods.ensure_open(self.database, [target["period"]])
+            if data["customerId"]:
+                query["customer"] = data["customerId"]
+                target["customer"] = data["customerId"]
+            existing = self.database.stalls.find(target, {"customer": 1, "name": 1, "branch": 1})
+            existing = {(stall["customer"], stall["name"], stall["branch"]) for stall in existing}
+            days = days_in_month(data["fromMonth"], data["fromYear"])
+            now = datetime.datetime.now(
+                pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+            stalls = []
+            sources = tiers(self.database, "stalls", [data["fromMonth"]], [data["fromYear"]])
+            for stall in find_tiered(self.database, sources, query):
+                if (stall["customer"], stall["name"], stall["branch"]) in existing:
+                    continue
+                stall = dict(stall)
+                del stall["_id"]
+                stall["month"] = data["toMonth"]
+                stall["year"] = data["toYear"]
+                stall["period"] = period(data["toMonth"], data["toYear"])
+                stall["workers"] = [
+                    dict(advance_worker(worker, days), updatedBy=user["userName"], updatedAt=now)
+                    for worker in stall["workers"]]
+                stall["createdBy"] = user["userName"]
+                stall["updatedBy"] = user["userName"]
+                stall["createdAt"] = now
+                stall["updatedAt"] = now
+                stalls.append(stall)
+            changes = ChangesServices(self.database)
+            shifts = []
+            for start in range(0, len(stalls), ROLLOVER_CHUNK):
+                chunk = stalls[start:start + ROLLOVER_CHUNK]
+                # Each chunk gets its own version, released once it lands.
+                version = changes.next_version()
+                for stall in chunk:
+                    stall["version"] = version
+                self.database.stalls.insert_many(chunk)
+                results.invalidate_documents(self.database.name, "stalls", chunk)
+                if data["expandShifts"]:
+                    created = self._expand_shifts(company, chunk, data, user, now, version)
+                    results.invalidate_documents(self.database.name, "shifts", created)
+                    shifts.extend(created)
+                changes.release([version])
+                if progress:
+                    progress({
+                        "phase": "copying",
+                        "done": start + len(chunk),
+                        "total": len(stalls),
+                        "shifts": len(shifts)})
+            return {"stalls": stalls, "shifts": shifts}
+        except (PyMongoError, ArchiveError) as exception:
+            raise Error(f"Error copying stalls: {exception}") from exception
+
+    def _expand_shifts(
+        self,
+        company: str,
+        stalls: List[Stall],
+        data: RolloverStalls,
+        user: user_entity,
+        now: str,
+        version: int) -> list:
+        """Create the shifts of the target month from the stall workers sequences."""
+        days = days_in_month(data["toMonth"], data["toYear"])
+        shifts = []
+        for stall in stalls:
+            for worker in stall["workers"]:
+                steps = worker["sequence"]
+                if not steps:
+                    continue
+                for day in range(worker["jump"] + 1, days + 1):
+                    step = steps[(worker["index"] + day - 1 - worker["jump"]) % len(steps)]
+                    shifts.append({
+                        "day": str(day),
+                        "startTime": step["startTime"],
+                        "endTime": step["endTime"],
+                        "color": step["color"],
+                        "abbreviation": step.get("abbreviation", ""),
+                        "description": step.get("description", ""),
+                        "sequence": step.get("sequence", ""),
+                        "position": worker["position"],
+                        "type": data["shiftType"],
+                        "active": True,
+                        "keep": False,
+                        "worker": worker["id"],
+                        "workerName": worker["name"],
+                        "stall": str(stall["_id"]),
+                        "stallName": stall["name"],
+                        "customer": stall["customer"],
+                        "customerName": stall["customerName"],
+                        "company": company,
+                        "month": data["toMonth"],
+                        "year": data["toYear"],
+                        "period": stall["period"],
+                        "date": datetime.datetime(int(data["toYear"]), int(data["toMonth"]), day),
+                        "version": version,
+                        "createdBy": user["userName"],
+                        "updatedBy": user["userName"],
+                        "createdAt": now,
+                        "updatedAt": now,
+                    })
+        return shifts_storage(self.database).insert_shifts(shifts)
+
     def get_stall(self, stall_id: str) -> Stall:
         """
         Find a stall.
@@ -88,24 +260,28 @@ class StallsServices():
     def get_stalls(
         self,
         months: List[str],
-        years: List[str]) -> List[Stall]:
+        years: List[str],
+        start: str = None,
+        end: str = None) -> List[Stall]:
         """
         Find stalls.
         Args:
-            company (str): Company id.
             months (List[str]): Months.
             years (List[str]): Years.
-            types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
         Returns:
-            StallsAndShifts: Stalls and shifts.
+            List[Stall]: Stalls.
         Raises:
             Exception: If there's an error reading the stalls.
         """
         try:
-            result = self.database.stalls.find(
-                { "month": {"$in": months}, "year": {"$in": years}})
+            result = find_tiered(
+                self.database,
+                tiers(self.database, "stalls", months, years, start, end),
+                period_query(months, years, start, end))
             return result
-        except PyMongoError as exception:
+        except (PyMongoError, ArchiveError) as exception:
             raise Error(f"Error reading stalls: {exception}") from exception
 
     def get_customer_stalls(
@@ -114,7 +290,9 @@ class StallsServices():
         customer: str,
         months: List[str],
         years: List[str],
-        types: List[str]) -> StallsAndShifts:
+        types: List[str],
+        start: str = None,
+        end: str = None) -> StallsAndShifts:
         """
         Find stalls.
         Args:
@@ -123,23 +301,104 @@ class StallsServices():
             months (List[str]): Months.
             years (List[str]): Years.
             types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
         Returns:
             StallsAndShifts: Stalls and shifts.
         Raises:
             Exception: If there's an error reading the stalls.
         """
         try:
-            stalls = self.database.stalls.find(
-                {"customer": customer, "month": {"$in": months}, "year": {"$in": years}})
+            stalls = find_tiered(
+                self.database,
+                tiers(self.database, "stalls", months, years, start, end),
+                {"customer": customer, **period_query(months, years, start, end)})
             stalls = [dict(stall) for stall in stalls]
-            shifts = ShiftsServices(self.database).get_by_customer_and_month_and_year(
-                company, customer, months, years, types)
+            shifts = shifts_storage(self.database).get_by_customer_and_month_and_year(
+                company, customer, months, years, types, start, end)
             shifts = [dict(shift) for shift in shifts]
             result = {"stalls": stalls, "shifts": shifts}
             return result
-        except PyMongoError as exception:
+        except (PyMongoError, ArchiveError) as exception:
             raise Error(f"Error reading stalls: {exception}") from exception
 
+    def get_calendar(
+        self,
+        company: str,
+        customer: str,
+        months: List[str],
+        years: List[str],
+        types: List[str],
+        start: str = None,
+        end: str = None) -> List[dict]:
+        """
+        Find the stalls of a customer with their shifts and workers in one aggregation.
+        Args:
+            company (str): Company id.
+            customer (str): Customer id.
+            months (List[str]): Months.
+            years (List[str]): Years.
+            types (List[str]): Shift types.
+            start (str): First month (yyyy-mm) of a range, instead of months and years.
+            end (str): Last month (yyyy-mm) of a range, instead of months and years.
+        Returns:
+            List[dict]: Stalls with their `shifts` and `workerRecords`.
+        Raises:
+            Exception: If there's an error reading the stalls.
+        """
+        try:
+            buckets = bucketed(self.database)
+            shifts_match = {"company": company, "days.type": {"$in": types}} if buckets \
+                else {"type": {"$in": types}}
+            # Historical months look up the shifts of both tiers, and stalls of both tiers
+            shift_tiers = tiers(
+                self.database, "shift_buckets" if buckets else "shifts", months, years, start, end)
+            shift_fields = ["shifts"] if len(shift_tiers) == 1 else \
+                [f"shifts{index}" for index in range(len(shift_tiers))]
+            pipeline = [
+                {"$match": {"customer": customer, **period_query(months, years, start, end)}},
+                {"$addFields": {
+                    "stallId": {"$toString": "$_id"},
+                    "workerIds": {"$map": {"input": "$workers", "in": {"$convert": {
+                        "input": "$$this.id", "to": "objectId", "onError": None, "onNull": None}}}}
+                }},
+                *[{"$lookup": {
+                    "from": collection,
+                    "localField": "stallId",
+                    "foreignField": "stall",
+                    "pipeline": [{"$match": shifts_match}],
+                    "as": field
+                }} for collection, field in zip(shift_tiers, shift_fields)],
+                {"$lookup": {
+                    "from": "workers",
+                    "localField": "workerIds",
+                    "foreignField": "_id",
+                    "as": "workerRecords"
+                }},
+                {"$project": {"stallId": 0, "workerIds": 0}},
+            ]
+            stalls = list(unique(stall for collection in tiers(
+                self.database, "stalls", months, years, start, end)
+                for stall in self.database[collection].aggregate(pipeline)))
+            if len(shift_tiers) > 1:
+                for stall in stalls:
+                    stall["shifts"] = list(unique(
+                        shift for field in shift_fields for shift in stall.pop(field)))
+            if buckets:
+                for stall in stalls:
+                    stall["shifts"] = [shift for bucket in stall["shifts"]
+                                       for shift in expand_bucket(bucket, types)]
+                return stalls
+            shifts = ShiftResolver(self.database, company).resolve(
+                [shift for stall in stalls for shift in stall["shifts"]])
+            for stall in stalls:
+                count = len(stall["shifts"])
+                stall["shifts"], shifts = shifts[:count], shifts[count:]
+            return stalls
+        except (PyMongoError, ResolverError, ArchiveError) as exception:
+            raise Error(f"Error reading calendar: {exception}") from exception
+
+    @tracked
     def update_stall(self, stall_id: str, data: UpdateStall, user: user_entity) -> Stall:
         """
         Update a stall.
@@ -157,15 +416,21 @@ class StallsServices():
             if not stall:
                 raise Error("Stall not found")
             stall = dict(stall)
+            closed_periods.ensure_documents_open(self.database, [stall])
             data["updatedAt"] = datetime.datetime.now(
                 pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
             data["updatedBy"] = user["userName"]
+            data["version"] = ChangesServices(self.database).next_version()
             self.database.stalls.update_one({"_id": ObjectId(stall_id)}, {"$set": data})
+            results.invalidate_documents(self.database.name, "stalls", [stall])
+            if stall["name"] != data["name"]:
+                CascadesServices(self.database).stall_renamed(stall_id, data["name"])
             stall = self.database.stalls.find_one({"_id": ObjectId(stall_id)})
             return stall or {}
         except PyMongoError as exception:
             raise Error(f"Error updating stall: {exception}") from exception
 
+    @tracked
     def delete_stall(self, company_id: str, stall_id: str, shifts: List[str]) -> StallsAndShifts:
         """
         Delete a stall.
@@ -183,13 +448,18 @@ class StallsServices():
             if not stall:
                 raise Error("Stall not found")
             stall = dict(stall)
+            closed_periods.ensure_documents_open(self.database, [stall])
             self.database.stalls.delete_one({"_id": ObjectId(stall_id)})
-            shifts = ShiftsServices.delete_shifts(self, company_id, stall_id, shifts)
+            changes = ChangesServices(self.database)
+            changes.record_deletions("stalls", [stall], changes.next_version())
+            results.invalidate_documents(self.database.name, "stalls", [stall])
+            shifts = shifts_storage(self.database).delete_shifts(company_id, stall_id, shifts)
             return stall
         except PyMongoError as exception:
             raise Error(f"Error deleting stall: {exception}") from exception
 
     # Stall workers
+    @tracked
     def add_stall_worker(self, stall_id: str, worker: StallWorker, user: user_entity) -> Stall:
         """
         Add a stall worker.
@@ -213,13 +483,18 @@ class StallsServices():
             stall = self.database.stalls.find_one({"_id": ObjectId(stall_id)})
             if not stall:
                 raise Error("Stall not found")
+            closed_periods.ensure_documents_open(self.database, [stall])
             self.database.stalls.update_one(
-                {"_id": ObjectId(stall_id)}, {"$push": {"workers": worker}})
+                {"_id": ObjectId(stall_id)},
+                {"$push": {"workers": worker},
+                 "$set": {"version": ChangesServices(self.database).next_version()}})
+            results.invalidate_documents(self.database.name, "stalls", [stall])
             stall = self.database.stalls.find_one({"_id": ObjectId(stall_id)})
             return stall
         except PyMongoError as exception:
             raise Error(f"Error adding worker: {exception}") from exception
 
+    @tracked
     def update_stall_worker(
         self,
         stall_id: str,
@@ -239,13 +514,18 @@ class StallsServices():
             Exception: If there's an error updating the worker.
         """
         try:
+            if closed_periods.guarded(self.database):
+                stall = self.database.stalls.find_one(
+                    {"_id": ObjectId(stall_id)}, {"period": 1, "month": 1, "year": 1})
+                closed_periods.ensure_documents_open(self.database, [stall] if stall else [])
             update_data = {
                 "workers.$.sequence": data["sequence"],
                 "workers.$.index": data["index"],
                 "workers.$.jump": data["jump"],
                 "workers.$.updatedAt": datetime.datetime.now(
                     pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M"),
-                "workers.$.updatedatabasey": user["userName"]
+                "workers.$.updatedatabasey": user["userName"],
+                "version": ChangesServices(self.database).next_version()
             }
             result = self.database.stalls.update_one(
                 {"_id": ObjectId(stall_id), "workers.id": worker_id},
@@ -254,10 +534,12 @@ class StallsServices():
             if result.modified_count == 0:
                 raise Error("Worker not found")
             stall = self.database.stalls.find_one({"_id": ObjectId(stall_id)})
+            results.invalidate_documents(self.database.name, "stalls", [stall])
             return stall
         except PyMongoError as exception:
             raise Error(f"Error updating worker: {exception}") from exception
 
+    @tracked
     def remove_worker(
         self,
         company: str,
@@ -281,10 +563,41 @@ class StallsServices():
             if not stall:
                 raise Error("Stall not found")
             stall = dict(stall)
+            closed_periods.ensure_documents_open(self.database, [stall])
             self.database.stalls.update_one(
-                {"_id": ObjectId(stall_id)}, {"$pull": {"workers": {"id": worker_id}}})
+                {"_id": ObjectId(stall_id)},
+                {"$pull": {"workers": {"id": worker_id}},
+                 "$set": {"version": ChangesServices(self.database).next_version()}})
+            results.invalidate_documents(self.database.name, "stalls", [stall])
             stall = self.database.stalls.find_one({"_id": ObjectId(stall_id)})
-            shifts = ShiftsServices.delete_shifts(self, company, stall_id, shifts)
+            shifts = shifts_storage(self.database).delete_shifts(company, stall_id, shifts)
             return stall
         except PyMongoError as exception:
             raise Error(f"Error removing worker: {exception}") from exception
+
+    # Updating Model (Use carefully)
+    def update_periods(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Stamp the period of the stalls written before it existed.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Migration stats.
+        Raises:
+            Exception: If there's an error updating the stalls.
+        """
+        try:
+            return BatchMigration(
+                self.database,
+                "stalls_period",
+                "stalls",
+                period_fields,
+                query={"period": {"$exists": False}},
+                projection={"month": 1, "year": 1},
+                progress=progress).run(resume)
+        except (PyMongoError, MigrationError) as exception:
+            raise Error(f"Error updating periods: {exception}") from exception
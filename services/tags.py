@@ -1,10 +1,13 @@
 """Tags services module."""
 
+from pymongo import ReturnDocument
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson import ObjectId
 from models.company import Tag, Company
+from utils.etags import versions
 from .companies import CompaniesServices
+from .company_arrays import CompanyArraysServices, is_external, company_exists
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -28,15 +31,18 @@ class TagsServices():
         try:
             tag["id"] = str(ObjectId())
             company = CompaniesServices(self.database).get_company(company_id)
-            company = dict(company)
-            existting_tag = next(
-                (item for item in company["tags"]
-                 if item["name"] == tag["name"] and item["scope"] == tag["scope"]), None)
-            if existting_tag:
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).add("tags", tag)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id),
+                 "tags": {"$not": {"$elemMatch": {"name": tag["name"], "scope": tag["scope"]}}}},
+                {"$push": {"tags": tag}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                if not company_exists(self.database, company_id):
+                    raise Error("Company not found")
                 raise Error("Tag already exists")
-            self.database.companies.update_one({"_id": ObjectId(company_id)},
-                                               {"$push": {"tags": tag}})
-            company = CompaniesServices(self.database).get_company(company_id)
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error adding tag: {exception}") from exception
@@ -56,13 +62,19 @@ class TagsServices():
         try:
             tag["id"] = tag_id
             company = CompaniesServices(self.database).get_company(company_id)
-            company = dict(company)
-            existting_tag = next(
-                (item for item in company["tags"]
-                 if item["name"] == tag["name"] and item["scope"] == tag["scope"]), None)
-            if existting_tag:
-                raise Error("Tag already exists")
-            company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).update("tags", tag_id, tag)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id),
+                 "tags.id": tag_id,
+                 "tags": {"$not": {"$elemMatch": {
+                     "id": {"$ne": tag_id}, "name": tag["name"], "scope": tag["scope"]}}}},
+                {"$set": {"tags.$[tag]": tag}},
+                array_filters=[{"tag.id": tag_id}],
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Tag not found or already exists")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error updating tag: {exception}") from exception
@@ -79,9 +91,16 @@ class TagsServices():
             Exception: If there's an error updating the company.
         """
         try:
-            self.database.companies.update_one(
-                {"_id": ObjectId(company_id)}, {"$pull": {"tags": {"id": tag_id}}})
             company = CompaniesServices(self.database).get_company(company_id)
+            if is_external(company):
+                return CompanyArraysServices(self.database, company).delete("tags", tag_id)
+            company = self.database.companies.find_one_and_update(
+                {"_id": ObjectId(company_id)},
+                {"$pull": {"tags": {"id": tag_id}}},
+                return_document=ReturnDocument.AFTER)
+            if not company:
+                raise Error("Company not found")
+            versions.bump("company", company_id)
             return company
         except PyMongoError as exception:
             raise Error(f"Error deleting tag: {exception}") from exception
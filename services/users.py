@@ -4,11 +4,13 @@ from typing import List
 from pymongo.database import Database
 from pymongo.errors import PyMongoError
 from bson import ObjectId
+from pymongo import ReturnDocument
 from services.companies import CompaniesServices
 from models.user import UpdateUser, User
 from models.user import Profile
 from schemas.company import company_entity
 from utils.auth import create_access_token, get_hashed_password, verify_password
+from utils.etags import versions
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -104,7 +106,8 @@ class UsersServices():
         """
         try:
             user = self.authenticate_user(email, password)
-            token = create_access_token(data={"sub": user["email"], "roles": user["roles"]})
+            token = create_access_token(
+                data={"sub": user["email"], "roles": user["roles"], "company": user["company"]})
             return {"access_token": token, "token_type": "bearer"}
         except PyMongoError as exception:
             raise Error(f"Error reading user: {exception}") from exception
@@ -121,7 +124,7 @@ class UsersServices():
         """
         try:
             user = self.get_by_email(email)
-            company = CompaniesServices(self.database).get_company(user["company"])
+            company = CompaniesServices(self.database).get_company_with_arrays(user["company"])
             user["company"] = company_entity(company)
             return user
         except PyMongoError as exception:
@@ -154,8 +157,13 @@ class UsersServices():
             errors["Update error"]: If the user could not be updated.
         """
         try:
-            self.database.users.update_one({"_id": ObjectId(user_id)}, {"$set": user})
+            previous = self.database.users.find_one_and_update(
+                {"_id": ObjectId(user_id)}, {"$set": user}, return_document=ReturnDocument.BEFORE)
+            if previous:
+                versions.bump("user", previous["email"])
             updated_user = self.get_user(user_id)
+            if updated_user:
+                versions.bump("user", updated_user["email"])
             return updated_user
         except PyMongoError as exception:
             raise Error(f"Error updating user: {exception}") from exception
@@ -173,6 +181,8 @@ class UsersServices():
         try:
             user = self.get_user(user_id)
             self.database.users.delete_one({"_id": ObjectId(user_id)})
+            if user:
+                versions.bump("user", user["email"])
             return user
         except PyMongoError as exception:
             raise Error(f"Error deleting user: {exception}") from exception
@@ -3,6 +3,24 @@
 from typing import List
 from fastapi import WebSocket
 from models.websocket import WebsocketResponse
+from utils.metrics import registry
+
+# Events are sent by clients too, so only these become label values; the rest are "other".
+EVENTS = {
+    "company_updated", "customer_created", "customer_deleted", "customer_updated",
+    "period_closed", "period_reopened", "stall_created", "stall_deleted", "stall_updated",
+    "stalls_created", "user_created", "user_deleted", "user_updated", "worker_created",
+    "worker_deleted", "worker_updated", "job_started", "job_progress", "job_done",
+    "job_failed", "job_cancelled", "job_queued"}
+
+connections_gauge = registry.gauge("websocket_connections", "Open websocket connections.")
+broadcasts_total = registry.counter(
+    "websocket_broadcasts_total",
+    "Messages broadcast.",
+    ("event",))
+messages_total = registry.counter(
+    "websocket_messages_sent_total",
+    "Messages sent to websocket connections.")
 
 class WebSocketManager:
     """Websocket manager"""
@@ -19,14 +37,18 @@ class WebSocketManager:
         await websocket.accept()
         connection = {"websocket": websocket, "company": company}
         self.active_connections.append(connection)
+        connections_gauge.inc()
 
-    def disconnect(self, websocket: WebSocket):
+    async def disconnect(self, websocket: WebSocket):
         """
         Disconnect a websocket.
         Args:
             websocket (WebSocket): Websocket.
         """
-        self.active_connections.remove(websocket)
+        for connection in list(self.active_connections):
+            if connection["websocket"] is websocket:
+                self.active_connections.remove(connection)
+                connections_gauge.dec()
 
     async def broadcast(self, data: WebsocketResponse):
         """
@@ -34,8 +56,10 @@ class WebSocketManager:
         Args:
             data (WebsocketResponse): Websocket response.
         """
+        broadcasts_total.inc(data.event if data.event in EVENTS else "other")
         for connection in self.active_connections:
             if connection["company"] == data.company:
+                messages_total.inc()
                 await connection["websocket"].send_json(
                     dict(
                         event=data.event,
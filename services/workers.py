@@ -1,7 +1,8 @@
 """Workers services module."""
 
 import datetime
-from typing import List
+import os
+from typing import Callable, List
 import pytz
 from bson import ObjectId
 from pymongo.database import Database
@@ -9,6 +10,13 @@ from pymongo.errors import PyMongoError
 from pymongo import UpdateOne, InsertOne
 from models.worker import Worker, UpdateWorker
 from schemas.user import user_entity
+from db.indexes import ensure_indexes
+from utils.search import search_fields, search_query, after_query, encode_cursor, SEARCH_SORT
+from .cascades import CascadesServices
+from .migrations import BatchMigration, Error as MigrationError
+
+# Workers written per chunk by an import.
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "500"))
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -17,6 +25,7 @@ class WorkersServices():
     """Workers services class."""
     def __init__(self, database: Database) -> None:
         self.database = database
+        ensure_indexes(database, "workers")
 
     def create_worker(self, company: str, worker: Worker, user: user_entity) -> Worker:
         """
@@ -46,6 +55,7 @@ class WorkersServices():
             for field in worker["fields"]:
                 fields.append(dict(field))
             worker["fields"] = fields
+            worker.update(search_fields(worker["name"]))
             worker = self.database.workers.insert_one(worker)
             worker = self.database.workers.find_one({"_id": worker.inserted_id})
             return worker
@@ -56,13 +66,16 @@ class WorkersServices():
         self,
         company: str,
         workers: List[Worker],
-        user: user_entity) -> List[Worker]:
+        user: user_entity,
+        progress: Callable[[dict], None] = None) -> List[Worker]:
         """
         Create workers.
+        Workers are written in chunks of IMPORT_CHUNK, renames cascaded with each chunk.
         Args:
             company (str): Company name.
             workers (List[Worker]): Workers data.
             user (user_entity): User data.
+            progress (Callable[[dict], None]): Called after each chunk.
         Returns:
             List[Worker]: Workers created.
         Raises:
@@ -72,31 +85,46 @@ class WorkersServices():
             existing_workers = self.database.workers.find({})
             existing_workers = [dict(worker) for worker in existing_workers]
             existing_identifications = [worker["identification"] for worker in existing_workers]
-            create_operations = []
-            update_operations = []
-            for worker in workers:
-                del worker["id"]
-                worker["company"] = company
-                fields = []
-                for field in worker["fields"]:
-                    fields.append(dict(field))
-                if worker["identification"] in existing_identifications:
-                    update_operations.append(UpdateOne(
-                        {"identification": worker["identification"]},
-                        {"$set": dict(worker)}))
-                else:
-                    worker["userName"] = user["userName"]
-                    worker["updatedBy"] = user["userName"]
-                    worker["createdAt"] = datetime.datetime.now(
-                        pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-                    worker["updatedAt"] = datetime.datetime.now(
-                        pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
-                    worker["fields"] = fields
-                    create_operations.append(InsertOne(dict(worker)))
-            if create_operations:
-                self.database.workers.bulk_write(create_operations)
-            if update_operations:
-                self.database.workers.bulk_write(update_operations)
+            existing_by_identification = {
+                worker["identification"]: worker for worker in existing_workers}
+            for start in range(0, len(workers), IMPORT_CHUNK):
+                create_operations = []
+                update_operations = []
+                renamed = []
+                for worker in workers[start:start + IMPORT_CHUNK]:
+                    del worker["id"]
+                    worker["company"] = company
+                    worker.update(search_fields(worker["name"]))
+                    fields = []
+                    for field in worker["fields"]:
+                        fields.append(dict(field))
+                    if worker["identification"] in existing_by_identification:
+                        existing = existing_by_identification[worker["identification"]]
+                        if existing["name"] != worker["name"]:
+                            renamed.append((str(existing["_id"]), worker["name"]))
+                        update_operations.append(UpdateOne(
+                            {"identification": worker["identification"]},
+                            {"$set": dict(worker)}))
+                    else:
+                        worker["userName"] = user["userName"]
+                        worker["updatedBy"] = user["userName"]
+                        worker["createdAt"] = datetime.datetime.now(
+                            pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+                        worker["updatedAt"] = datetime.datetime.now(
+                            pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
+                        worker["fields"] = fields
+                        create_operations.append(InsertOne(dict(worker)))
+                if create_operations:
+                    self.database.workers.bulk_write(create_operations)
+                if update_operations:
+                    self.database.workers.bulk_write(update_operations)
+                for worker_id, name in renamed:
+                    CascadesServices(self.database).worker_renamed(worker_id, name)
+                if progress:
+                    progress({
+                        "phase": "importing",
+                        "done": min(start + IMPORT_CHUNK, len(workers)),
+                        "total": len(workers)})
             workers = self.database.workers.find(
                 {"identification": {"$in": existing_identifications}})
             return workers
@@ -135,6 +163,7 @@ class WorkersServices():
                 for field in worker["fields"]:
                     fields.append(dict(field))
                 worker["fields"] = fields
+                worker.update(search_fields(worker["name"]))
             workers = self.database.workers.insert_many(workers)
             workers = self.database.workers.find({"_id": {"$in": workers.inserted_ids}})
             return workers
@@ -184,22 +213,50 @@ class WorkersServices():
             Error: Error reading workers.
         """
         try:
-            if "all" in user_tags:
-                workers = self.database.workers.find(
-                    {"company": company, "$or": [
-                        {"name": {"$regex": search, "$options": "i"}},
-                        {"identification":
-                            {"$regex": search, "$options": "i"}}]}).limit(limit).skip(skip)
-                return workers
-            workers = self.database.workers.find(
-                {"company": company, "tags": {"$in": user_tags}, "$or": [
-                    {"name": {"$regex": search, "$options": "i"}},
-                    {"identification":
-                        {"$regex": search, "$options": "i"}}]}).limit(limit).skip(skip)
+            query = self._search_query(company, search, user_tags)
+            workers = self.database.workers.find(query).sort(SEARCH_SORT).skip(skip).limit(limit)
             return workers
         except PyMongoError as exception:
             raise Error(f"Error reading workers: {exception}") from exception
 
+    def search_workers(
+        self,
+        company: str,
+        search: str,
+        limit: int,
+        after: str,
+        user_tags: list) -> dict:
+        """
+        Search workers by name or identification with keyset pagination.
+        Args:
+            company (str): Company name.
+            search (str): Search text.
+            limit (int): Limit.
+            after (str): Cursor returned by the previous page.
+            user_tags (list): User tags.
+        Returns:
+            dict: Workers data and the cursor of the next page.
+        Raises:
+            Error: Error reading workers.
+        """
+        try:
+            query = self._search_query(company, search, user_tags)
+            after = after_query(after)
+            if after:
+                query = {"$and": [query, after]}
+            workers = list(self.database.workers.find(query).sort(SEARCH_SORT).limit(limit))
+            cursor = encode_cursor(workers[-1]) if len(workers) == limit else None
+            return {"workers": workers, "next": cursor}
+        except PyMongoError as exception:
+            raise Error(f"Error reading workers: {exception}") from exception
+
+    def _search_query(self, company: str, search: str, user_tags: list) -> dict:
+        """Query of the workers visible to the user that match a search."""
+        query = {"company": company, **search_query(search)}
+        if "all" not in user_tags:
+            query["tags"] = {"$in": user_tags}
+        return query
+
     def get_workers_by_an_array(self, company: str, worker_ids: List[str]) -> List[Worker]:
         """
         Find workers by an array.
@@ -255,7 +312,10 @@ class WorkersServices():
             data["updatedAt"] = datetime.datetime.now(
                 pytz.timezone("America/Bogota")).strftime("%d/%m/%Y %H:%M")
             data["updatedBy"] = user["userName"]
+            data.update(search_fields(data["name"]))
             self.database.workers.update_one({"_id": ObjectId(worker_id)}, {"$set": data})
+            if worker["name"] != data["name"]:
+                CascadesServices(self.database).worker_renamed(worker_id, data["name"])
             worker = self.database.workers.find_one({"_id": ObjectId(worker_id)})
             return worker
         except PyMongoError as exception:
@@ -287,3 +347,33 @@ class WorkersServices():
             return worker
         except PyMongoError as exception:
             raise Error(f"Error deleting worker: {exception}") from exception
+
+    def update_search_model(
+        self,
+        resume: bool = True,
+        progress: Callable[[dict], None] = None) -> dict:
+        """
+        Backfill the search fields of the workers.
+        Args:
+            resume (bool): Continue from the last checkpoint of an unfinished run.
+            progress (Callable[[dict], None]): Called with the stats after every batch.
+        Returns:
+            dict: Migration stats.
+        Raises:
+            Error: Error updating the model.
+        """
+        def refresh(worker: dict) -> dict:
+            fields = search_fields(worker["name"])
+            if all(worker.get(key) == value for key, value in fields.items()):
+                return {}
+            return fields
+        try:
+            return BatchMigration(
+                self.database,
+                "workers_search",
+                "workers",
+                refresh,
+                projection={"name": 1, "searchName": 1, "searchTokens": 1},
+                progress=progress).run(resume)
+        except MigrationError as exception:
+            raise Error(f"Error updating model: {exception}") from exception
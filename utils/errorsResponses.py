@@ -9,5 +9,6 @@ errors = {
     "Read error": HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Read error"),
     "Update error": HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Update error"),
     "Deletion error": HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Deletion error"),
+    "Invalid cursor": HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"),
     "Deactivation error": HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Deactivation error"),
 }
\ No newline at end of file
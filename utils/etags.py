@@ -0,0 +1,64 @@
+"""Per-tenant versions and ETags for conditional GETs."""
+
+import hashlib
+import threading
+import uuid
+from typing import Dict
+from fastapi import Request, Response
+
+class Versions():
+    """
+    Version counters bumped by every mutation of a scope ("company", "customers", "user").
+    The epoch is unique per process start, so ETags issued before a restart never match.
+    """
+    def __init__(self) -> None:
+        self.epoch = uuid.uuid4().hex[:12]
+        self.values: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, key: str) -> int:
+        """Get the version of a scope."""
+        return self.values.get((scope, key), 0)
+
+    def bump(self, scope: str, key: str) -> None:
+        """Bump the version of a scope."""
+        with self._lock:
+            self.values[(scope, key)] = self.values.get((scope, key), 0) + 1
+
+    def etag(self, identity: str, *scopes: tuple) -> str:
+        """
+        Strong ETag of the current versions of some scopes. The identity names whose view of
+        them the response is, since the same versions give different bodies to each user.
+        """
+        parts = [f"{scope}.{self.get(scope, key)}" for scope, key in scopes]
+        return f'"{self.epoch}-{identity}-{"-".join(parts)}"'
+
+versions = Versions()
+
+# Company of each user email, so an ETag can be computed before reading MongoDB.
+tenants: Dict[str, str] = {}
+
+def tenant_etag(email: str, *scopes: str) -> str:
+    """ETag of some company scopes plus the user scope, or None if the company is unknown."""
+    company = tenants.get(email)
+    if company is None:
+        return None
+    identity = f"{company}-{hashlib.sha1(email.encode()).hexdigest()[:16]}"
+    return versions.etag(identity, *[(scope, company) for scope in scopes], ("user", email))
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """Check if the If-None-Match header of a request matches an ETag."""
+    header = request.headers.get("if-none-match")
+    if not etag or not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+def not_modified(etag: str) -> Response:
+    """304 response for a fresh ETag."""
+    return Response(status_code=304, headers=etag_headers(etag))
+
+def etag_headers(etag: str) -> dict:
+    """Headers of a response with an ETag."""
+    if not etag:
+        return {}
+    return {"ETag": etag, "Cache-Control": "no-cache"}
@@ -0,0 +1,153 @@
+"""In-process metrics."""
+
+import bisect
+import threading
+from typing import Dict, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Counter():
+    """Monotonic counter split by label values."""
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increment the counter."""
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        """Get the counter value."""
+        return self.values.get(label_values, 0)
+
+class Gauge():
+    """Value that goes up and down, split by label values."""
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Increment the gauge."""
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        """Decrement the gauge."""
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float) -> None:
+        """Set the gauge."""
+        with self._lock:
+            self.values[label_values] = value
+
+    def get(self, *label_values: str) -> float:
+        """Get the gauge value."""
+        return self.values.get(label_values, 0)
+
+class Histogram():
+    """Bucketed histogram split by label values."""
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record an observation."""
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = {"buckets": [0] * len(self.buckets), "sum": 0, "count": 0}
+                self.values[label_values] = series
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    """Prometheus label set."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    """Prometheus sample value."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Registry():
+    """Registry of the process metrics."""
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def gauge(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        """Get or create a gauge."""
+        if name not in self.metrics:
+            self.metrics[name] = Gauge(name, description, labels)
+        return self.metrics[name]
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        """Get or create a counter."""
+        if name not in self.metrics:
+            self.metrics[name] = Counter(name, description, labels)
+        return self.metrics[name]
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, description, labels, buckets)
+        return self.metrics[name]
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(metric)]
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {kind}")
+            with metric._lock:
+                values = dict(metric.values)
+                if kind == "histogram":
+                    values = {key: {**series, "buckets": list(series["buckets"])}
+                              for key, series in values.items()}
+            for label_values, value in sorted(values.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(metric.labels, label_values)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value["buckets"]):
+                    cumulative += count
+                    bucket = _labels(metric.labels, label_values, f'le="{_number(bound)}"')
+                    lines.append(f"{name}_bucket{bucket} {cumulative}")
+                bucket = _labels(metric.labels, label_values, 'le="+Inf"')
+                lines.append(f"{name}_bucket{bucket} {value['count']}")
+                series = _labels(metric.labels, label_values)
+                lines.append(f"{name}_sum{series} {_number(value['sum'])}")
+                lines.append(f"{name}_count{series} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
@@ -0,0 +1,100 @@
+"""Integer periods (yyyymm) and dates of shifts and stalls."""
+
+import datetime
+import os
+from typing import List, Union
+
+# Also match shifts and stalls without a period by their month and year, until the
+# shifts_period and stalls_period migrations have run on every tenant.
+LEGACY_PERIODS = os.getenv("LEGACY_PERIODS", "1") != "0"
+
+class InvalidPeriod(ValueError):
+    """Month or period that doesn't exist."""
+
+def period(month: Union[str, int], year: Union[str, int]) -> int:
+    """Sortable period of a month, e.g. 202401."""
+    return int(year) * 100 + int(month)
+
+def checked_period(month: Union[str, int], year: Union[str, int]) -> int:
+    """Period of a month given by a client, rejecting months that don't exist."""
+    try:
+        value = period(month, year)
+    except (TypeError, ValueError) as exception:
+        raise InvalidPeriod(f"Invalid month {month}/{year}") from exception
+    if not 1 <= value % 100 <= 12 or value < 100:
+        raise InvalidPeriod(f"Invalid month {month}/{year}")
+    return value
+
+def parse_period(value: Union[str, int]) -> int:
+    """Period from `2024-01`, `202401` or 202401, rejecting periods that don't exist."""
+    if isinstance(value, int):
+        return checked_period(value % 100, value // 100)
+    year, _, month = str(value).strip().partition("-")
+    if month:
+        return checked_period(month, year)
+    if not year.isdigit():
+        raise InvalidPeriod(f"Invalid period {value}")
+    return checked_period(int(year) % 100, int(year) // 100)
+
+def shift_date(day: Union[str, int], month: Union[str, int], year: Union[str, int]):
+    """Date of a shift, or None if the day doesn't exist."""
+    try:
+        return datetime.datetime(int(year), int(month), int(day))
+    except (TypeError, ValueError):
+        return None
+
+def period_fields(document: dict) -> dict:
+    """Period, plus the date for documents with a day, of a shift or stall."""
+    fields = {"period": period(document["month"], document["year"])}
+    if "day" in document:
+        fields["date"] = shift_date(document["day"], document["month"], document["year"])
+    return fields
+
+def document_period(document: dict) -> int:
+    """Period of a shift or stall, or None if it has neither period nor month and year."""
+    if document.get("period") is not None:
+        return document["period"]
+    if document.get("month") and document.get("year"):
+        return period(document["month"], document["year"])
+    return None
+
+def periods_of(months: List[str], years: List[str]) -> List[int]:
+    """Periods of every month of every year."""
+    return sorted({checked_period(month, year) for month in months for year in years})
+
+def period_query(
+    months: List[str] = None,
+    years: List[str] = None,
+    start: Union[str, int] = None,
+    end: Union[str, int] = None) -> dict:
+    """
+    Filter on the period field.
+    A `start`/`end` range selects exactly the months in between. Without it the months
+    and years lists are crossed, as the previous month × year filters did. With
+    LEGACY_PERIODS, documents not stamped with a period yet match by month and year.
+    """
+    if start is not None or end is not None:
+        bounds = {}
+        if start is not None:
+            bounds["$gte"] = parse_period(start)
+        if end is not None:
+            bounds["$lte"] = parse_period(end)
+        query = {"period": bounds}
+        if not LEGACY_PERIODS:
+            return query
+        legacy = {"$add": [
+            {"$multiply": [{"$convert": {"input": "$year", "to": "int", "onError": 0}}, 100]},
+            {"$convert": {"input": "$month", "to": "int", "onError": 0}}]}
+        return {"$or": [query, {
+            "period": {"$exists": False},
+            "$expr": {"$and": [
+                {operator: [legacy, value]} for operator, value in bounds.items()]},
+        }]}
+    query = {"period": {"$in": periods_of(months or [], years or [])}}
+    if not LEGACY_PERIODS:
+        return query
+    return {"$or": [query, {
+        "period": {"$exists": False},
+        "month": {"$in": months or []},
+        "year": {"$in": years or []},
+    }]}
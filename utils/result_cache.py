@@ -0,0 +1,155 @@
+"""Cache of the serialized month reads of every tenant."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Tuple, Union
+from utils.metrics import registry
+from utils.periods import document_period, parse_period, periods_of
+
+cache_requests = registry.counter(
+    "result_cache_requests_total", "Month read cache lookups.", ("kinds", "result"))
+cache_evictions = registry.counter(
+    "result_cache_evictions_total",
+    "Month reads dropped from the cache, by reason.",
+    ("reason",))
+cache_bytes = registry.gauge("result_cache_bytes", "Bytes of month reads in the cache.")
+
+# Periods of a read: a set for months × years, or (start, end) bounds where None is open.
+Periods = Union[frozenset, Tuple[int, int]]
+
+class ResultKey(NamedTuple):
+    """What a cached read depends on."""
+    tenant: str
+    kinds: Tuple[str, ...]
+    periods: Periods
+    customer: str = None
+    types: Tuple[str, ...] = None
+
+def read_periods(months: list, years: list, start: str = None, end: str = None) -> Periods:
+    """Periods a read selects, with the same rules as `period_query`."""
+    if start is not None or end is not None:
+        return (
+            parse_period(start) if start is not None else None,
+            parse_period(end) if end is not None else None)
+    return frozenset(periods_of(months or [], years or []))
+
+def covers(periods: Periods, changed: Iterable[int]) -> bool:
+    """Check if a read selects any of some periods."""
+    if isinstance(periods, frozenset):
+        return not periods.isdisjoint(changed)
+    start, end = periods
+    return any((start is None or start <= value) and (end is None or value <= end)
+               for value in changed)
+
+def single_period(periods: Periods) -> int:
+    """The only period a read selects, or None."""
+    if isinstance(periods, frozenset):
+        return next(iter(periods)) if len(periods) == 1 else None
+    start, end = periods
+    return start if start is not None and start == end else None
+
+class ResultCache():
+    """
+    LRU of serialized reads, bounded in bytes and expiring after `ttl`.
+    Writes drop the reads of the periods and customers they touch. A read that ran while
+    its tenant was invalidated is not stored, so a slow read never caches what a write
+    already replaced. The TTL bounds how stale a write from another process can leave it.
+    """
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries: "OrderedDict[ResultKey, tuple]" = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: ResultKey) -> bytes:
+        """Get a cached read, or None."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(key, "expired")
+                entry = None
+            if entry is None:
+                cache_requests.inc("+".join(key.kinds), "miss")
+                return None
+            self.entries.move_to_end(key)
+        cache_requests.inc("+".join(key.kinds), "hit")
+        return entry[0]
+
+    def load(self, key: ResultKey, function: Callable[..., bytes], *args) -> bytes:
+        """Run a read and cache its result, unless its tenant changed meanwhile."""
+        generation = self.generations.get(key.tenant, 0)
+        body = function(*args)
+        # A single read never takes more than a quarter of the cache.
+        if len(body) > self.max_bytes // 4:
+            return body
+        with self._lock:
+            if self.generations.get(key.tenant, 0) != generation:
+                return body
+            if key in self.entries:
+                self._drop(key, "replaced")
+            self.entries[key] = (body, time.monotonic() + self.ttl)
+            self.size += len(body)
+            cache_bytes.inc(amount=len(body))
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)), "size")
+        return body
+
+    def invalidate(
+        self,
+        tenant: str,
+        kind: str,
+        periods: Iterable[int] = None,
+        customers: Iterable[str] = None) -> None:
+        """
+        Drop the reads of a tenant that depend on a collection.
+        Args:
+            tenant (str): Tenant database name.
+            kind (str): Written collection, "shifts" or "stalls".
+            periods (Iterable[int]): Written periods, or None for all of them.
+            customers (Iterable[str]): Written customers, or None for all of them.
+        """
+        periods = None if periods is None else set(periods)
+        customers = None if customers is None else set(customers)
+        with self._lock:
+            self.generations[tenant] = self.generations.get(tenant, 0) + 1
+            for key in [key for key in self.entries if key.tenant == tenant
+                        and kind in key.kinds
+                        and (periods is None or covers(key.periods, periods))
+                        and (customers is None or key.customer is None
+                             or key.customer in customers)]:
+                self._drop(key, "invalidated")
+
+    def invalidate_documents(self, tenant: str, kind: str, documents: Iterable[dict]) -> None:
+        """Drop the reads of the periods and customers of some written documents."""
+        periods, customers = set(), set()
+        for document in documents:
+            value = document_period(document)
+            if value is None:
+                periods = None
+                break
+            periods.add(value)
+            customers.add(document.get("customer"))
+        if periods is None or None in customers:
+            self.invalidate(tenant, kind)
+        elif periods:
+            self.invalidate(tenant, kind, periods, customers)
+
+    def invalidate_tenant(self, tenant: str) -> None:
+        """Drop every read of a tenant, after cascades and migrations."""
+        self.invalidate(tenant, "shifts")
+        self.invalidate(tenant, "stalls")
+
+    def _drop(self, key: ResultKey, reason: str) -> None:
+        """Remove an entry. The lock must be held."""
+        body, _ = self.entries.pop(key)
+        self.size -= len(body)
+        cache_bytes.dec(amount=len(body))
+        cache_evictions.inc(reason)
+
+results = ResultCache(
+    int(os.getenv("RESULT_CACHE_BYTES", str(64 * 1024 * 1024))),
+    float(os.getenv("RESULT_CACHE_TTL", "300")))
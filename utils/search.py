@@ -0,0 +1,62 @@
+"""Search helpers: accent-folded tokens and keyset cursors."""
+
+import base64
+import binascii
+import json
+import re
+import unicodedata
+from typing import List
+from bson import ObjectId
+from bson.errors import InvalidId
+from .errorsResponses import errors
+
+def normalize(text: str) -> str:
+    """Lowercase a text, fold its accents and collapse its whitespace."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+def tokens(text: str) -> List[str]:
+    """Distinct normalized words of a text."""
+    return list(dict.fromkeys(normalize(text).split()))
+
+def search_fields(name: str) -> dict:
+    """Fields stored on a document to search it by name."""
+    return {"searchName": normalize(name), "searchTokens": tokens(name)}
+
+def search_query(search: str) -> dict:
+    """
+    Query matching documents whose name words start with every searched word, or whose
+    identification starts with the searched text. Both are anchored, so they use indexes.
+    """
+    clauses = []
+    words = tokens(search)
+    if words:
+        clauses.append(
+            {"searchTokens": {"$all": [re.compile("^" + re.escape(word)) for word in words]}})
+    identification = (search or "").strip()
+    if identification:
+        clauses.append({"identification": {"$regex": "^" + re.escape(identification)}})
+    return {"$or": clauses} if clauses else {}
+
+def encode_cursor(document: dict) -> str:
+    """Cursor pointing after a document in (searchName, _id) order."""
+    value = json.dumps([document.get("searchName", ""), str(document["_id"])])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def after_query(cursor: str) -> dict:
+    """Query matching the documents after a cursor in (searchName, _id) order."""
+    if not cursor:
+        return {}
+    try:
+        name, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(name, str):
+            raise ValueError(name)
+        document_id = ObjectId(document_id)
+    except (binascii.Error, ValueError, TypeError, InvalidId) as exception:
+        raise errors["Invalid cursor"] from exception
+    return {"$or": [
+        {"searchName": {"$gt": name}},
+        {"searchName": name, "_id": {"$gt": document_id}}]}
+
+SEARCH_SORT = [("searchName", 1), ("_id", 1)]
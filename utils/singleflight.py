@@ -0,0 +1,40 @@
+"""Coalescing of identical concurrent reads."""
+
+import asyncio
+import json
+from typing import Any, Callable, Dict, Hashable
+from starlette.concurrency import run_in_threadpool
+from utils.metrics import registry
+
+flight_requests = registry.counter(
+    "singleflight_requests_total",
+    "Reads that ran a query (leader) or shared the one in flight (coalesced).",
+    ("flight", "role"))
+
+def serialize(content: Any) -> bytes:
+    """Serialize a response body as JSONResponse does."""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+class SingleFlight():
+    """
+    Share one in-flight call among concurrent callers with the same key.
+    The call runs in the threadpool as its own task, so the other callers still get its
+    result if the caller that started it disconnects.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, function: Callable[..., Any], *args) -> Any:
+        """Run `function(*args)`, or wait for the identical call already running."""
+        call = self.calls.get(key)
+        if call is None:
+            flight_requests.inc(self.name, "leader")
+            call = asyncio.ensure_future(run_in_threadpool(function, *args))
+            self.calls[key] = call
+            call.add_done_callback(lambda _: self.calls.pop(key, None))
+        else:
+            flight_requests.inc(self.name, "coalesced")
+        return await asyncio.shield(call)
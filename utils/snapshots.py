@@ -0,0 +1,30 @@
+"""Responses served from closed period snapshots."""
+
+import gzip
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from utils.etags import etag_headers, is_fresh, not_modified
+
+def accepts_gzip(request: Request) -> bool:
+    """Check if a request accepts gzip bodies."""
+    for part in request.headers.get("accept-encoding", "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+def snapshot_response(request: Request, path: str, snapshot: dict) -> Response:
+    """
+    Serve a gzip snapshot as it is stored, or decompressed for clients without gzip.
+    Its ETag is the SHA-256 of the body, so a client revalidating it gets a 304.
+    """
+    etag = f'"{snapshot["sha256"]}"'
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    headers = dict(etag_headers(etag), Vary="Accept-Encoding")
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(path, media_type="application/json", headers=headers)
+    with open(path, "rb") as file:
+        body = gzip.decompress(file.read())
+    return Response(content=body, media_type="application/json", headers=headers)